@@ -0,0 +1,43 @@
+"""Lexer scaling benchmark.
+
+Run with ``python -m benchmarks.lexer``. Lexes generated rules from 1 KB up to
+1 MB and prints the time per input byte, which stays flat if lexing is linear.
+"""
+
+import time
+
+from filterrules.lexer import lex
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+UNIT = b"(ip_asn == 1234 || country != 'US' || fn(\"\\x41\", 1.5)) && "
+
+
+def generate(size: int) -> bytes:
+    return (UNIT * (size // len(UNIT) + 1))[:size]
+
+
+def measure(code: bytes, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in lex(code):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    baseline: float | None = None
+    for size in SIZES:
+        elapsed = measure(generate(size))
+        per_byte = elapsed / size * 1e9
+        if baseline is None:
+            baseline = per_byte
+        print(
+            f"{size:>9} bytes  {elapsed * 1e3:9.2f} ms  {per_byte:7.1f} ns/byte  "
+            f"x{per_byte / baseline:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Parser scaling benchmark.
+
+Run with ``python -m benchmarks.parser``. Parses rules with a growing number
+of terms and prints the time per term, which stays flat if parsing is linear.
+"""
+
+import time
+
+from filterrules.parser import parse
+
+TERMS = (10, 100, 1_000, 10_000, 50_000)
+
+
+def generate(terms: int) -> bytes:
+    return b" || ".join(
+        b"ip == '10.0.%d.%d'" % divmod(i % 65536, 256) for i in range(terms)
+    )
+
+
+def measure(code: bytes, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    baseline: float | None = None
+    for terms in TERMS:
+        elapsed = measure(generate(terms))
+        per_term = elapsed / terms * 1e9
+        if baseline is None:
+            baseline = per_term
+        print(
+            f"{terms:>9} terms  {elapsed * 1e3:9.2f} ms  {per_term:8.1f} ns/term  "
+            f"x{per_term / baseline:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
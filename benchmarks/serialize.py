@@ -0,0 +1,37 @@
+"""Loading benchmark of serialized rules.
+
+Run with ``python -m benchmarks.serialize``. Prints the time to parse a few
+typical rules from source and to load them from their binary dump.
+"""
+
+import timeit
+import typing
+
+from filterrules.parser import parse
+from filterrules.serialize import dump, load
+
+RULES = (
+    b"bot_score > 90",
+    b"(ip == 'a' || asn == 1234 || asn == 5678) && country != 'US'",
+    b"fn(path, 'x') + 3 * -x > 1.5 && !(method == 'GET' || method == 'HEAD')",
+)
+
+
+def measure(fn: typing.Callable[[], typing.Any], number: int = 10_000) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    print(f"{'rule':<72} {'parse':>9} {'load':>9} {'size':>9}")
+    for code in RULES:
+        data = dump(parse(code))
+        parsed = measure(lambda: parse(code))
+        loaded = measure(lambda: load(data))
+        print(
+            f"{code.decode():<72} {parsed:>7.1f}us {loaded:>7.1f}us "
+            f"{len(code):>4}/{len(data):<4}"
+        )
+
+
+if __name__ == "__main__":
+    main()
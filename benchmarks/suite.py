@@ -0,0 +1,199 @@
+"""Benchmark suite for every stage of a rule, with baselines.
+
+Run with ``python -m benchmarks.suite``. Generates rule corpora of different
+shapes and sizes and prints the throughput of lexing, parsing, linting,
+evaluating, compiling and calling compiled rules. ``--save FILE`` stores the
+results as a baseline, ``--compare FILE`` compares against one and exits with
+status 1 when a benchmark got slower than ``--threshold``.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+import typing
+
+from filterrules.lexer import lex
+from filterrules.lint import lint
+from filterrules.parser import parse
+from filterrules.rule import Rule
+
+SHAPES = ("flat", "nested", "functions", "strings")
+SIZES = (10, 100, 1_000)
+STAGES = ("lex", "parse", "lint", "evaluate", "compile", "compiled")
+# the parser allows 100 levels of nesting
+NESTING = 50
+SEED = 1234
+
+VARIABLES = {f"v{index}": index for index in range(16)} | {
+    f"s{index}": b"value%d" % index for index in range(16)
+}
+LINT_VARIABLES = {key: type(value) for key, value in VARIABLES.items()}
+FUNCTIONS: dict[str, typing.Callable[..., typing.Any]] = {
+    "f0": abs,
+    "f1": lambda value, other: value * other,
+    "f2": lambda value: value[::-1],
+}
+LINT_FUNCTIONS = {
+    "f0": ((int,), int),
+    "f1": ((int, int), int),
+    "f2": ((bytes,), bytes),
+}
+
+
+def generate(shape: str, terms: int) -> bytes:
+    # the terms of flat chains never match, so that all of them are evaluated
+    rng = random.Random(f"{SEED}-{shape}-{terms}")
+    if shape == "flat":
+        return b" || ".join(
+            b"v%d == %d" % (rng.randrange(16), rng.randrange(100, 200))
+            for _ in range(terms)
+        )
+    elif shape == "nested":
+        # groups of NESTING terms, each term nests the previous ones
+        groups = []
+        for start in range(0, terms, NESTING):
+            group = b"v%d > 100" % rng.randrange(16)
+            for index in range(start + 1, min(start + NESTING, terms)):
+                term = b"v%d > %d" % (rng.randrange(16), rng.randrange(100))
+                operator = b" || " if index % 2 else b" && "
+                group = b"(" + group + operator + term + b")"
+            groups.append(group)
+        return b" || ".join(groups)
+    elif shape == "functions":
+        return b" || ".join(
+            rng.choice(
+                (
+                    b"f0(v%d - 50) == 1" % rng.randrange(16),
+                    b"f1(v%d, %d) < 0" % (rng.randrange(16), rng.randrange(10)),
+                )
+            )
+            for _ in range(terms)
+        )
+    elif shape == "strings":
+        return b" || ".join(
+            rng.choice(
+                (
+                    b"s%d == 'value%d'" % (rng.randrange(16), rng.randrange(100, 200)),
+                    b"s%d + '-' + s%d == 'x'" % (rng.randrange(16), rng.randrange(16)),
+                    b"f2(s%d) == 'x'" % rng.randrange(16),
+                )
+            )
+            for _ in range(terms)
+        )
+    raise ValueError(f"unknown shape: {shape}")
+
+
+def measure(fn: typing.Callable[[], typing.Any], budget: float) -> float:
+    # seconds per call, the best of 5 runs of about budget / 5 seconds each
+    number = 1
+    while (elapsed := timeit.timeit(fn, number=number)) < budget / 50:
+        number *= 10
+    runs = max(1, int(budget / 5 / max(elapsed, 1e-9)))
+    return min(timeit.repeat(fn, number=number * runs, repeat=5)) / (number * runs)
+
+
+def benchmark(shape: str, terms: int, budget: float) -> dict[str, float]:
+    code = generate(shape, terms)
+    expr = parse(code)
+    error = lint(expr, LINT_VARIABLES, LINT_FUNCTIONS)
+    assert error is None, error
+    rule = Rule(expr)
+    compiled = rule.compile()
+    stages: dict[str, typing.Callable[[], typing.Any]] = {
+        "lex": lambda: list(lex(code)),
+        "parse": lambda: parse(code),
+        "lint": lambda: lint(expr, LINT_VARIABLES, LINT_FUNCTIONS),
+        "evaluate": lambda: rule.evaluate(VARIABLES, FUNCTIONS),
+        "compile": lambda: rule.compile(),
+        "compiled": lambda: compiled(VARIABLES, FUNCTIONS),
+    }
+    return {stage: measure(fn, budget) for stage, fn in stages.items()}
+
+
+def run(
+    shapes: typing.Sequence[str], sizes: typing.Sequence[int], budget: float
+) -> dict[str, dict[str, float]]:
+    # seconds per call by "shape/terms" and stage
+    results = {}
+    for shape in shapes:
+        for terms in sizes:
+            name = f"{shape}/{terms}"
+            results[name] = benchmark(shape, terms, budget)
+            print_row(name, terms, results[name])
+    return results
+
+
+def print_header() -> None:
+    print(f"{'corpus':<16}" + "".join(f"{stage:>12}" for stage in STAGES))
+    print(f"{'(terms/s)':<16}")
+
+
+def print_row(name: str, terms: int, times: dict[str, float]) -> None:
+    print(f"{name:<16}" + "".join(f"{terms / times[stage]:>12.3g}" for stage in STAGES))
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> bool:
+    # prints the time relative to the baseline, returns False on regressions
+    print(f"\n{'relative time':<16}" + "".join(f"{stage:>12}" for stage in STAGES))
+    ok = True
+    for name, times in results.items():
+        if name not in baseline:
+            continue
+        row = f"{name:<16}"
+        for stage in STAGES:
+            ratio = times[stage] / baseline[name][stage]
+            slower = ratio > 1 + threshold
+            ok = ok and not slower
+            row += f"{ratio:>11.2f}" + ("!" if slower else " ")
+        print(row)
+    return ok
+
+
+def main(argv: typing.Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--shape", action="append", choices=SHAPES)
+    parser.add_argument("--size", action="append", type=int)
+    parser.add_argument(
+        "--budget", type=float, default=0.5, help="seconds per benchmark"
+    )
+    parser.add_argument("--save", metavar="FILE", help="store results as baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare to a baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown when comparing, 0.2 is 20%%",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["python"] != platform.python_version():
+            print(f"baseline was made with Python {baseline['python']}")
+
+    print_header()
+    results = run(args.shape or SHAPES, args.size or SIZES, args.budget)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {"python": platform.python_version(), "results": results},
+                file,
+                indent=2,
+            )
+    if baseline is not None:
+        return 0 if compare(results, baseline["results"], args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
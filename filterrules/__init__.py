@@ -1,5 +1,7 @@
 from .lint import lint
 from .parser import parse
 from .rule import Rule
+from .ruleset import Ruleset
+from .variables import LazyVariables
 
-__all__ = ["lint", "parse", "Rule"]
+__all__ = ["lint", "parse", "LazyVariables", "Rule", "Ruleset"]
@@ -2,7 +2,32 @@ from __future__ import annotations
 
 import typing
 
+from .networks import NetworkSet
+
 AllowedTypes = bytes | str | int | float
+BinaryOperator = typing.Literal[
+    "add",
+    "subtract",
+    "multiply",
+    "divide",
+    "modulo",
+    "pow",
+    "equals",
+    "not-equals",
+    "greater-than",
+    "greater-than-or-equals",
+    "less-than",
+    "less-than-or-equals",
+    "and",
+    "or",
+    "band",
+    "bor",
+    "bxor",
+    "lshift",
+    "rshift",
+]
+UnaryOperator = typing.Literal["not", "plus", "minus", "bnot"]
+StringOperator = typing.Literal["contains", "starts-with", "ends-with"]
 
 
 class Constant(typing.NamedTuple):
@@ -18,33 +43,21 @@ class Block(typing.NamedTuple):
 
 
 class BinaryOperation(typing.NamedTuple):
-    operator: typing.Literal[
-        "add",
-        "subtract",
-        "multiply",
-        "divide",
-        "modulo",
-        "pow",
-        "equals",
-        "not-equals",
-        "greater-than",
-        "greater-than-or-equals",
-        "less-than",
-        "less-than-or-equals",
-        "and",
-        "or",
-        "band",
-        "bor",
-        "bxor",
-        "lshift",
-        "rshift",
-    ]
+    operator: BinaryOperator
     left: ExpressionLike
     right: ExpressionLike
 
 
+class All(typing.NamedTuple):
+    values: tuple[ExpressionLike, ...]
+
+
+class Any(typing.NamedTuple):
+    values: tuple[ExpressionLike, ...]
+
+
 class UnaryOperation(typing.NamedTuple):
-    operator: typing.Literal["not", "plus", "minus", "bnot"]
+    operator: UnaryOperator
     value: ExpressionLike
 
 
@@ -53,6 +66,38 @@ class FunctionCall(typing.NamedTuple):
     arguments: tuple[ExpressionLike, ...]
 
 
+class Membership(typing.NamedTuple):
+    value: ExpressionLike
+    values: frozenset[AllowedTypes]
+
+
+class NetworkMembership(typing.NamedTuple):
+    value: ExpressionLike
+    networks: NetworkSet
+
+
+class Matches(typing.NamedTuple):
+    value: ExpressionLike
+    pattern: bytes | str
+
+
+class StringTest(typing.NamedTuple):
+    operator: StringOperator
+    value: ExpressionLike
+    needle: bytes | str
+
+
 ExpressionLike = (
-    Constant | Variable | Block | BinaryOperation | UnaryOperation | FunctionCall
+    Constant
+    | Variable
+    | Block
+    | BinaryOperation
+    | All
+    | Any
+    | UnaryOperation
+    | FunctionCall
+    | Membership
+    | NetworkMembership
+    | Matches
+    | StringTest
 )
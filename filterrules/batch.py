@@ -0,0 +1,274 @@
+import functools
+import typing
+
+import numpy as np
+import numpy.typing as npt
+
+from . import ast
+from .patterns import compile_pattern
+from .rule import _string_test
+
+Columns = typing.Mapping[str, npt.ArrayLike]
+# functions are called once with the arrays of all rows that reach the call
+BatchFunctions = dict[str, typing.Callable[..., npt.ArrayLike]]
+
+_STRING_KINDS = "SU"
+_INTEGER_KINDS = "iu"
+_INT64_MAX = 2**63 - 1
+
+
+def evaluate_batch(
+    expr: ast.ExpressionLike,
+    columns: Columns,
+    functions: BatchFunctions,
+    untrusted: bool = True,
+) -> npt.NDArray[typing.Any]:
+    arrays = {key: np.asarray(value) for key, value in columns.items()}
+    size = len(next(iter(arrays.values()))) if arrays else 1
+    ctx = BatchContext(arrays, functions, untrusted)
+    # numpy reports errors as warnings, the ones that matter are checked
+    # explicitly for the rows that are actually reached
+    with np.errstate(all="ignore"):
+        result = _evaluate(expr, ctx, np.ones(size, dtype=bool))
+    return np.broadcast_to(result, (size,)).copy()
+
+
+class BatchContext(typing.NamedTuple):
+    columns: dict[str, npt.NDArray[typing.Any]]
+    functions: BatchFunctions
+    untrusted: bool
+
+
+def _evaluate(
+    expr: ast.ExpressionLike, ctx: BatchContext, mask: npt.NDArray[np.bool_]
+) -> typing.Any:
+    # mask contains the rows that reach expr, the values of other rows are
+    # discarded later, they only must not raise errors
+    match expr:
+        case ast.Block(inner):
+            return _evaluate(inner, ctx, mask)
+
+        case ast.Constant(value):
+            return np.asarray(value)
+
+        case ast.Variable(key):
+            return ctx.columns[key]
+
+        case ast.BinaryOperation("and", _, _):
+            return _evaluate(ast.All((expr.left, expr.right)), ctx, mask)
+
+        case ast.BinaryOperation("or", _, _):
+            return _evaluate(ast.Any((expr.left, expr.right)), ctx, mask)
+
+        case ast.BinaryOperation(operator, _, _):
+            left = _evaluate(expr.left, ctx, mask)
+            right = _evaluate(expr.right, ctx, mask)
+            is_string = left.dtype.kind in _STRING_KINDS
+            if (
+                is_string
+                and right.dtype.kind not in _STRING_KINDS
+                and ctx.untrusted
+                and mask.any()
+            ):
+                raise RuntimeError(
+                    "cannot use non-string right-value on a string in untrusted mode"
+                )
+            if _overflows(operator, left, right, mask):
+                left = _exact(left, mask)
+                right = _exact(right, mask)
+
+            match operator:
+                case "add":
+                    if is_string:
+                        r: typing.Any = np.char.add(left, right)
+                        if (
+                            ctx.untrusted
+                            and r.dtype.itemsize >= 65536
+                            and _reached(np.char.str_len(r) >= 65536, mask)
+                        ):
+                            raise RuntimeError(
+                                "string longer than allowed in untrusted mode"
+                            )
+                        return r
+                    return left + right
+                case "subtract":
+                    return left - right
+                case "multiply":
+                    return left * right
+                case "divide" | "modulo":
+                    if _reached(right == 0, mask):
+                        raise ZeroDivisionError("division by zero")
+                    return left / right if operator == "divide" else left % right
+                case "pow":
+                    if ctx.untrusted and mask.any():
+                        raise RuntimeError(
+                            "pow operation (**) is disabled in untrusted mode"
+                        )
+                    return left**right
+                case "equals":
+                    return left == right
+                case "not-equals":
+                    return left != right
+                case "greater-than":
+                    return left > right
+                case "greater-than-or-equals":
+                    return left >= right
+                case "less-than":
+                    return left < right
+                case "less-than-or-equals":
+                    return left <= right
+                case "band":
+                    return left & right
+                case "bor":
+                    return left | right
+                case "bxor":
+                    return left ^ right
+                case "lshift" | "rshift":
+                    # numpy shifts by negative counts instead of raising
+                    if _reached(right < 0, mask):
+                        raise ValueError("negative shift count")
+                    if operator == "rshift":
+                        return left >> right
+                    if ctx.untrusted and _reached(right > 128, mask):
+                        raise RuntimeError("lshift operation with too big values")
+                    return left << right
+
+        case ast.All(values) | ast.Any(values):
+            # like the scalar evaluator the result is the first operand that
+            # decides the chain, later operands are only evaluated for the
+            # rows that haven't been decided yet
+            is_all = isinstance(expr, ast.All)
+            result = _evaluate(values[0], ctx, mask)
+            pending = mask & (_truthy(result) == is_all)
+            for operand in values[1:]:
+                right = _evaluate(operand, ctx, pending)
+                if (
+                    result.dtype.kind in _STRING_KINDS
+                    and right.dtype.kind not in _STRING_KINDS
+                    and ctx.untrusted
+                    and pending.any()
+                ):
+                    raise RuntimeError(
+                        "cannot use non-string right-value on a string in "
+                        "untrusted mode"
+                    )
+                if (result.dtype.kind in _STRING_KINDS) != (
+                    right.dtype.kind in _STRING_KINDS
+                ):  # numpy would convert the other values to strings
+                    result = result.astype(object)
+                    right = right.astype(object)
+                result = np.where(pending, right, result)
+                pending = pending & (_truthy(right) == is_all)
+            return result
+
+        case ast.UnaryOperation(operator, _):
+            unary = _evaluate(expr.value, ctx, mask)
+            match operator:
+                case "not":
+                    return ~_truthy(unary)
+                case "bnot":
+                    if unary.dtype == bool:  # ~True is -2 in python
+                        unary = unary.astype(int)
+                    return ~unary
+                case "plus":
+                    return +unary
+                case "minus":
+                    if _overflows("subtract", np.asarray(0), unary, mask):
+                        unary = _exact(unary, mask)
+                    return -unary
+
+        case ast.FunctionCall(name, arguments):
+            args = [_evaluate(arg, ctx, mask) for arg in arguments]
+            rows = np.flatnonzero(mask)
+            selected = [
+                np.broadcast_to(arg, mask.shape)[rows] if arg.ndim else arg
+                for arg in args
+            ]
+            returned = np.asarray(ctx.functions[name](*selected))
+            called = np.zeros(mask.shape, dtype=returned.dtype)
+            called[rows] = returned
+            return called
+
+        case ast.Membership(_, values):
+            member = _evaluate(expr.value, ctx, mask)
+            if (
+                member.dtype.kind in _STRING_KINDS
+                and not all(isinstance(item, (str, bytes)) for item in values)
+                and ctx.untrusted
+                and mask.any()
+            ):
+                raise RuntimeError(
+                    "cannot use non-string right-value on a string in untrusted mode"
+                )
+            return np.isin(member, np.array(list(values), dtype=object))
+
+        case ast.NetworkMembership(_, networks):
+            addresses = _evaluate(expr.value, ctx, mask)
+            return np.vectorize(networks.__contains__, otypes=[bool])(addresses)
+
+        case ast.Matches(_, pattern):
+            texts = _evaluate(expr.value, ctx, mask)
+            search = compile_pattern(pattern, ctx.untrusted).search
+            found = np.vectorize(lambda text: search(text) is not None, otypes=[bool])
+            return found(texts)
+
+        case ast.StringTest(operator, _, needle):
+            texts = _evaluate(expr.value, ctx, mask)
+            if texts.dtype.kind not in _STRING_KINDS:
+                test = functools.partial(_string_test, operator=operator, needle=needle)
+                return np.vectorize(test, otypes=[bool])(texts)
+            elif operator == "contains":
+                return np.char.find(texts, needle) >= 0
+            elif operator == "starts-with":
+                return np.char.startswith(texts, needle)
+            return np.char.endswith(texts, needle)
+
+    raise RuntimeError(f"unknown ast node: {expr}")
+
+
+def _truthy(value: typing.Any) -> typing.Any:
+    if value.dtype.kind in _STRING_KINDS:
+        return np.char.str_len(value) > 0
+    elif value.dtype.kind == "O":
+        return np.vectorize(bool, otypes=[bool])(value)
+    return value.astype(bool)
+
+
+def _reached(condition: typing.Any, mask: npt.NDArray[np.bool_]) -> bool:
+    return bool(np.any(condition & mask))
+
+
+def _overflows(
+    operator: ast.BinaryOperator,
+    left: typing.Any,
+    right: typing.Any,
+    mask: npt.NDArray[np.bool_],
+) -> bool:
+    # numpy integers wrap around, python's don't, true if the result of a
+    # reached row might not fit into an int64 (or a shift or power is negative)
+    if left.dtype.kind not in _INTEGER_KINDS or right.dtype.kind not in _INTEGER_KINDS:
+        return False
+    reached_left = np.broadcast_to(left, mask.shape)[mask]
+    reached_right = np.broadcast_to(right, mask.shape)[mask]
+    if not reached_left.size:
+        return False
+    a = max(int(reached_left.max()), -int(reached_left.min()))
+    b = max(int(reached_right.max()), -int(reached_right.min()))
+    match operator:
+        case "add" | "subtract":
+            return a + b > _INT64_MAX
+        case "multiply":
+            return a * b > _INT64_MAX
+        case "lshift":
+            return reached_right.min() < 0 or b >= 64 or a << b > _INT64_MAX
+        case "pow":
+            return reached_right.min() < 0 or (
+                a > 1 and (b >= 64 or a**b > _INT64_MAX)
+            )
+    return False
+
+
+def _exact(value: typing.Any, mask: npt.NDArray[np.bool_]) -> typing.Any:
+    # the values as python integers, rows that aren't reached are set to zero,
+    # so they can't create huge integers
+    return np.where(mask, value, 0).astype(object)
@@ -0,0 +1,224 @@
+import collections
+import hashlib
+import importlib.util
+import marshal
+import mmap
+import os
+import struct
+import threading
+import types
+import typing
+
+from .__about__ import __version__
+from .lint import Functions as LintFunctions
+from .lint import Variables as LintVariables
+from .lint import lint
+from .parser import parse
+from .rule import Functions, Rule, Variables, _bind_patterns, _namespace
+
+CompiledRule = typing.Callable[[Variables, Functions], typing.Any]
+_Signature = tuple[
+    tuple[tuple[str, type], ...],
+    tuple[tuple[str, tuple[tuple[type, ...], type]], ...],
+]
+_Key = tuple[bytes, bool, _Signature]
+
+# cache files consist of the magic, a header identifying the filterrules and
+# python versions and compile options, an index of (key digest, offset, length)
+# and the marshalled code objects with the patterns they bind
+_FILE_MAGIC = b"FRCACHE3"
+_LENGTH = struct.Struct("<I")
+_ENTRY = struct.Struct("<32sQI")
+
+
+class RuleCache:
+    # caches parsed, linted and compiled rules by their code, so unchanged rules
+    # don't have to be compiled again, the least recently used rules are
+    # evicted once there are more than maxsize rules
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        optimize: bool = False,
+        pure_functions: typing.Collection[str] = (),
+    ) -> None:
+        self.maxsize = maxsize
+        self.optimize = optimize
+        self.pure_functions = pure_functions
+        self.hits = 0
+        self.misses = 0
+        self._rules: collections.OrderedDict[_Key, CompiledRule] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        # rules loaded from a cache file, they are unmarshalled on first use
+        self._persisted: dict[bytes, tuple[int, int]] = {}
+        self._mmap: mmap.mmap | None = None
+
+    def get(
+        self,
+        code: bytes,
+        variables: LintVariables,
+        functions: LintFunctions,
+        untrusted: bool = True,
+    ) -> CompiledRule:
+        key = (code, untrusted, _signature(variables, functions))
+        with self._lock:
+            compiled = self._rules.get(key)
+            if compiled is not None:
+                self._rules.move_to_end(key)
+                self.hits += 1
+                return compiled
+            compiled = self._load_persisted(key)
+            if compiled is not None:
+                self._insert(key, compiled)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # compile without holding the lock, so other rules can be looked up
+        # in the meantime
+        expr = parse(code)
+        error = lint(expr, variables, functions, untrusted)
+        if error is not None:
+            raise RuntimeError(error)
+        compiled = Rule(expr, untrusted).compile(self.optimize, self.pure_functions)
+
+        with self._lock:
+            self._insert(key, compiled)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rules.clear()
+            self._persisted = {}
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = None
+            self.hits = self.misses = 0
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        # writes the cached rules and the rules from the loaded cache file that
+        # weren't used yet, the file is replaced atomically
+        with self._lock:
+            entries = {
+                _digest(key): marshal.dumps(
+                    (compiled.__code__, compiled.__globals__["__patterns"])
+                )
+                for key, compiled in self._rules.items()
+            }
+            if self._mmap is not None:
+                for digest, (offset, length) in self._persisted.items():
+                    if digest not in entries:
+                        entries[digest] = self._mmap[offset : offset + length]
+
+        header = self._header()
+        offset = (
+            len(_FILE_MAGIC)
+            + _LENGTH.size * 2
+            + len(header)
+            + _ENTRY.size * len(entries)
+        )
+        index = []
+        for digest, data in entries.items():
+            index.append(_ENTRY.pack(digest, offset, len(data)))
+            offset += len(data)
+
+        temporary = f"{os.fspath(path)}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(_FILE_MAGIC)
+            file.write(_LENGTH.pack(len(header)))
+            file.write(header)
+            file.write(_LENGTH.pack(len(entries)))
+            file.writelines(index)
+            file.writelines(entries.values())
+        os.replace(temporary, path)
+
+    def load(self, path: str | os.PathLike[str]) -> int:
+        # returns the number of rules in the cache file, files which are
+        # missing, damaged or were written by another filterrules or python
+        # version or with other compile options are ignored
+        try:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # ValueError for empty files
+            return 0
+
+        persisted = self._read_index(data)
+        if persisted is None:
+            data.close()
+            return 0
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._persisted = persisted
+            self._mmap = data
+        return len(persisted)
+
+    def _read_index(self, data: mmap.mmap) -> dict[bytes, tuple[int, int]] | None:
+        # the offset and length of every rule by digest, None if the file
+        # can't be used
+        position = len(_FILE_MAGIC)
+        if data[:position] != _FILE_MAGIC:
+            return None
+        try:
+            (length,) = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            if data[position : position + length] != self._header():
+                return None
+            position += length
+            (count,) = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            persisted = {}
+            for _ in range(count):
+                digest, offset, length = _ENTRY.unpack_from(data, position)
+                position += _ENTRY.size
+                if offset + length > len(data):
+                    return None
+                persisted[digest] = (offset, length)
+        except struct.error:
+            return None
+        return persisted
+
+    def _header(self) -> bytes:
+        return marshal.dumps(
+            (
+                __version__,
+                importlib.util.MAGIC_NUMBER,
+                self.optimize,
+                tuple(sorted(self.pure_functions)),
+            )
+        )
+
+    def _load_persisted(self, key: _Key) -> CompiledRule | None:
+        if self._mmap is None:
+            return None
+        location = self._persisted.get(_digest(key))
+        if location is None:
+            return None
+        offset, length = location
+        code, bound = marshal.loads(self._mmap[offset : offset + length])
+        namespace = _namespace(_bind_patterns(bound))
+        return typing.cast(CompiledRule, types.FunctionType(code, namespace))
+
+    def _insert(self, key: _Key, compiled: CompiledRule) -> None:
+        self._rules[key] = compiled
+        self._rules.move_to_end(key)
+        while len(self._rules) > self.maxsize:
+            self._rules.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+
+def _signature(variables: LintVariables, functions: LintFunctions) -> _Signature:
+    # the lint result depends on the declared types, so they are part of the key
+    return (
+        tuple(sorted(variables.items())),
+        tuple(sorted(functions.items())),
+    )
+
+
+def _digest(key: _Key) -> bytes:
+    code, untrusted, (variables, functions) = key
+    signature = repr((untrusted, variables, functions)).encode()
+    return hashlib.sha256(_LENGTH.pack(len(code)) + code + signature).digest()
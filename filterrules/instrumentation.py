@@ -0,0 +1,138 @@
+import time
+import typing
+
+from . import ast
+
+
+class NodeInfo(typing.NamedTuple):
+    rule: typing.Hashable
+    path: str
+    node: str
+    # operands of &&/|| (except the last) short circuit when their truthiness
+    # equals this, None for other nodes
+    short_circuits_when: bool | None
+
+
+class Profile:
+    # collects evaluation counts, truthy results and the cumulative time of the
+    # nodes of instrumented rules, see Rule.compile_instrumented()
+    def __init__(self) -> None:
+        self.nodes: list[NodeInfo] = []
+        self.roots: dict[typing.Hashable, int] = {}
+        self.counts: list[int] = []
+        self.truthy: list[int] = []
+        self.times: list[int] = []
+
+    def register(
+        self, expr: ast.ExpressionLike, rule: typing.Hashable = None
+    ) -> dict[int, int]:
+        # returns the index of every recorded node of expr by its id
+        indexes: dict[int, int] = {}
+        self._register(expr, rule, "0", None, indexes)
+        if id(expr) in indexes:
+            self.roots[rule] = indexes[id(expr)]
+        return indexes
+
+    def record(self, index: int, start: int, value: typing.Any) -> typing.Any:
+        self.times[index] += time.perf_counter_ns() - start
+        self.counts[index] += 1
+        if value:
+            self.truthy[index] += 1
+        return value
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.nodes)
+        self.truthy = [0] * len(self.nodes)
+        self.times = [0] * len(self.nodes)
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        nodes = []
+        for index, info in enumerate(self.nodes):
+            count, truthy = self.counts[index], self.truthy[index]
+            node = {
+                "rule": info.rule,
+                "path": info.path,
+                "node": info.node,
+                "count": count,
+                "truthy": truthy,
+                "time_ns": self.times[index],
+            }
+            if info.short_circuits_when is not None:
+                short_circuits = truthy if info.short_circuits_when else count - truthy
+                node["short_circuits"] = short_circuits
+            nodes.append(node)
+
+        rules = [
+            {
+                "rule": rule,
+                "count": self.counts[index],
+                "matches": self.truthy[index],
+                "time_ns": self.times[index],
+            }
+            for rule, index in self.roots.items()
+        ]
+        return {"rules": rules, "nodes": nodes}
+
+    def _register(
+        self,
+        expr: ast.ExpressionLike,
+        rule: typing.Hashable,
+        path: str,
+        short_circuits_when: bool | None,
+        indexes: dict[int, int],
+    ) -> None:
+        # constants are not recorded, blocks are recorded as their content
+        match expr:
+            case ast.Block(inner):
+                self._register(inner, rule, path, short_circuits_when, indexes)
+                return
+            case ast.Constant():
+                return
+            case ast.Variable(name):
+                node = name
+            case ast.BinaryOperation(operator, _, _):
+                node = operator
+            case ast.All() | ast.Any():
+                node = "and" if isinstance(expr, ast.All) else "or"
+            case ast.UnaryOperation(operator, _):
+                node = operator
+            case ast.FunctionCall(name, _):
+                node = f"{name}()"
+            case ast.Membership() | ast.NetworkMembership():
+                node = "in"
+            case ast.Matches():
+                node = "matches"
+            case ast.StringTest(operator, _, _):
+                node = operator
+            case _:
+                raise RuntimeError(f"unknown ast node: {expr}")
+
+        if id(expr) not in indexes:
+            indexes[id(expr)] = len(self.nodes)
+            self.nodes.append(NodeInfo(rule, path, node, short_circuits_when))
+            self.counts.append(0)
+            self.truthy.append(0)
+            self.times.append(0)
+
+        match expr:
+            case ast.BinaryOperation(operator, left, right):
+                when = {"and": False, "or": True}.get(operator)
+                self._register(left, rule, f"{path}.0", when, indexes)
+                self._register(right, rule, f"{path}.1", None, indexes)
+            case ast.All(values) | ast.Any(values):
+                when = isinstance(expr, ast.Any)
+                for index, value in enumerate(values):
+                    last = index == len(values) - 1
+                    child = f"{path}.{index}"
+                    self._register(value, rule, child, None if last else when, indexes)
+            case (
+                ast.UnaryOperation(_, value)
+                | ast.Membership(value, _)
+                | ast.NetworkMembership(value, _)
+                | ast.Matches(value, _)
+                | ast.StringTest(_, value, _)
+            ):
+                self._register(value, rule, f"{path}.0", None, indexes)
+            case ast.FunctionCall(_, arguments):
+                for index, arg in enumerate(arguments):
+                    self._register(arg, rule, f"{path}.{index}", None, indexes)
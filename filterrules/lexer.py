@@ -1,4 +1,5 @@
 import enum
+import re
 import string
 import typing
 
@@ -8,67 +9,140 @@ class Token(enum.Enum):
     STRING = enum.auto()
     SEPARATOR = enum.auto()
     OPERATOR = enum.auto()
+    KEYWORD = enum.auto()
 
 
 STRING_CHARS = (b"'", b'"')
 ESCAPED_STRINGS = {b"n": b"\n", b"r": b"\r"}
 HEX_CHARS = b"0123456789abcdef"
-SEPARATOR_CHARS = b"()[],"
+SEPARATOR_CHARS = b"()[]{},"
 OPERATOR_CHARS = b"+-*/=!<>&|^~%"
 WHITESPACE_CHARS = string.whitespace.encode()
+# words used as operators, only when they are separated by whitespace from
+# the preceding name, otherwise whitespace inside of names is stripped
+KEYWORDS = (b"in", b"matches", b"contains", b"starts_with", b"ends_with")
+
+_special = re.escape(
+    b"\\" + b"".join(STRING_CHARS) + SEPARATOR_CHARS + OPERATOR_CHARS + WHITESPACE_CHARS
+)
+# the common tokens are matched by a single precompiled regex, everything else
+# (escape sequences and strings containing them) falls back to the slow path
+_TOKENS = re.compile(
+    b"([^%s]+)" % _special
+    + b"|([%s]+)" % re.escape(WHITESPACE_CHARS)
+    + b"|([%s])" % re.escape(SEPARATOR_CHARS)
+    + b"|([%s])" % re.escape(OPERATOR_CHARS)
+    + b"|'([^'\\\\]*)'"
+    + b'|"([^"\\\\]*)"'
+)
+_STRING_RUNS = {
+    quote[0]: re.compile(b"[^%s]+" % re.escape(quote + b"\\")) for quote in STRING_CHARS
+}
+_NAME, _WHITESPACE, _SEPARATOR, _OPERATOR = 1, 2, 3, 4
 
 
 def lex(code: bytes) -> typing.Generator[tuple[Token, bytes], None, None]:
-    stream = [code[i : i + 1] for i in range(len(code))]
     buffer: list[bytes] = []
-    waiting_for_break = None
-    next_escaped = False
-    while stream and (char := stream.pop(0)):
-        if char in STRING_CHARS and not next_escaped and waiting_for_break is None:
-            if buffer:
-                yield Token.NAME, b"".join(buffer)
-                buffer.clear()
-            waiting_for_break = char
-
-        elif char in WHITESPACE_CHARS and waiting_for_break is None:  # strip whitespace
-            pass
-
-        elif (
-            char in SEPARATOR_CHARS or char in OPERATOR_CHARS
-        ) and not waiting_for_break:
-            if buffer:
-                yield Token.NAME, b"".join(buffer)
-                buffer.clear()
-
-            yield Token.SEPARATOR if char in SEPARATOR_CHARS else Token.OPERATOR, char
+    waiting_for_break: int | None = None
+    position = 0
+    end = len(code)
+    while position < end:
+        if waiting_for_break is None:
+            match = _TOKENS.match(code, position)
+            if match is not None:
+                position = match.end()
+                kind = match.lastindex
+                if kind == _NAME:
+                    word = match.group(_NAME)
+                    if (
+                        word in KEYWORDS
+                        and match.start() > 0
+                        and code[match.start() - 1] in WHITESPACE_CHARS
+                        and code[position : position + 1] != b"\\"
+                    ):
+                        if buffer:
+                            yield Token.NAME, b"".join(buffer)
+                            buffer.clear()
+                        yield Token.KEYWORD, word
+                        continue
+                    buffer.append(word)
+                    continue
+                elif kind == _WHITESPACE:  # strip whitespace
+                    continue
+                if buffer:
+                    yield Token.NAME, b"".join(buffer)
+                    buffer.clear()
+                if kind == _SEPARATOR:
+                    yield Token.SEPARATOR, match.group(_SEPARATOR)
+                elif kind == _OPERATOR:
+                    yield Token.OPERATOR, match.group(_OPERATOR)
+                else:
+                    yield Token.STRING, match.group(typing.cast(int, kind))
+                continue
 
-        elif char == b"\\" and not next_escaped:
-            next_escaped = True
-            continue
-
-        elif next_escaped and char in ESCAPED_STRINGS:
-            buffer.append(ESCAPED_STRINGS[char])
-
-        elif next_escaped and char == b"x":
-            char1 = stream.pop(0)
-            char2 = stream.pop(0)
-            if char1 not in HEX_CHARS or char2 not in HEX_CHARS:
-                raise SyntaxError("invalid hex-escape sequence")
-            buffer.append(
-                ((HEX_CHARS.index(char1) << 4) + HEX_CHARS.index(char2)).to_bytes(
-                    1, "big"
+        else:
+            match = _STRING_RUNS[waiting_for_break].match(code, position)
+            if match is not None:
+                buffer.append(match.group())
+                position = match.end()
+                continue
+
+        char = code[position : position + 1]
+        position += 1
+        if char == b"\\":
+            if position == end:
+                break
+            char = code[position : position + 1]
+            position += 1
+
+            if char in ESCAPED_STRINGS:
+                buffer.append(ESCAPED_STRINGS[char])
+
+            elif char == b"x":
+                char1 = code[position : position + 1]
+                char2 = code[position + 1 : position + 2]
+                position += 2
+                if (
+                    not char1
+                    or not char2
+                    or char1 not in HEX_CHARS
+                    or char2 not in HEX_CHARS
+                ):
+                    raise SyntaxError("invalid hex-escape sequence")
+                buffer.append(
+                    ((HEX_CHARS.index(char1) << 4) + HEX_CHARS.index(char2)).to_bytes(
+                        1, "big"
+                    )
                 )
-            )
 
-        elif char == waiting_for_break and not next_escaped:
+            elif waiting_for_break is not None or not (
+                char in WHITESPACE_CHARS
+                or char in SEPARATOR_CHARS
+                or char in OPERATOR_CHARS
+            ):
+                buffer.append(char)
+
+            elif char in WHITESPACE_CHARS:  # strip whitespace
+                pass
+
+            else:
+                if buffer:
+                    yield Token.NAME, b"".join(buffer)
+                    buffer.clear()
+                yield (
+                    Token.SEPARATOR if char in SEPARATOR_CHARS else Token.OPERATOR
+                ), char
+
+        elif waiting_for_break is not None:  # closing quote
             yield Token.STRING, b"".join(buffer)
             buffer.clear()
             waiting_for_break = None
 
-        else:
-            buffer.append(char)
-
-        next_escaped = False
+        else:  # opening quote of a string containing escape sequences
+            if buffer:
+                yield Token.NAME, b"".join(buffer)
+                buffer.clear()
+            waiting_for_break = char[0]
 
     if buffer:
         yield Token.NAME, b"".join(buffer)
@@ -1,9 +1,14 @@
 import typing
 
 from . import ast
+from .patterns import compile_pattern
 
 Variables = dict[str, type]
 Functions = dict[str, tuple[tuple[type, ...], type]]
+# estimated cost of a function call, relative to an operator
+DEFAULT_FUNCTION_COST = 10.0
+# estimated cost of a regex search
+MATCHES_COST = 5.0
 
 
 def lint(
@@ -20,13 +25,154 @@ def lint(
     return None
 
 
+class Analysis(typing.NamedTuple):
+    # when linting fails, the statistics only cover the nodes checked before
+    # the error was found
+    error: str | None
+    type: type | None
+    variables: frozenset[str]
+    functions: frozenset[str]
+    nodes: int
+    depth: int
+    cost: float
+
+
+def analyze(
+    expr: ast.ExpressionLike,
+    variables: Variables,
+    functions: Functions,
+    untrusted: bool = True,
+    function_costs: typing.Mapping[str, float] | None = None,
+) -> Analysis:
+    statistics = Statistics(function_costs or {})
+    ctx = LintContext(variables, functions, untrusted, statistics)
+    error = result = None
+    try:
+        result = _lint(expr, ctx)
+    except RuntimeError as e:
+        error = typing.cast(str, e.args[0])
+    return Analysis(
+        error,
+        result,
+        frozenset(statistics.variables),
+        frozenset(statistics.functions),
+        statistics.nodes,
+        statistics.max_depth,
+        statistics.cost,
+    )
+
+
+class Statistics:
+    __slots__ = (
+        "function_costs",
+        "variables",
+        "functions",
+        "nodes",
+        "depth",
+        "max_depth",
+        "cost",
+    )
+
+    def __init__(self, function_costs: typing.Mapping[str, float]) -> None:
+        self.function_costs = function_costs
+        self.variables: set[str] = set()
+        self.functions: set[str] = set()
+        self.nodes = self.depth = self.max_depth = 0
+        self.cost = 0.0
+
+    def enter(self, expr: ast.ExpressionLike) -> None:
+        self.nodes += 1
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.cost += self.node_cost(expr)
+        match expr:
+            case ast.Variable(key):
+                self.variables.add(key)
+            case ast.FunctionCall(name, _):
+                self.functions.add(name)
+
+    def node_cost(self, expr: ast.ExpressionLike) -> float:
+        match expr:
+            case ast.Block() | ast.Constant():
+                return 0
+            case ast.FunctionCall(name, _):
+                return self.function_costs.get(name, DEFAULT_FUNCTION_COST)
+            case ast.Matches():
+                return MATCHES_COST
+        return 1
+
+
+def estimate_cost(
+    expr: ast.ExpressionLike, function_costs: typing.Mapping[str, float] | None = None
+) -> float:
+    # the cost of evaluating every node of expr, like analyze()
+    statistics = Statistics(function_costs or {})
+    return sum(map(statistics.node_cost, _nodes(expr)))
+
+
+def _nodes(
+    expr: ast.ExpressionLike,
+) -> typing.Generator[ast.ExpressionLike, None, None]:
+    yield expr
+    match expr:
+        case ast.Block(inner):
+            yield from _nodes(inner)
+        case ast.BinaryOperation(_, left, right):
+            yield from _nodes(left)
+            yield from _nodes(right)
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            yield from _nodes(value)
+        case ast.All(values) | ast.Any(values) | ast.FunctionCall(_, values):
+            for value in values:
+                yield from _nodes(value)
+
+
+def required_variables(expr: ast.ExpressionLike) -> set[str]:
+    # names of the variables expr may read, others don't have to be provided
+    match expr:
+        case ast.Variable(key):
+            return {key}
+        case ast.Block(inner):
+            return required_variables(inner)
+        case ast.BinaryOperation(_, left, right):
+            return required_variables(left) | required_variables(right)
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            return required_variables(value)
+        case ast.All(values) | ast.Any(values) | ast.FunctionCall(_, values):
+            return set().union(*map(required_variables, values))
+    return set()
+
+
 class LintContext(typing.NamedTuple):
     variables: Variables
     functions: Functions
     untrusted: bool
+    statistics: Statistics | None = None
 
 
 def _lint(expr: ast.ExpressionLike, ctx: LintContext) -> type:
+    if ctx.statistics is None:
+        return _lint_node(expr, ctx)
+    ctx.statistics.enter(expr)
+    try:
+        return _lint_node(expr, ctx)
+    finally:
+        ctx.statistics.depth -= 1
+
+
+def _lint_node(expr: ast.ExpressionLike, ctx: LintContext) -> type:
     match expr:
         case ast.Block(inner):
             return _lint(inner, ctx)
@@ -120,6 +266,18 @@ def _lint(expr: ast.ExpressionLike, ctx: LintContext) -> type:
                         )
                     return right
 
+        case ast.All(values) | ast.Any(values):
+            operator = "and" if isinstance(expr, ast.All) else "or"
+            left = _lint(values[0], ctx)
+            for item in values[1:]:
+                right = _lint(item, ctx)
+                if left != right:
+                    raise RuntimeError(
+                        f"cannot use {operator} operator on different types: "
+                        f"{left.__name__!r} and {right.__name__!r}"
+                    )
+            return left
+
         case ast.UnaryOperation(operator, _):
             valuetype = _lint(expr.value, ctx)
             match operator:
@@ -152,4 +310,44 @@ def _lint(expr: ast.ExpressionLike, ctx: LintContext) -> type:
                 )
             return fn[1]
 
+        case ast.Membership(_, values):
+            valuetype = _lint(expr.value, ctx)
+            for itemtype in sorted({type(item) for item in values}, key=str):
+                if itemtype != valuetype and not (
+                    itemtype in (int, float) and valuetype in (int, float)
+                ):
+                    raise RuntimeError(
+                        f"cannot use in operator on different types: "
+                        f"{valuetype.__name__!r} and {itemtype.__name__!r}"
+                    )
+            return bool
+
+        case ast.NetworkMembership():
+            valuetype = _lint(expr.value, ctx)
+            if valuetype not in (bytes, str):
+                raise RuntimeError(
+                    f"cannot use in operator with networks on non-string: "
+                    f"{valuetype.__name__!r}"
+                )
+            return bool
+
+        case ast.Matches(_, pattern):
+            valuetype = _lint(expr.value, ctx)
+            if valuetype != type(pattern):
+                raise RuntimeError(
+                    f"cannot use matches operator on different types: "
+                    f"{valuetype.__name__!r} and {type(pattern).__name__!r}"
+                )
+            compile_pattern(pattern, ctx.untrusted)
+            return bool
+
+        case ast.StringTest(operator, _, needle):
+            valuetype = _lint(expr.value, ctx)
+            if valuetype != type(needle):
+                raise RuntimeError(
+                    f"cannot use {operator} operator on different types: "
+                    f"{valuetype.__name__!r} and {type(needle).__name__!r}"
+                )
+            return bool
+
     raise RuntimeError(f"unknown ast node: {expr}")
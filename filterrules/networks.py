@@ -0,0 +1,82 @@
+import ipaddress
+import socket
+import typing
+
+# addresses are mapped to integers, ipv6 addresses have bit 128 set so they
+# never share a prefix with an ipv4 address, the prefix of a network with
+# length n is its address shifted right by (32 or 128) - n bits
+_IPV6_TAG = 1 << 128
+
+
+def address_key(value: typing.Any) -> int:
+    # the integer of an ip address given as str, bytes or ipaddress object,
+    # -1 (which is never in a prefix table) if value is no ip address
+    if isinstance(value, bytes):
+        try:
+            value = value.decode("ascii")
+        except UnicodeDecodeError:
+            return -1
+    if isinstance(value, str):
+        try:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+        except (OSError, ValueError):
+            pass
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, value)
+        except (OSError, ValueError):
+            return -1
+        return _IPV6_TAG | int.from_bytes(packed, "big")
+    elif isinstance(value, ipaddress.IPv4Address):
+        return int(value)
+    elif isinstance(value, ipaddress.IPv6Address):
+        return _IPV6_TAG | int(value)
+    return -1
+
+
+class NetworkSet:
+    # a set of ip networks, stored as a prefix trie with one level per prefix
+    # length in use, every level is a set of the prefixes of that length, so
+    # a lookup needs at most one hash lookup per prefix length, no matter how
+    # many networks there are
+    __slots__ = ("networks", "levels")
+
+    def __init__(self, networks: typing.Iterable[str]) -> None:
+        parsed = sorted(
+            {ipaddress.ip_network(network, strict=False) for network in networks},
+            key=lambda network: (network.prefixlen, network.version, str(network)),
+        )
+        levels: dict[int, set[int]] = {}
+        kept: list[str] = []
+        for network in parsed:
+            key = address_key(network.network_address)
+            if any(key >> shift in prefixes for shift, prefixes in levels.items()):
+                continue  # already covered by a shorter network
+            shift = network.max_prefixlen - network.prefixlen
+            levels.setdefault(shift, set()).add(key >> shift)
+            kept.append(str(network))
+
+        # networks that were covered by others are left out
+        self.networks: tuple[str, ...] = tuple(kept)
+        # shorter prefixes first, they cover the most addresses
+        self.levels: tuple[tuple[int, frozenset[int]], ...] = tuple(
+            (shift, frozenset(prefixes))
+            for shift, prefixes in sorted(levels.items(), reverse=True)
+        )
+
+    def __contains__(self, value: typing.Any) -> bool:
+        key = address_key(value)
+        for shift, prefixes in self.levels:
+            if key >> shift in prefixes:
+                return True
+        return False
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, NetworkSet):
+            return NotImplemented
+        return self.networks == other.networks
+
+    def __hash__(self) -> int:
+        return hash(self.networks)
+
+    def __repr__(self) -> str:
+        return f"NetworkSet({self.networks!r})"
@@ -0,0 +1,351 @@
+import math
+import typing
+
+from . import ast, rule
+from .lint import estimate_cost
+
+# comparison and logic operators that always produce a bool
+_BOOLEAN_OPERATORS = {
+    "equals",
+    "not-equals",
+    "greater-than",
+    "greater-than-or-equals",
+    "less-than",
+    "less-than-or-equals",
+}
+# operators that can raise for operands of the right type, like 1 / 0,
+# 1 >> -1 or 0 ** -1
+_RAISING_OPERATORS = {"divide", "modulo", "lshift", "rshift", "pow"}
+_UNTRUSTED_RAISING_OPERATORS = {"add"}
+# runs of || operands comparing a variable with at least this many constants
+# are replaced with a single membership test
+MEMBERSHIP_THRESHOLD = 3
+# integers this big have no literal (Python's 4300 digit limit), so they are
+# left unfolded for compile() and dump()
+_MAX_INTEGER = 10**4300
+
+
+def optimize(
+    expr: ast.ExpressionLike,
+    untrusted: bool = True,
+    boolean: bool = False,
+    reorder: bool = False,
+    pure_functions: typing.Collection[str] = (),
+    function_costs: typing.Mapping[str, float] | None = None,
+    selectivity: typing.Mapping[ast.ExpressionLike, float] | None = None,
+) -> ast.ExpressionLike:
+    # boolean=True means only the truthiness of the result is used (e.g. when
+    # deciding whether a rule matches), which allows more simplifications
+    # reorder=True sorts the operands of &&/|| in boolean context, so cheap
+    # operands that likely short circuit are evaluated first, selectivity is
+    # the observed probability of (optimized) operands being true
+    # only operands that can't raise and only call pure functions are moved,
+    # assuming the rule passed lint and all variables are present
+    ctx = OptimizerContext(
+        untrusted,
+        reorder,
+        frozenset(pure_functions),
+        function_costs or {},
+        selectivity or {},
+    )
+    return _optimize(expr, ctx, boolean)
+
+
+class OptimizerContext(typing.NamedTuple):
+    untrusted: bool
+    reorder: bool = False
+    pure_functions: frozenset[str] = frozenset()
+    function_costs: typing.Mapping[str, float] = {}
+    selectivity: typing.Mapping[ast.ExpressionLike, float] = {}
+
+
+def _optimize(
+    expr: ast.ExpressionLike, ctx: OptimizerContext, boolean: bool
+) -> ast.ExpressionLike:
+    match expr:
+        case ast.Block(inner):
+            return _optimize(inner, ctx, boolean)
+
+        case ast.Constant() | ast.Variable():
+            return expr
+
+        case ast.BinaryOperation("and", left, right):
+            return _optimize(ast.All((left, right)), ctx, boolean)
+
+        case ast.BinaryOperation("or", left, right):
+            return _optimize(ast.Any((left, right)), ctx, boolean)
+
+        case ast.BinaryOperation(operator, _, _):
+            left = _optimize(expr.left, ctx, False)
+            right = _optimize(expr.right, ctx, False)
+            binary = ast.BinaryOperation(operator, left, right)
+            if (
+                isinstance(left, ast.Constant)
+                and isinstance(right, ast.Constant)
+                and not (  # don't allocate repeated strings at compile time
+                    operator == "multiply"
+                    and (
+                        isinstance(left.value, (str, bytes))
+                        or isinstance(right.value, (str, bytes))
+                    )
+                )
+            ):
+                return _fold(binary, ctx)
+            return binary
+
+        case ast.All(values) | ast.Any(values):
+            is_all = isinstance(expr, ast.All)
+            operands: list[ast.ExpressionLike] = []
+            for index, value in enumerate(values):
+                # in untrusted mode the value of an operand followed by another
+                # one is checked, so it can't become a non-boolean like !!x,
+                # reordering moves operands regardless of the check
+                checked = ctx.untrusted and not ctx.reorder
+                last = index == len(values) - 1
+                value = _optimize(value, ctx, boolean and (last or not checked))
+                if isinstance(value, ast.All) == is_all and isinstance(
+                    value, (ast.All, ast.Any)
+                ):
+                    operands.extend(value.values)
+                else:
+                    operands.append(value)
+
+            # constants that don't short circuit are skipped, unless they are
+            # the result, constants that do short circuit make all following
+            # operands unreachable
+            pruned: list[ast.ExpressionLike] = []
+            for index, value in enumerate(operands):
+                if isinstance(value, ast.Constant):
+                    if bool(value.value) != is_all:
+                        pruned.append(value)
+                        break
+                    elif (index == len(operands) - 1 and not boolean) or (
+                        ctx.untrusted and _checks_right_value(operands, index)
+                    ):
+                        pruned.append(value)
+                    continue
+                pruned.append(value)
+
+            if not pruned:  # only constants which didn't short circuit
+                return ast.Constant(is_all)
+            if not is_all:
+                pruned = _merge_comparisons(pruned)
+            if ctx.reorder and boolean:
+                pruned = _reorder(pruned, is_all, ctx)
+
+            if len(pruned) == 1:
+                return pruned[0]
+            elif is_all:
+                return ast.All(tuple(pruned))
+            return ast.Any(tuple(pruned))
+
+        case ast.UnaryOperation(operator, _):
+            value = _optimize(expr.value, ctx, operator == "not")
+            if (
+                operator == "not"
+                and isinstance(value, ast.UnaryOperation)
+                and value.operator == "not"
+                and (boolean or _is_boolean(value.value))
+            ):
+                return value.value  # double negation
+            unary = ast.UnaryOperation(operator, value)
+            if isinstance(value, ast.Constant):
+                return _fold(unary, ctx)
+            return unary
+
+        case ast.FunctionCall(name, arguments):
+            return ast.FunctionCall(
+                name, tuple(_optimize(arg, ctx, False) for arg in arguments)
+            )
+
+        case ast.Membership(_, values):
+            membership = ast.Membership(_optimize(expr.value, ctx, False), values)
+            if isinstance(membership.value, ast.Constant):
+                return _fold(membership, ctx)
+            return membership
+
+        case ast.NetworkMembership(_, networks):
+            networks_test = ast.NetworkMembership(
+                _optimize(expr.value, ctx, False), networks
+            )
+            if isinstance(networks_test.value, ast.Constant):
+                return _fold(networks_test, ctx)
+            return networks_test
+
+        case ast.Matches(_, pattern):
+            matches = ast.Matches(_optimize(expr.value, ctx, False), pattern)
+            if isinstance(matches.value, ast.Constant):
+                return _fold(matches, ctx)
+            return matches
+
+        case ast.StringTest(operator, _, needle):
+            test = ast.StringTest(operator, _optimize(expr.value, ctx, False), needle)
+            if isinstance(test.value, ast.Constant):
+                return _fold(test, ctx)
+            return test
+
+    raise RuntimeError(f"unknown ast node: {expr}")
+
+
+def _fold(expr: ast.ExpressionLike, ctx: OptimizerContext) -> ast.ExpressionLike:
+    # evaluate with the regular evaluator so untrusted limits still apply,
+    # errors that would only happen at runtime (eg ZeroDivisionError) are
+    # left for runtime, because the operation might not be reached
+    try:
+        value = rule._evaluate(expr, rule.RuleContext({}, {}, ctx.untrusted))
+    except (ArithmeticError, TypeError, ValueError):
+        return expr
+    if isinstance(value, int) and abs(value) >= _MAX_INTEGER:
+        return expr
+    return ast.Constant(value)
+
+
+def _merge_comparisons(
+    operands: list[ast.ExpressionLike],
+) -> list[ast.ExpressionLike]:
+    # replaces runs of adjacent `variable == constant` operands of || on the
+    # same variable, adjacent so that no other operand moves, the constants
+    # must all be strings or all be non-strings, so that the membership test
+    # raises in untrusted mode exactly when the comparisons would
+    merged: list[ast.ExpressionLike] = []
+    run: list[ast.ExpressionLike] = []
+    values: set[ast.AllowedTypes] = set()
+    kind: tuple[str, bool] | None = None
+
+    def flush() -> None:
+        if len(run) > 1 and len(values) >= MEMBERSHIP_THRESHOLD and kind is not None:
+            merged.append(ast.Membership(ast.Variable(kind[0]), frozenset(values)))
+        else:
+            merged.extend(run)
+        run.clear()
+        values.clear()
+
+    for operand in operands:
+        comparison = _comparison(operand)
+        if comparison is None:
+            flush()
+            merged.append(operand)
+            continue
+        name, constants = comparison
+        if (name, _is_string(constants[0])) != kind:
+            flush()
+            kind = (name, _is_string(constants[0]))
+        run.append(operand)
+        values.update(constants)
+    flush()
+    return merged
+
+
+def _comparison(
+    expr: ast.ExpressionLike,
+) -> tuple[str, tuple[ast.AllowedTypes, ...]] | None:
+    # the variable and constants of `variable == constant` or a membership
+    # test of a variable, with constants of a consistent kind
+    match expr:
+        case ast.BinaryOperation(
+            "equals", ast.Variable(name), ast.Constant(value)
+        ) | ast.BinaryOperation("equals", ast.Constant(value), ast.Variable(name)):
+            values: tuple[ast.AllowedTypes, ...] = (value,)
+        case ast.Membership(ast.Variable(name), items) if items:
+            values = tuple(items)
+        case _:
+            return None
+    if any(isinstance(value, float) and math.isnan(value) for value in values):
+        return None  # nan is not equal to itself, but it is found in a set
+    elif len({_is_string(value) for value in values}) > 1:
+        return None
+    return name, values
+
+
+def _is_string(value: ast.AllowedTypes) -> bool:
+    return isinstance(value, (str, bytes))
+
+
+def _reorder(
+    operands: list[ast.ExpressionLike], is_all: bool, ctx: OptimizerContext
+) -> list[ast.ExpressionLike]:
+    # operands are sorted by their cost divided by the probability that they
+    # short circuit, operands that can't be moved split the chain into parts
+    # which are sorted separately
+    def rank(operand: ast.ExpressionLike) -> float:
+        true = ctx.selectivity.get(operand, 0.5)
+        short_circuit = 1 - true if is_all else true
+        if short_circuit <= 0:
+            return math.inf
+        return estimate_cost(operand, ctx.function_costs) / short_circuit
+
+    reordered: list[ast.ExpressionLike] = []
+    movable: list[ast.ExpressionLike] = []
+    for operand in operands:
+        if _is_movable(operand, ctx):
+            movable.append(operand)
+        else:
+            reordered.extend(sorted(movable, key=rank))
+            reordered.append(operand)
+            movable.clear()
+    reordered.extend(sorted(movable, key=rank))
+    return reordered
+
+
+def _is_movable(expr: ast.ExpressionLike, ctx: OptimizerContext) -> bool:
+    match expr:
+        case ast.Constant() | ast.Variable():
+            return True
+        case ast.Block(inner):
+            return _is_movable(inner, ctx)
+        case ast.BinaryOperation(operator, left, right):
+            if operator in _RAISING_OPERATORS or (
+                ctx.untrusted and operator in _UNTRUSTED_RAISING_OPERATORS
+            ):
+                return False
+            return _is_movable(left, ctx) and _is_movable(right, ctx)
+        case ast.All(values) | ast.Any(values):
+            return all(_is_movable(value, ctx) for value in values)
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            return _is_movable(value, ctx)
+        case ast.FunctionCall(name, arguments):
+            return name in ctx.pure_functions and all(
+                _is_movable(arg, ctx) for arg in arguments
+            )
+    return False
+
+
+def _checks_right_value(operands: list[ast.ExpressionLike], index: int) -> bool:
+    # in untrusted mode a string operand of &&/|| followed by a non-string one
+    # raises, skipping the constant at index could hide that error, which is
+    # only impossible if the constant and the operand before it aren't strings
+    value = operands[index]
+    if isinstance(value, ast.Constant) and isinstance(value.value, (str, bytes)):
+        return True
+    elif index == 0:
+        return False
+    previous = operands[index - 1]
+    if isinstance(previous, ast.Constant):
+        return isinstance(previous.value, (str, bytes))
+    return not _is_boolean(previous)
+
+
+def _is_boolean(expr: ast.ExpressionLike) -> bool:
+    match expr:
+        case ast.Constant(value):
+            return isinstance(value, bool)
+        case ast.BinaryOperation(operator, _, _):
+            return operator in _BOOLEAN_OPERATORS
+        case ast.UnaryOperation(operator, _):
+            return operator == "not"
+        case (
+            ast.Membership()
+            | ast.NetworkMembership()
+            | ast.Matches()
+            | ast.StringTest()
+        ):
+            return True
+        case ast.All(values) | ast.Any(values):
+            return all(_is_boolean(value) for value in values)
+    return False
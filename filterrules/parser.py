@@ -1,44 +1,51 @@
+import ipaddress
+import re
 import typing
 
 from . import ast
 from .lexer import Token, lex
+from .networks import NetworkSet
 
 
 def parse(code: bytes) -> ast.ExpressionLike:
-    lexed = list(lex(code))
-    return _parse(lexed, 0)
+    tokens = _TokenStream(lex(code))
+    node, _ = _parse(tokens, 0)
+    if tokens:
+        next_type, next_value = tokens.pop()
+        raise SyntaxError(f"unexpected {next_value!r} ({next_type})")
+    return node
 
 
-_unary_names: dict[bytes, typing.Literal["not", "plus", "minus", "bnot"]] = {
+# cursor over the lexer output with one token of lookahead, tokens are pulled
+# from the generator on demand instead of materializing and popping a list
+class _TokenStream:
+    __slots__ = ("_tokens", "_next")
+
+    def __init__(self, tokens: typing.Iterable[tuple[Token, bytes]]) -> None:
+        self._tokens = iter(tokens)
+        self._next = next(self._tokens, None)
+
+    def __bool__(self) -> bool:
+        return self._next is not None
+
+    def peek(self) -> tuple[Token, bytes]:
+        if self._next is None:
+            raise SyntaxError("unexpected end of code")
+        return self._next
+
+    def pop(self) -> tuple[Token, bytes]:
+        token = self.peek()
+        self._next = next(self._tokens, None)
+        return token
+
+
+_unary_names: dict[bytes, ast.UnaryOperator] = {
     b"!": "not",
     b"~": "bnot",
     b"+": "plus",
     b"-": "minus",
 }
-_operator_names: dict[
-    bytes,
-    typing.Literal[
-        "add",
-        "subtract",
-        "multiply",
-        "divide",
-        "modulo",
-        "pow",
-        "equals",
-        "not-equals",
-        "greater-than",
-        "greater-than-or-equals",
-        "less-than",
-        "less-than-or-equals",
-        "and",
-        "or",
-        "band",
-        "bor",
-        "bxor",
-        "lshift",
-        "rshift",
-    ],
-] = {
+_operator_names: dict[bytes, ast.BinaryOperator] = {
     b"+": "add",
     b"-": "subtract",
     b"*": "multiply",
@@ -60,16 +67,165 @@ _operator_names: dict[
     b">>": "rshift",
 }
 _closing_separators = {b"(": b")", b"[": b"]"}
+# binding power of the binary operators, higher binds tighter
+_precedences: dict[ast.BinaryOperator, int] = {
+    "or": 1,
+    "and": 2,
+    "equals": 3,
+    "not-equals": 3,
+    "greater-than": 3,
+    "greater-than-or-equals": 3,
+    "less-than": 3,
+    "less-than-or-equals": 3,
+    "bor": 4,
+    "bxor": 5,
+    "band": 6,
+    "lshift": 7,
+    "rshift": 7,
+    "add": 8,
+    "subtract": 8,
+    "multiply": 9,
+    "divide": 9,
+    "modulo": 9,
+    "pow": 10,
+}
+_right_associative: set[ast.BinaryOperator] = {"pow"}
+_string_operators: dict[bytes, ast.StringOperator] = {
+    b"contains": "contains",
+    b"starts_with": "starts-with",
+    b"ends_with": "ends-with",
+}
+# `in`, `matches` and the string operators bind like the comparison operators
+_keyword_precedence = 3
+# the most nested blocks and calls, and the highest tree, the evaluators and
+# compiled code recurse once per level
+_max_depth = 100
 
 
-def _parse(
-    lex: list[tuple[Token, bytes]], dept: int, parse_expresion: bool = True
-) -> ast.ExpressionLike:
-    if dept > 100:
+def _parse(lex: _TokenStream, dept: int) -> tuple[ast.ExpressionLike, int]:
+    # returns the node and its height, the number of nodes on the longest path
+    # down from it, not counting the leaf
+    if dept > _max_depth:
         raise SyntaxError("too deeply nested code")
 
-    first_type, first_value = lex.pop(0)
+    # operator precedence parsing with explicit stacks, so that long chains of
+    # operators don't recurse and only blocks and calls increase the depth,
+    # heights holds the height of every operand, which is limited as well
+    operand, height = _parse_operand(lex, dept)
+    operands: list[ast.ExpressionLike | _Chain] = [operand]
+    heights = [height]
+    operators: list[ast.BinaryOperator] = []
+    while lex:
+        next_type, next_value = lex.peek()
+        if next_type == Token.SEPARATOR:
+            break
+        elif next_type == Token.KEYWORD:
+            lex.pop()
+            while operators and _precedences[operators[-1]] >= _keyword_precedence:
+                _reduce(operands, heights, operators)
+            value = _finish(operands.pop())
+            heights[-1] = _height(heights[-1] + 1)
+            if next_value == b"matches":
+                operands.append(ast.Matches(value, _parse_pattern(lex)))
+            elif next_value in _string_operators:
+                needle = _parse_string(lex, next_value)
+                test = _string_operators[next_value]
+                operands.append(ast.StringTest(test, value, needle))
+            elif lex.peek() == (Token.SEPARATOR, b"{"):
+                networks = NetworkSet(_parse_networks(lex))
+                operands.append(ast.NetworkMembership(value, networks))
+            else:
+                operands.append(ast.Membership(value, _parse_list(lex, dept)))
+            continue
+        elif next_type != Token.OPERATOR:
+            raise SyntaxError(f"expected OPERATOR, not {next_type}")
+
+        operator_buffer: list[bytes] = []
+        while lex.peek()[0] == Token.OPERATOR and (
+            not operator_buffer or lex.peek()[1] not in b"!~+-"
+        ):
+            operator_buffer.append(lex.pop()[1])
+
+        operator = b"".join(operator_buffer)
+        if operator not in _operator_names:
+            raise SyntaxError(f"unknown OPERATOR: {operator!r}")
+
+        name = _operator_names[operator]
+        precedence = _precedences[name]
+        while operators and (
+            _precedences[operators[-1]] > precedence
+            or (
+                _precedences[operators[-1]] == precedence
+                and name not in _right_associative
+            )
+        ):
+            _reduce(operands, heights, operators)
+        operators.append(name)
+        operand, height = _parse_operand(lex, dept)
+        operands.append(operand)
+        heights.append(height)
+
+    while operators:
+        _reduce(operands, heights, operators)
+    return _finish(operands[0]), heights[0]
+
+
+# && and || chains are collected into a list while parsing and turned into
+# a single All or Any node once complete
+class _Chain(typing.NamedTuple):
+    operator: ast.BinaryOperator
+    values: list[ast.ExpressionLike]
+
+
+def _reduce(
+    operands: list[ast.ExpressionLike | _Chain],
+    heights: list[int],
+    operators: list[ast.BinaryOperator],
+) -> None:
+    right = _finish(operands.pop())
+    left = operands.pop()
+    operator = operators.pop()
+    right_height = heights.pop()
+    left_height = heights.pop()
+    if operator not in ("and", "or"):
+        operands.append(ast.BinaryOperation(operator, _finish(left), right))
+    elif isinstance(left, _Chain) and left.operator == operator:
+        # the height of a chain already includes the chain itself
+        left.values.append(right)
+        operands.append(left)
+        heights.append(_height(max(left_height, right_height + 1)))
+        return
+    else:
+        operands.append(_Chain(operator, [_finish(left), right]))
+    heights.append(_height(max(left_height, right_height) + 1))
+
+
+def _height(height: int) -> int:
+    # operators nest like blocks, without this long chains of them would be
+    # too deep to evaluate, lint or compile
+    if height > _max_depth:
+        raise SyntaxError("too deeply nested code")
+    return height
+
+
+def _finish(node: ast.ExpressionLike | _Chain) -> ast.ExpressionLike:
+    if not isinstance(node, _Chain):
+        return node
+    elif node.operator == "and":
+        return ast.All(tuple(node.values))
+    return ast.Any(tuple(node.values))
+
+
+def _parse_operand(lex: _TokenStream, dept: int) -> tuple[ast.ExpressionLike, int]:
+    unary_operators: list[ast.UnaryOperator] = []
+    while lex.peek()[0] == Token.OPERATOR and lex.peek()[1] in _unary_names:
+        unary_operators.append(_unary_names[lex.pop()[1]])
+
+    first_type, first_value = lex.pop()
+    if first_type == Token.KEYWORD:  # keywords are regular names as operands
+        first_type = Token.NAME
     node: ast.ExpressionLike
+    height = 0
     match first_type:
         case Token.NAME:
             value = first_value.decode()
@@ -83,44 +239,35 @@ def _parse(
         case Token.STRING:
             node = ast.Constant(first_value)
         case Token.SEPARATOR if first_value in b"([":
-            node = ast.Block(_parse(lex, dept + 1))
-            second_type, second_value = lex.pop(0)
+            inner, height = _parse(lex, dept + 1)
+            node = ast.Block(inner)
+            height = _height(height + 1)
+            second_type, second_value = lex.pop()
             expected = _closing_separators[first_value]
-            # if second_type != Token.SEPARATOR:
-            #     raise SyntaxError(f"expected closing SEPARATOR, not {second_type}")
             if expected != second_value:
                 raise SyntaxError(
                     f"unexpected closing SEPARATOR, expected {expected!r}, "
                     f"not {second_value!r}"
                 )
-        case Token.OPERATOR if first_value in b"!~+-":
-            node = ast.UnaryOperation(
-                _unary_names[first_value], _parse(lex, dept + 1, False)
-            )
         case _:
             raise SyntaxError(f"unexpected {first_value!r} ({first_type})")
 
-    if not lex or not parse_expresion:
-        return node
-
-    while lex and lex[0][0] == Token.SEPARATOR:
-        if lex[0][1] != b"(":
-            return node
-        lex.pop(0)
+    while lex and lex.peek() == (Token.SEPARATOR, b"("):
+        lex.pop()
         if first_type != Token.NAME:
             raise SyntaxError(
                 f"must be a NAME before a function call, not {first_type}"
             )
         args = []
-        if lex[0] == (Token.SEPARATOR, b")"):
-            lex.pop(0)
+        height = 0
+        if lex.peek() == (Token.SEPARATOR, b")"):
+            lex.pop()
         else:
-            while lex:
-                arg = _parse(lex, dept + 1)
+            while True:
+                arg, arg_height = _parse(lex, dept + 1)
                 args.append(arg)
-                comma_type, comma_value = lex.pop(0)
-                # if comma_type != Token.SEPARATOR:
-                #     raise SyntaxError(f"expected SEPARATOR, not {comma_type}")
+                height = max(height, arg_height)
+                comma_type, comma_value = lex.pop()
                 if comma_value == b")":
                     break
                 elif comma_value != b",":
@@ -129,33 +276,89 @@ def _parse(
                     )
 
         node = ast.FunctionCall(first_value.decode(), tuple(args))
+        height = _height(height + 1)
+        first_type = Token.SEPARATOR  # the result of a call is not callable
 
-    if not lex:
-        return node
+    for operator in reversed(unary_operators):
+        node = ast.UnaryOperation(operator, node)
+    return node, _height(height + len(unary_operators))
 
-    next_type, next_value = lex[0]
-    if next_type == Token.OPERATOR:
-        operator_buffer: list[bytes] = []
-        while lex[0][0] == Token.OPERATOR and (
-            not operator_buffer or lex[0][1] not in b"!~+-"
-        ):
-            operator_buffer.append(lex.pop(0)[1])
 
-        operator = b"".join(operator_buffer)
-        if operator not in _operator_names:
-            raise SyntaxError(f"unknown OPERATOR: {operator!r}")
+def _parse_list(lex: _TokenStream, dept: int) -> frozenset[ast.AllowedTypes]:
+    # a list of constants, like [1, -2, "three"]
+    open_type, open_value = lex.pop()
+    if open_value != b"[":
+        raise SyntaxError(f"expected [ after in, not {open_value!r} ({open_type})")
+    values: set[ast.AllowedTypes] = set()
+    if lex.peek() == (Token.SEPARATOR, b"]"):
+        lex.pop()
+        return frozenset()
+    while True:
+        node, _ = _parse_operand(lex, dept + 1)
+        match node:
+            case ast.Constant(value):
+                values.add(value)
+            case ast.UnaryOperation(
+                "minus" | "plus", ast.Constant(int(value) | float(value))
+            ):
+                values.add(-value if node.operator == "minus" else value)
+            case _:
+                raise SyntaxError("only constants are allowed in a list")
+        comma_type, comma_value = lex.pop()
+        if comma_value == b"]":
+            return frozenset(values)
+        elif comma_value != b",":
+            raise SyntaxError(
+                f"unexpected {comma_value!r} ({comma_type}), expected , or ]"
+            )
+
 
-        right = _parse(lex, dept + 1)
-        # make operations in the order left to right, instead of
-        # right to left
-        # eg 1 + 2 + 3 is add(add(1, 2), 3) instead of add(1, add(2, 3))
-        if isinstance(right, ast.BinaryOperation):
-            return ast.BinaryOperation(
-                right.operator,
-                ast.BinaryOperation(_operator_names[operator], node, right.left),
-                right.right,
+def _parse_networks(lex: _TokenStream) -> list[str]:
+    # a set of ip networks, like {10.0.0.0/8, "2001:db8::/32", 1.1.1.1}
+    lex.pop()
+    networks: list[str] = []
+    if lex.peek() == (Token.SEPARATOR, b"}"):
+        lex.pop()
+        return networks
+    while True:
+        network_type, network = lex.pop()
+        if network_type not in (Token.NAME, Token.STRING):
+            raise SyntaxError(f"expected network, not {network!r} ({network_type})")
+        if lex.peek() == (Token.OPERATOR, b"/"):
+            lex.pop()
+            length_type, length = lex.pop()
+            if length_type != Token.NAME:
+                raise SyntaxError(
+                    f"expected prefix length, not {length!r} ({length_type})"
+                )
+            network += b"/" + length
+        try:
+            networks.append(str(ipaddress.ip_network(network.decode(), strict=False)))
+        except ValueError:  # includes UnicodeDecodeError
+            raise SyntaxError(f"invalid network: {network!r}") from None
+        comma_type, comma_value = lex.pop()
+        if comma_value == b"}":
+            return networks
+        elif comma_value != b",":
+            raise SyntaxError(
+                f"unexpected {comma_value!r} ({comma_type}), expected , or }}"
             )
-        return ast.BinaryOperation(_operator_names[operator], node, right)
 
-    else:
-        raise SyntaxError(f"expected OPERATOR, not {next_type}")
+
+def _parse_string(lex: _TokenStream, keyword: bytes) -> bytes:
+    # the right side of matches and the string operators must be a string
+    string_type, string = lex.pop()
+    if string_type != Token.STRING:
+        raise SyntaxError(
+            f"expected STRING after {keyword.decode()}, not {string!r} ({string_type})"
+        )
+    return string
+
+
+def _parse_pattern(lex: _TokenStream) -> bytes:
+    pattern = _parse_string(lex, b"matches")
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise SyntaxError(f"invalid pattern: {e}") from None
+    return pattern
@@ -0,0 +1,75 @@
+import functools
+import re
+import sys
+import typing
+
+if sys.version_info >= (3, 11):
+    from re import _parser as sre_parse  # type: ignore[attr-defined]
+else:
+    import sre_parse
+
+Pattern = re.Pattern[typing.Any]
+# compiled patterns are shared by all rules using the same pattern
+PATTERN_CACHE_SIZE = 1024
+# the most ways a pattern may match at a single position in untrusted mode, a
+# search takes at most time proportional to this times the length of the text
+MAX_UNTRUSTED_PATHS = 256
+
+_SINGLE_CHARACTERS = {"LITERAL", "NOT_LITERAL", "ANY", "IN", "AT", "CATEGORY"}
+_REPEATS = {"MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"}
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern: bytes | str, untrusted: bool) -> Pattern:
+    # python's re backtracks, so in untrusted mode only patterns which can't
+    # backtrack much are allowed, every repeat must have an upper bound
+    try:
+        compiled = re.compile(pattern)
+    except re.error as e:
+        raise RuntimeError(f"invalid pattern: {e}") from None
+    if untrusted and _paths(sre_parse.parse(pattern)) > MAX_UNTRUSTED_PATHS:
+        raise RuntimeError("pattern backtracks too much for untrusted mode")
+    return compiled
+
+
+def _paths(items: typing.Iterable[tuple[typing.Any, typing.Any]]) -> int:
+    # the number of ways items can match at one position, stops counting once
+    # the limit is exceeded
+    paths = 1
+    for op, argument in items:
+        name = op.name
+        if name in _SINGLE_CHARACTERS:
+            continue
+        elif name == "SUBPATTERN":
+            count = _paths(argument[-1])
+        elif name == "ATOMIC_GROUP":
+            count = _paths(argument)
+        elif name == "BRANCH":
+            count = sum(map(_paths, argument[1]))
+        elif name in _REPEATS:
+            minimum, maximum, body = argument
+            if maximum == sre_parse.MAXREPEAT:
+                raise RuntimeError(
+                    "unbounded repeats (*, + and {n,}) are disabled in untrusted "
+                    "mode, use {n,m} instead"
+                )
+            each = _paths(body)
+            if each == 1:
+                count = maximum - minimum + 1
+            elif minimum > MAX_UNTRUSTED_PATHS.bit_length():
+                count = MAX_UNTRUSTED_PATHS + 1
+            else:  # grows exponentially, the loop ends after a few repeats
+                count = 0
+                for repeats in range(minimum, maximum + 1):
+                    count += each**repeats
+                    if count > MAX_UNTRUSTED_PATHS:
+                        break
+        else:
+            raise RuntimeError(
+                "backreferences, lookarounds and conditionals are disabled in "
+                "untrusted mode"
+            )
+        paths *= count
+        if paths > MAX_UNTRUSTED_PATHS:
+            break
+    return paths
@@ -1,26 +1,36 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import math
+import time
 import typing
 
-from . import ast
+from . import ast, optimizer, patterns, serialize, stream
+from .instrumentation import Profile
+from .lint import _nodes
+from .networks import address_key
+from .strings import MIN_AUTOMATON_NEEDLES, Automaton
 
 Variables = dict[str, typing.Any]
 Functions = dict[str, typing.Callable[..., typing.Any]]
 
 
-def _untrusted_add(a: typing.Any, b: typing.Any) -> typing.Any:
-    c = a + b
-    if isinstance(c, (str, bytes)) and len(c) >= 65536:
-        raise RuntimeError("string longer than allowed in untrusted mode")
-    return c
+def _string_too_long() -> typing.NoReturn:
+    raise RuntimeError("string longer than allowed in untrusted mode")
 
 
-def _untrusted_lshift(a: int, b: int) -> int:
-    if b > 128 or a >= (1 << 128):
-        raise RuntimeError("lshift operation with too big values")
-    return a << b
+def _lshift_too_big() -> typing.NoReturn:
+    raise RuntimeError("lshift operation with too big values")
 
 
-_TRUSTED_COMPILER = "lambda vars, fns: %s"
-_UNTRUSTED_COMPILER = "lambda __untrusted_add, __untrusted_lshift: lambda vars, fns: %s"
+def _untrusted_lshift(left: typing.Any, right: typing.Any) -> typing.Any:
+    if right > 128 or left >= 1 << 128:
+        _lshift_too_big()
+    return left << right
+
+
+_unset = object()
 
 
 class Rule(typing.NamedTuple):
@@ -31,15 +41,134 @@ class Rule(typing.NamedTuple):
         ctx = RuleContext(variables, functions, self.untrusted)
         return _evaluate(self.expr, ctx)
 
-    def compile(self) -> typing.Callable[[Variables, Functions], typing.Any]:
-        expr = _compile(self.expr, self.untrusted)
-        if self.untrusted:
-            fn = eval(_UNTRUSTED_COMPILER % expr, {}, {})(
-                _untrusted_add, _untrusted_lshift
-            )
-        else:
-            fn = eval(_TRUSTED_COMPILER % expr, {}, {})
-        return typing.cast(typing.Callable[[Variables, Functions], typing.Any], fn)
+    def evaluate_batch(
+        self,
+        columns: typing.Mapping[str, typing.Any],
+        functions: Functions | None = None,
+    ) -> typing.Any:
+        # evaluates the rule for every row of the columns at once, requires
+        # numpy (pip install filterrules[numpy])
+        from .batch import evaluate_batch
+
+        return evaluate_batch(self.expr, columns, functions or {}, self.untrusted)
+
+    def filter(
+        self,
+        records: typing.Iterable[stream.Record],
+        functions: Functions,
+        processes: int | None = None,
+        chunksize: int = 1000,
+        optimize: bool = False,
+    ) -> typing.Iterator[stream.Record]:
+        # yields the matching records, with processes the records are
+        # evaluated in chunks by a pool of worker processes
+        load_matcher = functools.partial(
+            _load_matcher,
+            serialize.dump(self.expr),
+            self.untrusted,
+            functions,
+            optimize,
+        )
+        for record, _ in stream.filter_records(
+            records, load_matcher, processes, chunksize
+        ):
+            yield record
+
+    @typing.overload
+    def compile(
+        self, optimize: bool = ..., pure_functions: typing.Collection[str] = ...
+    ) -> typing.Callable[[Variables, Functions], typing.Any]: ...
+
+    @typing.overload
+    def compile(
+        self,
+        optimize: bool = ...,
+        pure_functions: typing.Collection[str] = ...,
+        *,
+        variables: typing.Sequence[str] | None = ...,
+        functions: Functions | None = ...,
+    ) -> typing.Callable[..., typing.Any]: ...
+
+    def compile(
+        self,
+        optimize: bool = False,
+        pure_functions: typing.Collection[str] = (),
+        *,
+        variables: typing.Sequence[str] | None = None,
+        functions: Functions | None = None,
+    ) -> typing.Callable[..., typing.Any]:
+        # with variables, the compiled function takes the values of these
+        # variables as positional arguments instead of a dict, with functions,
+        # the functions are bound now and not passed on every call
+        code = self.expr
+        if optimize:
+            code = optimizer.optimize(code, self.untrusted)
+        # repeated variables and calls to pure functions are evaluated once
+        ctx = _compile_context(
+            (code,), self.untrusted, pure_functions, (code,), variables, functions
+        )
+        body = [f"return {_compile(code, ctx)}"]
+        bound = ctx.functions or {}
+        namespace = {bound[name]: fn for name, fn in (functions or {}).items()}
+        return typing.cast(
+            typing.Callable[..., typing.Any], _define("rule", body, ctx, namespace)
+        )
+
+    def compile_instrumented(
+        self,
+        profile: Profile,
+        optimize: bool = False,
+        pure_functions: typing.Collection[str] = (),
+    ) -> typing.Callable[[Variables, Functions], typing.Any]:
+        # like compile, but every evaluated node is recorded in profile, the
+        # functions returned by compile stay free of any instrumentation
+        code = self.expr
+        if optimize:
+            code = optimizer.optimize(code, self.untrusted)
+        ctx = _compile_context(
+            (code,),
+            self.untrusted,
+            pure_functions,
+            (code,),
+            recorded=profile.register(code),
+        )
+        body = [f"return {_compile(code, ctx)}"]
+        return typing.cast(
+            typing.Callable[[Variables, Functions], typing.Any],
+            _define("rule", body, ctx, _instrumented_namespace(profile)),
+        )
+
+    async def evaluate_async(
+        self, variables: Variables, functions: Functions
+    ) -> typing.Any:
+        # functions may return awaitables, which are awaited when reached
+        ctx = RuleContext(variables, functions, self.untrusted)
+        return await _evaluate_concurrent(self.expr, ctx, {})
+
+    def compile_async(
+        self, optimize: bool = False
+    ) -> typing.Callable[
+        [Variables, Functions], typing.Coroutine[typing.Any, typing.Any, typing.Any]
+    ]:
+        code = self.expr
+        if optimize:
+            code = optimizer.optimize(code, self.untrusted)
+        ctx = _compile_context((code,), self.untrusted, (), (code,), asynchronous=True)
+        body = [f"return {_compile_concurrent(code, ctx)}"]
+        return typing.cast(
+            typing.Callable[
+                [Variables, Functions],
+                typing.Coroutine[typing.Any, typing.Any, typing.Any],
+            ],
+            _define("rule", body, ctx),
+        )
+
+
+def _load_matcher(
+    data: bytes, untrusted: bool, functions: Functions, optimize: bool
+) -> stream.Matcher:
+    compiled = Rule(serialize.load(data), untrusted).compile(optimize)
+    return lambda record: compiled(record, functions)
 
 
 class RuleContext(typing.NamedTuple):
@@ -70,87 +199,289 @@ def _evaluate(expr: ast.ExpressionLike, ctx: RuleContext) -> typing.Any:
                         return left
 
             right = _evaluate(expr.right, ctx)
-            if (
-                isinstance(left, (str, bytes))
-                and not isinstance(right, (str, bytes))
-                and ctx.untrusted
-            ):
-                raise RuntimeError(
-                    "cannot use non-string right-value on a string in untrusted mode"
-                )
-
-            match operator:
-                case "add":
-                    r = left + right
-                    if (
-                        isinstance(r, (str, bytes))
-                        and len(r) >= 65536
-                        and ctx.untrusted
-                    ):
-                        raise RuntimeError(
-                            "string longer than allowed in untrusted mode"
-                        )
-                    return r
-                case "subtract":
-                    return left - right
-                case "multiply":
-                    return left * right
-                case "divide":
-                    return left / right
-                case "modulo":
-                    return left % right
-                case "pow":
-                    if ctx.untrusted:
-                        raise RuntimeError(
-                            "pow operation (**) is disabled in untrusted mode"
-                        )
-                    return left**right
-                case "equals":
-                    return left == right
-                case "not-equals":
-                    return left != right
-                case "greater-than":
-                    return left > right
-                case "greater-than-or-equals":
-                    return left >= right
-                case "less-than":
-                    return left < right
-                case "less-than-or-equals":
-                    return left <= right
-                case "and" | "or":
-                    return right
-                case "band":
-                    return left & right
-                case "bor":
-                    return left | right
-                case "bxor":
-                    return left ^ right
-                case "lshift":
-                    if ctx.untrusted and (right > 128 or (left >= 1 << 128)):
-                        raise RuntimeError("lshift operation with too big values")
-                    return left << right
-                case "rshift":
-                    return left >> right
+            return _binary(operator, left, right, ctx.untrusted)
+
+        case ast.All(values) | ast.Any(values):
+            # evaluated in a loop instead of recursing for every operand
+            is_all = isinstance(expr, ast.All)
+            left = _evaluate(values[0], ctx)
+            for index in range(1, len(values)):
+                if bool(left) != is_all:  # short circuit logic
+                    return left
+                right = _evaluate(values[index], ctx)
+                if ctx.untrusted:
+                    _check_right_value(left, right)
+                left = right
+            return left
 
         case ast.UnaryOperation(operator, _):
-            value = _evaluate(expr.value, ctx)
-            match operator:
-                case "not":
-                    return not value
-                case "bnot":
-                    return ~value  # type: ignore
-                case "plus":
-                    return +value  # type: ignore
-                case "minus":
-                    return -value  # type: ignore
+            return _unary(operator, _evaluate(expr.value, ctx))
 
         case ast.FunctionCall(name, arguments):
             args = [_evaluate(arg, ctx) for arg in arguments]
             return ctx.functions[name](*args)
 
+        case ast.Membership(_, values):
+            return _membership(_evaluate(expr.value, ctx), values, ctx.untrusted)
+
+        case ast.NetworkMembership(_, networks):
+            return _evaluate(expr.value, ctx) in networks
+
+        case ast.Matches(_, pattern):
+            return _matches(_evaluate(expr.value, ctx), pattern, ctx.untrusted)
+
+        case ast.StringTest(operator, _, needle):
+            return _string_test(_evaluate(expr.value, ctx), operator, needle)
+
+    raise RuntimeError(f"unknown ast node: {expr}")
+
+
+def _binary(
+    operator: ast.BinaryOperator, left: typing.Any, right: typing.Any, untrusted: bool
+) -> typing.Any:
+    if untrusted:
+        _check_right_value(left, right)
+
+    match operator:
+        case "add":
+            r = left + right
+            if isinstance(r, (str, bytes)) and len(r) >= 65536 and untrusted:
+                raise RuntimeError("string longer than allowed in untrusted mode")
+            return r
+        case "subtract":
+            return left - right
+        case "multiply":
+            return left * right
+        case "divide":
+            return left / right
+        case "modulo":
+            return left % right
+        case "pow":
+            if untrusted:
+                raise RuntimeError("pow operation (**) is disabled in untrusted mode")
+            return left**right
+        case "equals":
+            return left == right
+        case "not-equals":
+            return left != right
+        case "greater-than":
+            return left > right
+        case "greater-than-or-equals":
+            return left >= right
+        case "less-than":
+            return left < right
+        case "less-than-or-equals":
+            return left <= right
+        case "and" | "or":
+            return right
+        case "band":
+            return left & right
+        case "bor":
+            return left | right
+        case "bxor":
+            return left ^ right
+        case "lshift":
+            if untrusted and (right > 128 or (left >= 1 << 128)):
+                raise RuntimeError("lshift operation with too big values")
+            return left << right
+        case "rshift":
+            return left >> right
+    raise RuntimeError(f"unknown operator: {operator!r}")
+
+
+def _unary(operator: ast.UnaryOperator, value: typing.Any) -> typing.Any:
+    match operator:
+        case "not":
+            return not value
+        case "bnot":
+            return ~value
+        case "plus":
+            return +value
+        case "minus":
+            return -value
+    raise RuntimeError(f"unknown operator: {operator!r}")
+
+
+def _membership(
+    value: typing.Any, values: frozenset[ast.AllowedTypes], untrusted: bool
+) -> bool:
+    # like comparing value to every item with ==
+    if untrusted and isinstance(value, (str, bytes)) and _has_non_strings(values):
+        _check_right_value(value, None)
+    return value in values
+
+
+@functools.lru_cache(maxsize=1024)
+def _has_non_strings(values: frozenset[ast.AllowedTypes]) -> bool:
+    # the evaluators check every set once, frozensets cache their hash, so a
+    # lookup doesn't depend on the number of items
+    return not all(isinstance(item, (str, bytes)) for item in values)
+
+
+def _matches(value: typing.Any, pattern: bytes | str, untrusted: bool) -> bool:
+    # the evaluators have no compile step, they look the pattern up in the
+    # shared pattern cache instead, compiled functions bind it once
+    compiled: patterns.Pattern = patterns.compile_pattern(pattern, untrusted)
+    return compiled.search(value) is not None
+
+
+def _string_test(
+    value: typing.Any, operator: ast.StringOperator, needle: bytes | str
+) -> bool:
+    match operator:
+        case "contains":
+            return needle in value
+        case "starts-with":
+            return bool(value.startswith(needle))
+        case "ends-with":
+            return bool(value.endswith(needle))
+    raise RuntimeError(f"unknown operator: {operator!r}")
+
+
+def _check_right_value(left: typing.Any, right: typing.Any) -> None:
+    if isinstance(left, (str, bytes)) and not isinstance(right, (str, bytes)):
+        raise RuntimeError(
+            "cannot use non-string right-value on a string in untrusted mode"
+        )
+
+
+async def _evaluate_concurrent(
+    expr: ast.ExpressionLike, ctx: RuleContext, prefetched: dict[int, typing.Any]
+) -> typing.Any:
+    # all function calls outside of &&/|| are always evaluated, those that
+    # don't depend on other calls are awaited concurrently upfront
+    calls = list(_independent_calls(expr))
+    if len(calls) > 1:
+        values = await asyncio.gather(*(_call_async(call, ctx) for call in calls))
+        prefetched.update(zip(map(id, calls), values))
+    return await _evaluate_async(expr, ctx, prefetched)
+
+
+async def _evaluate_async(
+    expr: ast.ExpressionLike, ctx: RuleContext, prefetched: dict[int, typing.Any]
+) -> typing.Any:
+    match expr:
+        case ast.Block(inner):
+            return await _evaluate_async(inner, ctx, prefetched)
+
+        case ast.Constant(value):
+            return value
+
+        case ast.Variable(key):
+            return ctx.variables[key]
+
+        case ast.BinaryOperation("and" | "or", _, _):
+            left = await _evaluate_concurrent(expr.left, ctx, prefetched)
+            if bool(left) != (expr.operator == "and"):  # short circuit logic
+                return left
+            right = await _evaluate_concurrent(expr.right, ctx, prefetched)
+            return _binary(expr.operator, left, right, ctx.untrusted)
+
+        case ast.BinaryOperation(operator, _, _):
+            left = await _evaluate_async(expr.left, ctx, prefetched)
+            right = await _evaluate_async(expr.right, ctx, prefetched)
+            return _binary(operator, left, right, ctx.untrusted)
+
+        case ast.All(values) | ast.Any(values):
+            is_all = isinstance(expr, ast.All)
+            left = await _evaluate_concurrent(values[0], ctx, prefetched)
+            for index in range(1, len(values)):
+                if bool(left) != is_all:  # short circuit logic
+                    return left
+                right = await _evaluate_concurrent(values[index], ctx, prefetched)
+                if ctx.untrusted:
+                    _check_right_value(left, right)
+                left = right
+            return left
+
+        case ast.UnaryOperation(operator, _):
+            return _unary(operator, await _evaluate_async(expr.value, ctx, prefetched))
+
+        case ast.FunctionCall(name, arguments):
+            if id(expr) in prefetched:
+                return prefetched[id(expr)]
+            args = [await _evaluate_async(arg, ctx, prefetched) for arg in arguments]
+            value = ctx.functions[name](*args)
+            if inspect.isawaitable(value):
+                value = await value
+            return value
+
+        case ast.Membership(_, values):
+            value = await _evaluate_async(expr.value, ctx, prefetched)
+            return _membership(value, values, ctx.untrusted)
+
+        case ast.NetworkMembership(_, networks):
+            return await _evaluate_async(expr.value, ctx, prefetched) in networks
+
+        case ast.Matches(_, pattern):
+            value = await _evaluate_async(expr.value, ctx, prefetched)
+            return _matches(value, pattern, ctx.untrusted)
+
+        case ast.StringTest(operator, _, needle):
+            value = await _evaluate_async(expr.value, ctx, prefetched)
+            return _string_test(value, operator, needle)
+
     raise RuntimeError(f"unknown ast node: {expr}")
 
 
+async def _call_async(expr: ast.FunctionCall, ctx: RuleContext) -> typing.Any:
+    # the arguments don't contain function calls and are evaluated synchronously
+    args = [_evaluate(arg, ctx) for arg in expr.arguments]
+    value = ctx.functions[expr.name](*args)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+def _independent_calls(
+    expr: ast.ExpressionLike,
+) -> typing.Generator[ast.FunctionCall, None, None]:
+    # function calls which are evaluated unconditionally and whose arguments
+    # don't contain function calls
+    match expr:
+        case ast.Block(inner):
+            yield from _independent_calls(inner)
+        case ast.BinaryOperation(operator, left, right):
+            if operator not in ("and", "or"):
+                yield from _independent_calls(left)
+                yield from _independent_calls(right)
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            yield from _independent_calls(value)
+        case ast.FunctionCall(_, arguments):
+            if any(map(_contains_call, arguments)):
+                for arg in arguments:
+                    yield from _independent_calls(arg)
+            else:
+                yield expr
+
+
+def _contains_call(expr: ast.ExpressionLike) -> bool:
+    match expr:
+        case ast.Block(inner):
+            return _contains_call(inner)
+        case ast.BinaryOperation(_, left, right):
+            return _contains_call(left) or _contains_call(right)
+        case ast.All(values) | ast.Any(values):
+            return any(map(_contains_call, values))
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            return _contains_call(value)
+        case ast.FunctionCall():
+            return True
+    return False
+
+
 _binary_operator_map = {
     "add": "+",
     "subtract": "-",
@@ -175,36 +506,464 @@ _binary_operator_map = {
 _unaery_operator_map = {"not": "not", "bnot": "~", "plus": "+", "minus": "-"}
 
 
-def _compile(expr: ast.ExpressionLike, untrusted: bool) -> str:
+class StringScans(typing.NamedTuple):
+    # maps contains tests to their automaton and the index of their needle
+    tests: dict[int, tuple[int, int]]
+    automata: list[Automaton]
+
+
+class CompileContext(typing.NamedTuple):
+    untrusted: bool
+    cached: dict[int, str]
+    hoisted: dict[str, str]
+    temporaries: typing.Iterator[int]
+    # patterns of matches and the names their search method is bound to
+    patterns: dict[bytes | str, str]
+    arguments: dict[str, str] | None = None
+    functions: dict[str, str] | None = None
+    # set for async functions, prefetched maps calls to the expression
+    # containing their result
+    prefetched: dict[int, str] | None = None
+    # set for instrumented functions, maps nodes to their index in the profile
+    recorded: dict[int, int] | None = None
+    # set for rulesets, contains tests answered by a shared automaton
+    scans: StringScans | None = None
+
+
+def _compile(expr: ast.ExpressionLike, ctx: CompileContext) -> str:
+    # nodes in cached (by id) are evaluated at most once, the first time they
+    # are reached, and stored in the local variable of the given name
+    if id(expr) in ctx.cached:
+        name = ctx.cached[id(expr)]
+        if name in ctx.hoisted:
+            return _record(name, expr, ctx)
+        return (
+            f"({name} if {name} is not __unset else "
+            f"({name} := {_record(_compile_node(expr, ctx), expr, ctx)}))"
+        )
+    return _record(_compile_node(expr, ctx), expr, ctx)
+
+
+def _record(code: str, expr: ast.ExpressionLike, ctx: CompileContext) -> str:
+    # the start time is taken before the node is evaluated, __record adds the
+    # elapsed time once it has been
+    if ctx.recorded is not None and id(expr) in ctx.recorded:
+        return f"__record({ctx.recorded[id(expr)]}, __now(), {code})"
+    return code
+
+
+def _compile_node(expr: ast.ExpressionLike, ctx: CompileContext) -> str:
     match expr:
         case ast.Block(inner):
-            return f"({_compile(inner, untrusted)})"
+            return _compile(inner, ctx)
 
         case ast.Constant(value):
+            if isinstance(value, float) and not math.isfinite(value):
+                return f"float({str(value)!r})"  # inf and nan have no literal
+            elif isinstance(value, (int, float)) and value < 0:
+                return f"({value!r})"
             return repr(value)
 
         case ast.Variable(key):
-            return f"vars[{key!r}]"
+            if ctx.arguments is None:
+                return f"vars[{key!r}]"
+            elif key not in ctx.arguments:
+                raise RuntimeError(f"variable not found: {key!r}")
+            return ctx.arguments[key]
+
+        case ast.BinaryOperation("and" | "or", _, _):
+            left = _compile_concurrent(expr.left, ctx)
+            right = _compile_concurrent(expr.right, ctx)
+            return f"({left} {expr.operator} {right})"
 
         case ast.BinaryOperation(operator, _, _):
-            left = _compile(expr.left, untrusted)
-            right = _compile(expr.right, untrusted)
-            if untrusted:
+            left = _compile(expr.left, ctx)
+            right = _compile(expr.right, ctx)
+            if ctx.untrusted:
                 if operator == "pow":
                     raise RuntimeError(
                         "pow operation (**) is disabled in untrusted mode"
                     )
-                elif operator in ("lshift", "add"):
-                    return f"__untrusted_{operator}({left}, {right})"
+                # the untrusted mode limit of add is checked inline, with the
+                # result stored in a temporary local
+                elif operator == "add":
+                    result = f"__t{next(ctx.temporaries)}"
+                    return (
+                        f"({result} if ({result} := {left} + {right}).__class__ "
+                        f"not in __strings or len({result}) < 65536 "
+                        "else __string_too_long())"
+                    )
+                # an inline guard would nest the left operand in three levels
+                # of parentheses, so long chains would exceed python's limit
+                elif operator == "lshift":
+                    return f"__lshift({left}, {right})"
 
             return f"({left} {_binary_operator_map[operator]} {right})"
 
+        case ast.All(values) | ast.Any(values):
+            joiner = " and " if isinstance(expr, ast.All) else " or "
+            operands = (_compile_concurrent(value, ctx) for value in values)
+            return f"({joiner.join(operands)})"
+
         case ast.UnaryOperation(operator, _):
-            value = _compile(expr.value, untrusted)
-            return f"{_unaery_operator_map[operator]} {value}"
+            value = _compile(expr.value, ctx)
+            return f"({_unaery_operator_map[operator]} {value})"
+
+        case ast.FunctionCall():
+            if ctx.prefetched is not None:
+                if id(expr) in ctx.prefetched:
+                    return ctx.prefetched[id(expr)]
+                value = f"__t{next(ctx.temporaries)}"
+                return (
+                    f"((await {value}) if __isawaitable({value} := "
+                    f"{_compile_call(expr, ctx)}) else {value})"
+                )
+            return _compile_call(expr, ctx)
+
+        case ast.Membership(_, values):
+            # python folds a set display of constants into a frozenset constant
+            operand = _compile(expr.value, ctx)
+            items = ", ".join(_compile(ast.Constant(item), ctx) for item in values)
+            return f"({operand} in {{{items}}})" if values else f"({operand} in ())"
+
+        case ast.NetworkMembership(_, networks):
+            # one lookup per prefix length, python folds the set displays
+            # into frozenset constants
+            key = f"__address({_compile(expr.value, ctx)})"
+            if not networks.levels:
+                return f"({key} in ())"
+            address = f"__t{next(ctx.temporaries)}"
+            lookups: list[str] = []
+            for shift, prefixes in networks.levels:
+                operand = address if lookups else f"({address} := {key})"
+                items = ", ".join(map(str, sorted(prefixes)))
+                lookups.append(f"{operand} >> {shift} in {{{items}}}")
+            return f"({' or '.join(lookups)})"
+
+        case ast.Matches(_, pattern):
+            # the pattern is checked and compiled now, its search method is
+            # bound in the namespace of the compiled function
+            search = ctx.patterns.get(pattern)
+            if search is None:
+                patterns.compile_pattern(pattern, ctx.untrusted)
+                search = ctx.patterns[pattern] = f"__p{len(ctx.patterns)}"
+            return f"({search}({_compile(expr.value, ctx)}) is not None)"
+
+        case ast.StringTest(operator, _, needle):
+            value = _compile(expr.value, ctx)
+            if ctx.scans is not None and id(expr) in ctx.scans.tests:
+                # the automaton searches the variable for all needles the
+                # first time one of its tests is reached
+                automaton, index = ctx.scans.tests[id(expr)]
+                found = f"__a{automaton}"
+                return (
+                    f"({index} in ({found} if {found} is not __unset else "
+                    f"({found} := __scan{automaton}({value}))))"
+                )
+            elif operator == "contains":
+                return f"({needle!r} in {value})"
+            method = "startswith" if operator == "starts-with" else "endswith"
+            return f"({value}).{method}({needle!r})"
 
+    raise RuntimeError(f"unknown ast node: {expr}")
+
+
+def _compile_call(expr: ast.FunctionCall, ctx: CompileContext) -> str:
+    args = ", ".join(_compile(arg, ctx) for arg in expr.arguments)
+    return f"{_compile_function(expr, ctx)}({args})"
+
+
+def _compile_function(expr: ast.FunctionCall, ctx: CompileContext) -> str:
+    if ctx.functions is None:
+        return f"fns[{expr.name!r}]"
+    elif expr.name not in ctx.functions:
+        raise RuntimeError(f"function not found: {expr.name!r}")
+    return ctx.functions[expr.name]
+
+
+def _compile_concurrent(expr: ast.ExpressionLike, ctx: CompileContext) -> str:
+    # see _evaluate_concurrent, the prefetched results are stored in a tuple
+    if ctx.prefetched is None:
+        return _compile(expr, ctx)
+    calls = list(_independent_calls(expr))
+    if len(calls) < 2:
+        return _compile(expr, ctx)
+    results = f"__t{next(ctx.temporaries)}"
+    # the functions and arguments are evaluated before any function is called,
+    # an error there would leave the coroutines of earlier calls unawaited
+    pending = []
+    for call in calls:
+        items = [_compile_function(call, ctx)]
+        items.extend(_compile(arg, ctx) for arg in call.arguments)
+        pending.append(f"({', '.join(items)},)")
+    awaitables = ", ".join(pending)
+    for index, call in enumerate(calls):
+        ctx.prefetched[id(call)] = f"{results}[{index}]"
+    return f"({results} := await __gather({awaitables}), {_compile(expr, ctx)})[1]"
+
+
+def _define(
+    name: str,
+    body: list[str],
+    ctx: CompileContext,
+    namespace: dict[str, typing.Any] | None = None,
+) -> typing.Any:
+    parameters = ["vars"] if ctx.arguments is None else list(ctx.arguments.values())
+    if ctx.functions is None:
+        parameters.append("fns")
+    asynchronous = "async " if ctx.prefetched is not None else ""
+    lines = [f"{asynchronous}def {name}({', '.join(parameters)}):"]
+    for local in sorted(set(ctx.cached.values())):
+        if local in ctx.hoisted:
+            lines.append(f"    {local} = vars[{ctx.hoisted[local]!r}]")
+        else:
+            lines.append(f"    {local} = __unset")
+    scans = ctx.scans.automata if ctx.scans is not None else []
+    lines.extend(f"    __a{index} = __unset" for index in range(len(scans)))
+    lines.extend(f"    {line}" for line in body)
+    bound_patterns = tuple(
+        (search, pattern, ctx.untrusted) for pattern, search in ctx.patterns.items()
+    )
+    namespace = _namespace({**(namespace or {}), **_bind_patterns(bound_patterns)})
+    for index, automaton in enumerate(scans):
+        namespace[f"__scan{index}"] = automaton.search
+    exec("\n".join(lines), namespace)
+    return namespace[name]
+
+
+def _namespace(extra: dict[str, typing.Any] | None = None) -> dict[str, typing.Any]:
+    # globals of compiled functions
+    return {
+        **(extra or {}),
+        "__unset": _unset,
+        "__strings": (str, bytes),
+        "__string_too_long": _string_too_long,
+        "__lshift": _untrusted_lshift,
+        "__isawaitable": inspect.isawaitable,
+        "__gather": _gather,
+        "__address": address_key,
+    }
+
+
+def _bind_patterns(
+    bound: tuple[tuple[str, bytes | str, bool], ...],
+) -> dict[str, typing.Any]:
+    # the search methods of the patterns of a compiled function, bound is kept
+    # in __patterns, so the rule cache can bind them again
+    namespace: dict[str, typing.Any] = {
+        search: patterns.compile_pattern(pattern, untrusted).search
+        for search, pattern, untrusted in bound
+    }
+    namespace["__patterns"] = bound
+    return namespace
+
+
+def _instrumented_namespace(profile: Profile) -> dict[str, typing.Any]:
+    return {"__record": profile.record, "__now": time.perf_counter_ns}
+
+
+def _gather(*calls: tuple[typing.Any, ...]) -> asyncio.Future[list[typing.Any]]:
+    # calls every (function, *arguments) tuple concurrently
+    return asyncio.gather(*(_call(*call) for call in calls))
+
+
+async def _call(function: typing.Any, *args: typing.Any) -> typing.Any:
+    value = function(*args)
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def _compile_context(
+    exprs: typing.Iterable[ast.ExpressionLike],
+    untrusted: bool,
+    pure_functions: typing.Collection[str],
+    unconditional: typing.Iterable[ast.ExpressionLike],
+    variables: typing.Sequence[str] | None = None,
+    functions: Functions | None = None,
+    asynchronous: bool = False,
+    recorded: dict[int, int] | None = None,
+    scan_strings: bool = False,
+) -> CompileContext:
+    exprs = tuple(exprs)
+    # variables passed as arguments are locals already and aren't cached
+    numbers = _common_subexpressions(exprs, pure_functions, variables is None)
+    cached = {node: f"__c{number}" for node, number in numbers.items()}
+    # repeated variables which are looked up on every call anyway are loaded
+    # upfront instead of lazily, exprs in unconditional are always evaluated
+    hoisted: dict[str, str] = {}
+    for expr in unconditional:
+        for variable in _unconditional_variables(expr):
+            if id(variable) in cached:
+                hoisted[cached[id(variable)]] = variable.name
+
+    arguments = bound_functions = None
+    if variables is not None:
+        arguments = {key: f"__v{index}" for index, key in enumerate(variables)}
+    if functions is not None:
+        bound_functions = {key: f"__f{index}" for index, key in enumerate(functions)}
+    return CompileContext(
+        untrusted,
+        cached,
+        hoisted,
+        itertools.count(),
+        {},
+        arguments,
+        bound_functions,
+        {} if asynchronous else None,
+        recorded,
+        _string_scans(exprs) if scan_strings else None,
+    )
+
+
+def _string_scans(exprs: typing.Iterable[ast.ExpressionLike]) -> StringScans:
+    # contains tests of the same variable with many different needles are
+    # answered by one automaton, which searches for all of them in one pass
+    groups: dict[tuple[str, type], dict[bytes | str, list[int]]] = {}
+    for expr in exprs:
+        for node in _nodes(expr):
+            match node:
+                case ast.StringTest("contains", ast.Variable(name), needle):
+                    needles = groups.setdefault((name, type(needle)), {})
+                    needles.setdefault(needle, []).append(id(node))
+
+    scans = StringScans({}, [])
+    for needles in groups.values():
+        if len(needles) < MIN_AUTOMATON_NEEDLES:
+            continue
+        for index, tests in enumerate(needles.values()):
+            for test in tests:
+                scans.tests[test] = (len(scans.automata), index)
+        scans.automata.append(Automaton(list(needles)))
+    return scans
+
+
+def _unconditional_variables(
+    expr: ast.ExpressionLike,
+) -> typing.Generator[ast.Variable, None, None]:
+    match expr:
+        case ast.Variable():
+            yield expr
+        case ast.Block(inner):
+            yield from _unconditional_variables(inner)
+        case ast.BinaryOperation("and" | "or", left, _):
+            yield from _unconditional_variables(left)
+        case ast.BinaryOperation(_, left, right):
+            yield from _unconditional_variables(left)
+            yield from _unconditional_variables(right)
+        case ast.All(values) | ast.Any(values):
+            yield from _unconditional_variables(values[0])
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            yield from _unconditional_variables(value)
+        case ast.FunctionCall(_, arguments):
+            for argument in arguments:
+                yield from _unconditional_variables(argument)
+
+
+def _common_subexpressions(
+    exprs: typing.Iterable[ast.ExpressionLike],
+    pure_functions: typing.Collection[str] = (),
+    variables: bool = True,
+) -> dict[int, int]:
+    # value numbering: structurally equal subexpressions get the same number,
+    # returns the number of every node (by id) whose value is needed more than
+    # once, variables are left out with variables=False
+    ctx = NumberingContext({}, {}, pure_functions, variables)
+    exprs = tuple(exprs)
+    for expr in exprs:
+        _number(expr, ctx)
+
+    counts: dict[int, int] = {}
+    for expr in exprs:
+        _count(expr, ctx.numbers, counts)
+    return {node: number for node, number in ctx.numbers.items() if counts[number] > 1}
+
+
+class NumberingContext(typing.NamedTuple):
+    numbers: dict[int, int]
+    keys: dict[typing.Hashable, int]
+    pure_functions: typing.Collection[str]
+    variables: bool
+
+
+def _number(expr: ast.ExpressionLike, ctx: NumberingContext) -> int:
+    if id(expr) in ctx.numbers:
+        return ctx.numbers[id(expr)]
+
+    key: typing.Hashable
+    match expr:
+        case ast.Block(inner):
+            return _number(inner, ctx)  # blocks are transparent
+        case ast.Constant(value):
+            # the type is part of the key, because 1 == 1.0 == True,
+            # constants themselves are never cached
+            key = ("constant", type(value), value)
+            return ctx.keys.setdefault(key, len(ctx.keys))
+        case ast.Variable(name):
+            key = ("variable", name)
+            if not ctx.variables:
+                return ctx.keys.setdefault(key, len(ctx.keys))
+        case ast.BinaryOperation(operator, left, right):
+            key = ("binary", operator, _number(left, ctx), _number(right, ctx))
+        case ast.All(values) | ast.Any(values):
+            key = (type(expr).__name__, tuple(_number(value, ctx) for value in values))
+        case ast.UnaryOperation(operator, value):
+            key = ("unary", operator, _number(value, ctx))
+        case ast.Membership(value, values):
+            key = ("membership", values, _number(value, ctx))
+        case ast.NetworkMembership(value, networks):
+            key = ("networks", networks, _number(value, ctx))
+        case ast.Matches(value, pattern):
+            key = ("matches", type(pattern), pattern, _number(value, ctx))
+        case ast.StringTest(operator, value, needle):
+            key = ("string", operator, type(needle), needle, _number(value, ctx))
         case ast.FunctionCall(name, arguments):
-            args = ", ".join(_compile(arg, untrusted) for arg in arguments)
-            return f"fns[{name!r}]({args})"
+            numbered = tuple(_number(argument, ctx) for argument in arguments)
+            if name in ctx.pure_functions:
+                key = ("call", name, numbered)
+            else:  # impure functions are called every time
+                key = ("call", id(expr))
+        case _:
+            raise RuntimeError(f"unknown ast node: {expr}")
+
+    number = ctx.numbers[id(expr)] = ctx.keys.setdefault(key, len(ctx.keys))
+    return number
+
+
+def _count(
+    expr: ast.ExpressionLike, numbers: dict[int, int], counts: dict[int, int]
+) -> None:
+    # counts how often the value of each node is needed, the operands of a
+    # repeated node are only needed the first time
+    if id(expr) in numbers:
+        number = numbers[id(expr)]
+        counts[number] = counts.get(number, 0) + 1
+        if counts[number] > 1:
+            return
 
-    raise RuntimeError(f"unknown ast node: {expr}")
+    match expr:
+        case ast.Block(inner):
+            _count(inner, numbers, counts)
+        case ast.BinaryOperation(_, left, right):
+            _count(left, numbers, counts)
+            _count(right, numbers, counts)
+        case ast.All(values) | ast.Any(values):
+            for value in values:
+                _count(value, numbers, counts)
+        case (
+            ast.UnaryOperation(_, value)
+            | ast.Membership(value, _)
+            | ast.NetworkMembership(value, _)
+            | ast.Matches(value, _)
+            | ast.StringTest(_, value, _)
+        ):
+            _count(value, numbers, counts)
+        case ast.FunctionCall(_, arguments):
+            for argument in arguments:
+                _count(argument, numbers, counts)
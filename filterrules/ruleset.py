@@ -0,0 +1,124 @@
+import functools
+import typing
+
+from . import ast, optimizer, serialize, stream
+from .instrumentation import Profile
+from .rule import (
+    Functions,
+    Rule,
+    Variables,
+    _compile,
+    _compile_context,
+    _define,
+    _instrumented_namespace,
+)
+
+RuleId = typing.Hashable
+
+
+class Ruleset(typing.NamedTuple):
+    rules: tuple[tuple[RuleId, ast.ExpressionLike], ...]
+    untrusted: bool = True
+
+    def evaluate(self, variables: Variables, functions: Functions) -> list[RuleId]:
+        return [
+            rule_id
+            for rule_id, expr in self.rules
+            if Rule(expr, self.untrusted).evaluate(variables, functions)
+        ]
+
+    def compile(
+        self, optimize: bool = False, pure_functions: typing.Collection[str] = ()
+    ) -> typing.Callable[[Variables, Functions], list[RuleId]]:
+        fn = self._compile(_MATCH_ALL, optimize, pure_functions)
+        return typing.cast(typing.Callable[[Variables, Functions], list[RuleId]], fn)
+
+    def compile_first(
+        self, optimize: bool = False, pure_functions: typing.Collection[str] = ()
+    ) -> typing.Callable[[Variables, Functions], RuleId | None]:
+        fn = self._compile(_MATCH_FIRST, optimize, pure_functions)
+        return typing.cast(typing.Callable[[Variables, Functions], RuleId | None], fn)
+
+    def compile_instrumented(
+        self,
+        profile: Profile,
+        optimize: bool = False,
+        pure_functions: typing.Collection[str] = (),
+    ) -> typing.Callable[[Variables, Functions], list[RuleId]]:
+        # see Rule.compile_instrumented, every rule is recorded with its id
+        fn = self._compile(_MATCH_ALL, optimize, pure_functions, profile)
+        return typing.cast(typing.Callable[[Variables, Functions], list[RuleId]], fn)
+
+    def filter(
+        self,
+        records: typing.Iterable[stream.Record],
+        functions: Functions,
+        processes: int | None = None,
+        chunksize: int = 1000,
+        optimize: bool = False,
+    ) -> typing.Iterator[tuple[stream.Record, list[RuleId]]]:
+        # yields records matching any rule with the ids of the matching rules
+        rules = tuple((rule_id, serialize.dump(expr)) for rule_id, expr in self.rules)
+        load_matcher = functools.partial(
+            _load_matcher, rules, self.untrusted, functions, optimize
+        )
+        return stream.filter_records(records, load_matcher, processes, chunksize)
+
+    def _compile(
+        self,
+        match: str,
+        optimize: bool,
+        pure_functions: typing.Collection[str],
+        profile: Profile | None = None,
+    ) -> typing.Any:
+        exprs = [expr for _, expr in self.rules]
+        if optimize:
+            # only the truthiness of a rule decides if it matches
+            exprs = [
+                optimizer.optimize(expr, self.untrusted, boolean=True) for expr in exprs
+            ]
+
+        # subexpressions shared by multiple rules (or repeated within one) are
+        # evaluated once per call and kept in local variables
+        # the first rule is always evaluated, the others aren't when only the
+        # first match is returned
+        unconditional = exprs if match == _MATCH_ALL else exprs[:1]
+        ids = tuple(rule_id for rule_id, _ in self.rules)
+        recorded = namespace = None
+        if profile is not None:
+            recorded = {}
+            for rule_id, expr in zip(ids, exprs):
+                recorded.update(profile.register(expr, rule_id))
+            namespace = _instrumented_namespace(profile)
+        ctx = _compile_context(
+            exprs,
+            self.untrusted,
+            pure_functions,
+            unconditional,
+            recorded=recorded,
+            scan_strings=True,
+        )
+        body = ["matches = []"] if match == _MATCH_ALL else []
+        for index, expr in enumerate(exprs):
+            body.append(f"if {_compile(expr, ctx)}:")
+            body.append("    " + match % index)
+        body.append("return " + ("matches" if match == _MATCH_ALL else "None"))
+
+        return _define("ruleset", body, ctx, {**(namespace or {}), "__ids": ids})
+
+
+def _load_matcher(
+    rules: tuple[tuple[RuleId, bytes], ...],
+    untrusted: bool,
+    functions: Functions,
+    optimize: bool,
+) -> stream.Matcher:
+    ruleset = Ruleset(
+        tuple((rule_id, serialize.load(data)) for rule_id, data in rules), untrusted
+    )
+    compiled = ruleset.compile(optimize)
+    return lambda record: compiled(record, functions)
+
+
+_MATCH_ALL = "matches.append(__ids[%d])"
+_MATCH_FIRST = "return __ids[%d]"
@@ -0,0 +1,301 @@
+import ipaddress
+import struct
+import typing
+
+from . import ast
+from .networks import NetworkSet
+from .parser import _max_depth
+
+# a dump is the magic, a table of the variable and function names and the
+# nodes in prefix order, every node starts with a tag byte
+_MAGIC = b"FRA\x01"
+(
+    _INT,
+    _NEGATIVE_INT,
+    _FLOAT,
+    _BYTES,
+    _STR,
+    _FALSE,
+    _TRUE,
+    _VARIABLE,
+    _BLOCK,
+    _BINARY,
+    _ALL,
+    _ANY,
+    _UNARY,
+    _CALL,
+    _MEMBERSHIP,
+    _NETWORK_MEMBERSHIP,
+    _MATCHES,
+    _STRING_TEST,
+) = range(18)
+_BINARY_OPERATORS: tuple[ast.BinaryOperator, ...] = typing.get_args(ast.BinaryOperator)
+_UNARY_OPERATORS: tuple[ast.UnaryOperator, ...] = typing.get_args(ast.UnaryOperator)
+_STRING_OPERATORS: tuple[ast.StringOperator, ...] = typing.get_args(ast.StringOperator)
+_FLOAT_FORMAT = struct.Struct("<d")
+# enough for any integer the parser accepts (4300 digits)
+_MAX_VARINT_BYTES = 2048
+# as deep as the parser allows, counting the leaves
+MAX_DEPTH = _max_depth + 1
+
+
+def dump(expr: ast.ExpressionLike) -> bytes:
+    names: dict[str, int] = {}
+    body = bytearray()
+    _dump(expr, body, names)
+    output = bytearray(_MAGIC)
+    _write_varint(output, len(names))
+    for name in names:
+        _write_bytes(output, name.encode())
+    output += body
+    return bytes(output)
+
+
+def load(data: bytes, max_depth: int = MAX_DEPTH) -> ast.ExpressionLike:
+    if not data.startswith(_MAGIC):
+        raise ValueError("not an ast dump")
+    reader = _Reader(data, len(_MAGIC))
+    count = reader.count()
+    names = tuple(reader.bytes().decode() for _ in range(count))
+    expr = _load(reader, names, max_depth)
+    if reader.position != len(data):
+        raise ValueError("unexpected data after ast dump")
+    return expr
+
+
+def _dump(expr: ast.ExpressionLike, output: bytearray, names: dict[str, int]) -> None:
+    match expr:
+        case ast.Constant(bool(value)):
+            output.append(_TRUE if value else _FALSE)
+
+        case ast.Constant(int(value)):
+            output.append(_INT if value >= 0 else _NEGATIVE_INT)
+            _write_varint(output, abs(value))
+
+        case ast.Constant(float(value)):
+            output.append(_FLOAT)
+            output += _FLOAT_FORMAT.pack(value)
+
+        case ast.Constant(bytes(value)):
+            output.append(_BYTES)
+            _write_bytes(output, value)
+
+        case ast.Constant(str(value)):
+            output.append(_STR)
+            _write_bytes(output, value.encode())
+
+        case ast.Variable(key):
+            output.append(_VARIABLE)
+            _write_varint(output, names.setdefault(key, len(names)))
+
+        case ast.Block(inner):
+            output.append(_BLOCK)
+            _dump(inner, output, names)
+
+        case ast.BinaryOperation(operator, left, right):
+            output.append(_BINARY)
+            output.append(_BINARY_OPERATORS.index(operator))
+            _dump(left, output, names)
+            _dump(right, output, names)
+
+        case ast.All(values) | ast.Any(values):
+            output.append(_ALL if isinstance(expr, ast.All) else _ANY)
+            _write_varint(output, len(values))
+            for value in values:
+                _dump(value, output, names)
+
+        case ast.UnaryOperation(operator, value):
+            output.append(_UNARY)
+            output.append(_UNARY_OPERATORS.index(operator))
+            _dump(value, output, names)
+
+        case ast.FunctionCall(name, arguments):
+            output.append(_CALL)
+            _write_varint(output, names.setdefault(name, len(names)))
+            _write_varint(output, len(arguments))
+            for arg in arguments:
+                _dump(arg, output, names)
+
+        case ast.Membership(value, values):
+            output.append(_MEMBERSHIP)
+            _dump(value, output, names)
+            _write_varint(output, len(values))
+            for item in values:
+                _dump(ast.Constant(item), output, names)
+
+        case ast.NetworkMembership(value, networks):
+            # networks are stored as the packed address and the prefix length
+            output.append(_NETWORK_MEMBERSHIP)
+            _dump(value, output, names)
+            _write_varint(output, len(networks.networks))
+            for network in map(ipaddress.ip_network, networks.networks):
+                _write_bytes(output, network.network_address.packed)
+                output.append(network.prefixlen)
+
+        case ast.Matches(value, pattern):
+            output.append(_MATCHES)
+            _dump(value, output, names)
+            _dump(ast.Constant(pattern), output, names)
+
+        case ast.StringTest(operator, value, needle):
+            output.append(_STRING_TEST)
+            output.append(_STRING_OPERATORS.index(operator))
+            _dump(value, output, names)
+            _dump(ast.Constant(needle), output, names)
+
+        case _:
+            raise RuntimeError(f"unknown ast node: {expr}")
+
+
+def _load(reader: "_Reader", names: tuple[str, ...], depth: int) -> ast.ExpressionLike:
+    if depth <= 0:
+        raise ValueError("ast dump is nested too deep")
+    depth -= 1
+
+    data = reader.data
+    position = reader.position
+    if position >= len(data):
+        raise ValueError("unexpected end of ast dump")
+    tag = data[position]
+    reader.position = position + 1
+    if tag == _VARIABLE:
+        return ast.Variable(reader.name(names))
+    elif tag == _BINARY:
+        binary = reader.operator(_BINARY_OPERATORS)
+        left = _load(reader, names, depth)
+        return ast.BinaryOperation(binary, left, _load(reader, names, depth))
+    elif tag == _INT:
+        return ast.Constant(reader.varint())
+    elif tag == _BYTES:
+        return ast.Constant(reader.bytes())
+    elif tag == _ALL or tag == _ANY:
+        count = reader.count()
+        if count < 2:  # the parser and optimizer never build shorter chains
+            raise ValueError("invalid ast dump")
+        values = tuple([_load(reader, names, depth) for _ in range(count)])
+        return ast.All(values) if tag == _ALL else ast.Any(values)
+    elif tag == _NEGATIVE_INT:
+        return ast.Constant(-reader.varint())
+    elif tag == _FLOAT:
+        return ast.Constant(_FLOAT_FORMAT.unpack(reader.read(8))[0])
+    elif tag == _STR:
+        return ast.Constant(reader.bytes().decode())
+    elif tag == _FALSE or tag == _TRUE:
+        return ast.Constant(tag == _TRUE)
+    elif tag == _BLOCK:
+        return ast.Block(_load(reader, names, depth))
+    elif tag == _UNARY:
+        unary = reader.operator(_UNARY_OPERATORS)
+        return ast.UnaryOperation(unary, _load(reader, names, depth))
+    elif tag == _CALL:
+        name = reader.name(names)
+        arguments = tuple([_load(reader, names, depth) for _ in range(reader.count())])
+        return ast.FunctionCall(name, arguments)
+    elif tag == _MEMBERSHIP:
+        value = _load(reader, names, depth)
+        items = [_load(reader, names, depth) for _ in range(reader.count())]
+        if not all(isinstance(item, ast.Constant) for item in items):
+            raise ValueError("membership test of non-constants in ast dump")
+        return ast.Membership(
+            value, frozenset(typing.cast(ast.Constant, item).value for item in items)
+        )
+    elif tag == _NETWORK_MEMBERSHIP:
+        value = _load(reader, names, depth)
+        networks = []
+        for _ in range(reader.count()):
+            address, length = reader.bytes(), reader.byte()
+            if len(address) not in (4, 16):
+                raise ValueError("invalid network in ast dump")
+            networks.append(f"{ipaddress.ip_address(address)}/{length}")
+        try:
+            return ast.NetworkMembership(value, NetworkSet(networks))
+        except ValueError:
+            raise ValueError("invalid network in ast dump") from None
+    elif tag == _MATCHES:
+        value = _load(reader, names, depth)
+        match _load(reader, names, depth):
+            case ast.Constant(bytes(pattern)):
+                return ast.Matches(value, pattern)
+            case ast.Constant(str(text)):
+                return ast.Matches(value, text)
+        raise ValueError("matches with a non-string pattern in ast dump")
+    elif tag == _STRING_TEST:
+        operator = reader.operator(_STRING_OPERATORS)
+        value = _load(reader, names, depth)
+        match _load(reader, names, depth):
+            case ast.Constant(bytes(needle)):
+                return ast.StringTest(operator, value, needle)
+            case ast.Constant(str(text)):
+                return ast.StringTest(operator, value, text)
+        raise ValueError(f"{operator} with a non-string needle in ast dump")
+    raise ValueError(f"unknown ast node tag: {tag}")
+
+
+class _Reader:
+    __slots__ = ("data", "position")
+
+    def __init__(self, data: bytes, position: int) -> None:
+        self.data = data
+        self.position = position
+
+    def byte(self) -> int:
+        if self.position >= len(self.data):
+            raise ValueError("unexpected end of ast dump")
+        self.position += 1
+        return self.data[self.position - 1]
+
+    def read(self, length: int) -> bytes:
+        end = self.position + length
+        if end > len(self.data):
+            raise ValueError("unexpected end of ast dump")
+        value = self.data[self.position : end]
+        self.position = end
+        return value
+
+    def varint(self) -> int:
+        byte = self.byte()
+        if byte < 0x80:  # fast path for small integers
+            return byte
+        value = byte & 0x7F
+        shift = 7
+        for _ in range(_MAX_VARINT_BYTES - 1):
+            byte = self.byte()
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+        raise ValueError("integer in ast dump is too big")
+
+    def count(self) -> int:
+        # every item takes at least one byte, larger counts can't be valid
+        count = self.varint()
+        if count > len(self.data) - self.position:
+            raise ValueError("unexpected end of ast dump")
+        return count
+
+    def bytes(self) -> bytes:
+        return self.read(self.count())
+
+    def name(self, names: tuple[str, ...]) -> str:
+        index = self.varint()
+        if index >= len(names):
+            raise ValueError(f"unknown name in ast dump: {index}")
+        return names[index]
+
+    def operator(self, operators: tuple[typing.Any, ...]) -> typing.Any:
+        index = self.byte()
+        if index >= len(operators):
+            raise ValueError(f"unknown operator in ast dump: {index}")
+        return operators[index]
+
+
+def _write_varint(output: bytearray, value: int) -> None:
+    while value >= 0x80:
+        output.append(value & 0x7F | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def _write_bytes(output: bytearray, value: bytes) -> None:
+    _write_varint(output, len(value))
+    output += value
@@ -0,0 +1,54 @@
+import itertools
+import multiprocessing
+import typing
+
+Record = dict[str, typing.Any]
+Matcher = typing.Callable[[Record], typing.Any]
+
+# set in every worker process by _initialize
+_matcher: Matcher | None = None
+
+
+def filter_records(
+    records: typing.Iterable[Record],
+    load_matcher: typing.Callable[[], Matcher],
+    processes: int | None = None,
+    chunksize: int = 1000,
+) -> typing.Iterator[tuple[Record, typing.Any]]:
+    # yields the records with a truthy result of the matcher, together with the
+    # result, load_matcher is sent to every worker once and must be picklable
+    if processes is None:
+        matcher = load_matcher()
+        for record in records:
+            result = matcher(record)
+            if result:
+                yield record, result
+        return
+
+    chunks = _chunks(iter(records), chunksize)
+    with multiprocessing.Pool(processes, _initialize, (load_matcher,)) as pool:
+        for matches in pool.imap(_match_chunk, chunks):
+            yield from matches
+
+
+def _chunks(
+    records: typing.Iterator[Record], chunksize: int
+) -> typing.Iterator[list[Record]]:
+    while chunk := list(itertools.islice(records, chunksize)):
+        yield chunk
+
+
+def _initialize(load_matcher: typing.Callable[[], Matcher]) -> None:
+    global _matcher
+    _matcher = load_matcher()
+
+
+def _match_chunk(chunk: list[Record]) -> list[tuple[Record, typing.Any]]:
+    # only matching records are sent back to the parent process
+    assert _matcher is not None
+    matches = []
+    for record in chunk:
+        result = _matcher(record)
+        if result:
+            matches.append((record, result))
+    return matches
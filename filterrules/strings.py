@@ -0,0 +1,70 @@
+import typing
+
+# contains tests of one variable are only answered by an automaton when there
+# are at least this many different needles, for fewer needles separate
+# substring searches are faster
+MIN_AUTOMATON_NEEDLES = 32
+
+
+class Automaton:
+    # aho-corasick automaton, finds which of many needles occur in a text with
+    # a single pass over the text, needles are all bytes or all str
+    __slots__ = ("needles", "_kind", "_goto", "_fail", "_outputs")
+
+    def __init__(self, needles: typing.Sequence[bytes | str]) -> None:
+        self.needles = tuple(needles)
+        self._kind = type(self.needles[0]) if self.needles else bytes
+        if not all(type(needle) is self._kind for needle in self.needles):
+            raise TypeError("needles must be all bytes or all str")
+
+        # a trie of the needles, states are indexes, outputs are the indexes of
+        # the needles ending in a state
+        goto: list[dict[typing.Any, int]] = [{}]
+        outputs: list[set[int]] = [set()]
+        for index, needle in enumerate(self.needles):
+            state = 0
+            for char in needle:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                state = goto[state][char]
+            outputs[state].add(index)
+
+        # the failure link of a state points to the state of its longest proper
+        # suffix in the trie, states are visited breadth first so the links of
+        # shorter states are known
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, child in goto[state].items():
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[child] = goto[link].get(char, 0)
+                outputs[child] |= outputs[fail[child]]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = tuple(tuple(sorted(output)) for output in outputs)
+
+    def search(self, text: typing.Any) -> set[int]:
+        # the indexes of the needles occurring in text
+        if not isinstance(text, self._kind):
+            raise TypeError(
+                f"cannot search for {self._kind.__name__} in "
+                f"{type(text).__name__}"
+            )
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found = set(outputs[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
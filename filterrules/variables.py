@@ -0,0 +1,23 @@
+import typing
+
+Resolver = typing.Callable[["LazyVariables"], typing.Any]
+
+
+class LazyVariables(dict[str, typing.Any]):
+    # variables which are computed the first time a rule reads them, the result
+    # is kept, so every resolver is called at most once per instance
+    __slots__ = ("resolvers",)
+
+    def __init__(
+        self,
+        values: typing.Mapping[str, typing.Any] | None = None,
+        resolvers: typing.Mapping[str, Resolver] | None = None,
+    ) -> None:
+        super().__init__(values or {})
+        self.resolvers = resolvers or {}
+
+    def __missing__(self, key: str) -> typing.Any:
+        if key not in self.resolvers:
+            raise KeyError(key)
+        value = self[key] = self.resolvers[key](self)
+        return value
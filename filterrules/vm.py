@@ -0,0 +1,256 @@
+import functools
+import operator
+import typing
+
+from . import ast
+from .patterns import compile_pattern
+from .rule import (
+    Functions,
+    Variables,
+    _string_test,
+    _string_too_long,
+    _untrusted_lshift,
+)
+
+# instructions are stored flat as (opcode, operand) pairs, all jumps go
+# forward, so a program never executes more instructions than it has
+(
+    _CONSTANT,
+    _VARIABLE,
+    _BINARY,
+    _BINARY_UNTRUSTED,
+    _UNARY,
+    _CALL,
+    _JUMP_IF_FALSE_OR_POP,
+    _JUMP_IF_TRUE_OR_POP,
+    _JUMP_IF_FALSE,
+    _JUMP_IF_TRUE,
+    _CHECK_STRING,
+    _MEMBERSHIP,
+    _MEMBERSHIP_UNTRUSTED,
+    _MATCHES,
+) = range(14)
+
+
+def _untrusted_add(left: typing.Any, right: typing.Any) -> typing.Any:
+    r = left + right
+    if isinstance(r, (str, bytes)) and len(r) >= 65536:
+        _string_too_long()
+    return r
+
+
+def _untrusted_pow(left: typing.Any, right: typing.Any) -> typing.NoReturn:
+    raise RuntimeError("pow operation (**) is disabled in untrusted mode")
+
+
+_BINARY_FUNCTIONS: dict[str, typing.Callable[[typing.Any, typing.Any], typing.Any]] = {
+    "add": operator.add,
+    "subtract": operator.sub,
+    "multiply": operator.mul,
+    "divide": operator.truediv,
+    "modulo": operator.mod,
+    "pow": operator.pow,
+    "equals": operator.eq,
+    "not-equals": operator.ne,
+    "greater-than": operator.gt,
+    "greater-than-or-equals": operator.ge,
+    "less-than": operator.lt,
+    "less-than-or-equals": operator.le,
+    "band": operator.and_,
+    "bor": operator.or_,
+    "bxor": operator.xor,
+    "lshift": operator.lshift,
+    "rshift": operator.rshift,
+}
+_UNTRUSTED_BINARY_FUNCTIONS = {
+    **_BINARY_FUNCTIONS,
+    "add": _untrusted_add,
+    "pow": _untrusted_pow,
+    "lshift": _untrusted_lshift,
+}
+_UNARY_FUNCTIONS: dict[str, typing.Callable[[typing.Any], typing.Any]] = {
+    "not": operator.not_,
+    "plus": operator.pos,
+    "minus": operator.neg,
+    "bnot": operator.invert,
+}
+
+
+class Program(typing.NamedTuple):
+    code: tuple[typing.Any, ...]
+    untrusted: bool = True
+
+    @property
+    def steps(self) -> int:
+        return len(self.code) // 2
+
+    def evaluate(self, variables: Variables, functions: Functions) -> typing.Any:
+        code = self.code
+        stack: list[typing.Any] = []
+        push = stack.append
+        pop = stack.pop
+        position = 0
+        end = len(code)
+        while position < end:
+            opcode = code[position]
+            operand = code[position + 1]
+            position += 2
+            if opcode == _VARIABLE:
+                push(variables[operand])
+            elif opcode == _CONSTANT:
+                push(operand)
+            elif opcode == _BINARY:
+                right = pop()
+                stack[-1] = operand(stack[-1], right)
+            elif opcode == _BINARY_UNTRUSTED:
+                right = pop()
+                left = stack[-1]
+                if isinstance(left, (str, bytes)) and not isinstance(
+                    right, (str, bytes)
+                ):
+                    _non_string_right_value()
+                stack[-1] = operand(left, right)
+            elif opcode == _JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                else:
+                    position = operand
+            elif opcode == _JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    position = operand
+                else:
+                    pop()
+            elif opcode == _JUMP_IF_FALSE:
+                if not stack[-1]:
+                    position = operand
+            elif opcode == _JUMP_IF_TRUE:
+                if stack[-1]:
+                    position = operand
+            elif opcode == _CHECK_STRING:
+                # replaces the previous operand of a chain with the next one
+                right = pop()
+                if isinstance(stack[-1], (str, bytes)) and not isinstance(
+                    right, (str, bytes)
+                ):
+                    _non_string_right_value()
+                stack[-1] = right
+            elif opcode == _UNARY:
+                stack[-1] = operand(stack[-1])
+            elif opcode == _MEMBERSHIP:
+                stack[-1] = stack[-1] in operand
+            elif opcode == _MEMBERSHIP_UNTRUSTED:
+                # only used when operand contains non-strings
+                if isinstance(stack[-1], (str, bytes)):
+                    _non_string_right_value()
+                stack[-1] = stack[-1] in operand
+            elif opcode == _MATCHES:
+                stack[-1] = operand(stack[-1]) is not None
+            elif opcode == _CALL:
+                name, count = operand
+                if count:
+                    args = stack[-count:]
+                    del stack[-count:]
+                else:
+                    args = []
+                push(functions[name](*args))
+        return stack[-1]
+
+
+def compile(
+    expr: ast.ExpressionLike, untrusted: bool = True, max_steps: int | None = None
+) -> Program:
+    # the step budget is checked once here, evaluating a program can't
+    # take more steps than it has instructions
+    code: list[typing.Any] = []
+    _assemble(expr, code, untrusted)
+    program = Program(tuple(code), untrusted)
+    if max_steps is not None and program.steps > max_steps:
+        raise RuntimeError(
+            f"program takes {program.steps} steps, more than the allowed {max_steps}"
+        )
+    return program
+
+
+def _non_string_right_value() -> typing.NoReturn:
+    raise RuntimeError(
+        "cannot use non-string right-value on a string in untrusted mode"
+    )
+
+
+def _assemble(
+    expr: ast.ExpressionLike, code: list[typing.Any], untrusted: bool
+) -> None:
+    match expr:
+        case ast.Block(inner):
+            _assemble(inner, code, untrusted)
+
+        case ast.Constant(value):
+            code += (_CONSTANT, value)
+
+        case ast.Variable(key):
+            code += (_VARIABLE, key)
+
+        case ast.BinaryOperation("and", left, right):
+            _assemble(ast.All((left, right)), code, untrusted)
+
+        case ast.BinaryOperation("or", left, right):
+            _assemble(ast.Any((left, right)), code, untrusted)
+
+        case ast.BinaryOperation(op, left, right):
+            _assemble(left, code, untrusted)
+            _assemble(right, code, untrusted)
+            if untrusted:
+                code += (_BINARY_UNTRUSTED, _UNTRUSTED_BINARY_FUNCTIONS[op])
+            else:
+                code += (_BINARY, _BINARY_FUNCTIONS[op])
+
+        case ast.All(values) | ast.Any(values):
+            # in untrusted mode the previous operand stays on the stack until
+            # the next one is checked against it
+            is_all = isinstance(expr, ast.All)
+            if untrusted:
+                jump = _JUMP_IF_FALSE if is_all else _JUMP_IF_TRUE
+            else:
+                jump = _JUMP_IF_FALSE_OR_POP if is_all else _JUMP_IF_TRUE_OR_POP
+            jumps = []
+            _assemble(values[0], code, untrusted)
+            for value in values[1:]:
+                jumps.append(len(code) + 1)
+                code += (jump, None)
+                _assemble(value, code, untrusted)
+                if untrusted:
+                    code += (_CHECK_STRING, None)
+            for index in jumps:
+                code[index] = len(code)
+
+        case ast.UnaryOperation(op, value):
+            _assemble(value, code, untrusted)
+            code += (_UNARY, _UNARY_FUNCTIONS[op])
+
+        case ast.FunctionCall(name, arguments):
+            for arg in arguments:
+                _assemble(arg, code, untrusted)
+            code += (_CALL, (name, len(arguments)))
+
+        case ast.Membership(value, values):
+            _assemble(value, code, untrusted)
+            if untrusted and not all(isinstance(x, (str, bytes)) for x in values):
+                code += (_MEMBERSHIP_UNTRUSTED, values)
+            else:
+                code += (_MEMBERSHIP, values)
+
+        case ast.NetworkMembership(value, networks):
+            _assemble(value, code, untrusted)
+            code += (_MEMBERSHIP, networks)
+
+        case ast.Matches(value, pattern):
+            _assemble(value, code, untrusted)
+            code += (_MATCHES, compile_pattern(pattern, untrusted).search)
+
+        case ast.StringTest(operator, value, needle):
+            _assemble(value, code, untrusted)
+            test = functools.partial(_string_test, operator=operator, needle=needle)
+            code += (_UNARY, test)
+
+        case _:
+            raise RuntimeError(f"unknown ast node: {expr}")
@@ -16,4 +16,5 @@ setup(
     description="filter rules language",
     packages=find_namespace_packages(include=["filterrules*"]),
     package_data={"filterrules": ["py.typed"]},
+    extras_require={"numpy": ["numpy>=1.21"]},
 )
@@ -0,0 +1,11 @@
+import typing
+
+
+class CountingDict(dict[str, typing.Any]):
+    def __init__(self, *args: typing.Any) -> None:
+        super().__init__(*args)
+        self.lookups: dict[str, int] = {}
+
+    def __getitem__(self, key: str) -> typing.Any:
+        self.lookups[key] = self.lookups.get(key, 0) + 1
+        return super().__getitem__(key)
@@ -0,0 +1,104 @@
+import asyncio
+import gc
+import typing
+import warnings
+
+import pytest
+
+from filterrules.parser import parse
+from filterrules.rule import Rule
+
+from .helpers import CountingDict
+
+
+class Tracker:
+    def __init__(self) -> None:
+        self.calls: list[typing.Any] = []
+        self.running = 0
+        self.concurrent = 0
+
+    async def fn(self, value: typing.Any) -> typing.Any:
+        self.calls.append(value)
+        self.running += 1
+        self.concurrent = max(self.concurrent, self.running)
+        await asyncio.sleep(0)
+        self.running -= 1
+        return value
+
+
+def _evaluators(
+    rule: Rule,
+) -> list[typing.Callable[..., typing.Coroutine[typing.Any, typing.Any, typing.Any]]]:
+    return [rule.evaluate_async, rule.compile_async(), rule.compile_async(True)]
+
+
+@pytest.mark.parametrize(
+    "code",
+    (
+        b"fn(a) + fn(b) * 2",
+        b"fn(a) > 1 && fn(b) || sync(a)",
+        b"fn(fn(a) + sync(b)) - -fn(c)",
+        b"!(fn(a) || fn(c)) && a == b",
+    ),
+)
+def test_same_as_evaluate(code: bytes) -> None:
+    rule = Rule(parse(code))
+    for a, b, c in ((0, 1, 2), (2, 0, 1), (3, 3, 0)):
+        variables = {"a": a, "b": b, "c": c}
+        expected = rule.evaluate(variables, {"fn": lambda x: x, "sync": lambda x: x})
+        for evaluate in _evaluators(rule):
+            tracker = Tracker()
+            functions = {"fn": tracker.fn, "sync": lambda x: x}
+            assert asyncio.run(evaluate(variables, functions)) == expected
+
+
+def test_concurrent() -> None:
+    rule = Rule(parse(b"fn(a) + fn(b) + fn(fn(c)) > 2 && fn(a) + fn(b) > 1"))
+    for evaluate in _evaluators(rule):
+        tracker = Tracker()
+        variables = {"a": 1, "b": 1, "c": 1}
+        assert asyncio.run(evaluate(variables, {"fn": tracker.fn})) is True
+        assert len(tracker.calls) == 6
+        assert tracker.concurrent == 3
+
+
+def test_short_circuit() -> None:
+    rule = Rule(parse(b"fn(a) && fn(b) + fn(c)"))
+    for evaluate in _evaluators(rule):
+        tracker = Tracker()
+        variables = {"a": 0, "b": 1, "c": 2}
+        assert asyncio.run(evaluate(variables, {"fn": tracker.fn})) == 0
+        assert tracker.calls == [0]
+
+
+def test_error_in_arguments() -> None:
+    # calls started before an argument raises are awaited or closed
+    rule = Rule(parse(b"fn(a) + fn(b)"))
+    for evaluate in _evaluators(rule):
+        tracker = Tracker()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with pytest.raises(KeyError):
+                asyncio.run(evaluate({"a": 1}, {"fn": tracker.fn}))
+            gc.collect()
+        assert [str(warning.message) for warning in caught] == []
+
+
+def test_variables_looked_up_once() -> None:
+    rule = Rule(parse(b"fn(a) + fn(a) + a"))
+    variables = CountingDict({"a": 1})
+    tracker = Tracker()
+    assert asyncio.run(rule.compile_async()(variables, {"fn": tracker.fn})) == 3
+    assert variables.lookups == {"a": 1}
+
+
+def test_untrusted() -> None:
+    rule = Rule(parse(b"fn(a) + fn(a)"))
+    for evaluate in _evaluators(rule):
+        with pytest.raises(RuntimeError, match="string longer than allowed"):
+            asyncio.run(evaluate({"a": b"x" * 40000}, {"fn": Tracker().fn}))
+
+
+def test_unknown_ast() -> None:
+    with pytest.raises(RuntimeError, match="unknown ast node: .+"):
+        asyncio.run(Rule(object).evaluate_async({}, {}))  # type: ignore
@@ -0,0 +1,134 @@
+import itertools
+import typing
+
+import pytest
+
+from filterrules.parser import parse
+from filterrules.rule import Rule
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize(
+    "code",
+    (
+        b"a + b * 2 - c % 3",
+        b"a / 2 + b",
+        b"a > b && b >= c || a == c",
+        b"!(a < b) && a != 0",
+        b"a & b | c ^ 1 << 2 >> 1",
+        b"-a + +b + ~c",
+        b"a in [1, -3] || b + c in [2]",
+    ),
+)
+def test_same_as_evaluate(code: bytes) -> None:
+    rule = Rule(parse(code))
+    values = (0, 1, 2, -3)
+    rows = list(itertools.product(values, repeat=3))
+    columns = {key: np.array(column) for key, column in zip("abc", zip(*rows))}
+    result = rule.evaluate_batch(columns)
+    assert len(result) == len(rows)
+    for row, value in zip(rows, result):
+        assert value == rule.evaluate(dict(zip("abc", row)), {})
+
+
+def test_networks() -> None:
+    rule = Rule(parse(b"ip in {10.0.0.0/8, 2001:db8::/32}"))
+    ips = np.array([b"10.1.1.1", b"11.1.1.1", b"2001:db8::1", b"x"])
+    assert rule.evaluate_batch({"ip": ips}).tolist() == [True, False, True, False]
+
+
+def test_matches() -> None:
+    rule = Rule(parse(b"path matches '^/api/'"))
+    paths = np.array([b"/api/x", b"/", b"/x/api/"])
+    assert rule.evaluate_batch({"path": paths}).tolist() == [True, False, False]
+
+
+def test_string_operators() -> None:
+    rule = Rule(parse(b"ua contains 'bot' || ua starts_with 'c' || ua ends_with '/1'"))
+    uas = np.array([b"a bot", b"curl/8", b"x/1", b"", b"b/12"])
+    assert rule.evaluate_batch({"ua": uas}).tolist() == [True, True, True, False, False]
+    uas = np.array([b"a bot", None, b"x/1"], dtype=object)
+    with pytest.raises(TypeError):
+        rule.evaluate_batch({"ua": uas})
+
+
+@pytest.mark.parametrize(
+    ("code", "values"),
+    (
+        (b"a << 64 > 0", [1, 2, 0]),
+        (b"a * a", [2**40, 3, -(2**32)]),
+        (b"a + 1 - a", [2**63 - 1, 0, -1]),
+        (b"-a", [-(2**63), 1, 0]),
+        (b"a ** 3", [2**21, -(2**22), 2]),
+        (b"3 ** a", [40, 2, 0]),
+    ),
+)
+def test_integer_overflow(code: bytes, values: list[int]) -> None:
+    # integers don't wrap around, like in the scalar evaluator
+    rule = Rule(parse(code), untrusted=False)
+    result = rule.evaluate_batch({"a": np.array(values)}).tolist()
+    assert result == [rule.evaluate({"a": value}, {}) for value in values]
+
+
+def test_strings() -> None:
+    rule = Rule(parse(b"path + '/' == 'a/' || path"))
+    result = rule.evaluate_batch({"path": np.array([b"a", b"b", b""])})
+    assert result.tolist() == [True, b"b", b""]
+
+
+def test_short_circuit() -> None:
+    calls = []
+
+    def fn(values: typing.Any) -> typing.Any:
+        calls.append(values.tolist())
+        return values * 10
+
+    rule = Rule(parse(b"a > 1 && fn(a) > 25"))
+    columns = {"a": np.array([0, 2, 3, 1])}
+    assert rule.evaluate_batch(columns, {"fn": fn}).tolist() == [
+        False,
+        False,
+        True,
+        False,
+    ]
+    assert calls == [[2, 3]]
+
+    # errors are only raised for rows which are reached
+    rule = Rule(parse(b"a == 0 || 10 / a > 2"))
+    assert rule.evaluate_batch(columns).tolist() == [True, True, True, True]
+    rule = Rule(parse(b"a == 1 || 10 / a > 2"))
+    with pytest.raises(ZeroDivisionError):
+        rule.evaluate_batch(columns)
+
+    # like the other evaluators negative shift counts raise
+    for code in (b"a == 0 || 1 >> a - 2", b"a == 0 || 1 << a - 2"):
+        with pytest.raises(ValueError, match="negative shift count"):
+            Rule(parse(code)).evaluate_batch(columns)
+        with pytest.raises(ValueError, match="negative shift count"):
+            Rule(parse(code)).evaluate({"a": 1}, {})
+
+
+def test_untrusted() -> None:
+    columns = {"a": np.array([1, 2]), "s": np.array([b"x" * 40000])}
+    with pytest.raises(RuntimeError, match=r"pow operation \(\*\*\) is disabled"):
+        Rule(parse(b"a ** 2")).evaluate_batch(columns)
+    result = Rule(parse(b"a ** 2"), untrusted=False).evaluate_batch(columns)
+    assert result.tolist() == [1, 4]
+    with pytest.raises(RuntimeError, match="lshift operation with too big values"):
+        Rule(parse(b"1 << a * 100")).evaluate_batch(columns)
+    with pytest.raises(RuntimeError, match="string longer than allowed"):
+        Rule(parse(b"s + s")).evaluate_batch(columns)
+    with pytest.raises(RuntimeError, match="cannot use non-string right-value"):
+        Rule(parse(b"s + 1")).evaluate_batch(columns)
+
+
+def test_constant() -> None:
+    assert Rule(parse(b"1 + 2")).evaluate_batch({}).tolist() == [3]
+    result = Rule(parse(b"1 + 2")).evaluate_batch({"a": np.zeros(3)})
+    assert result.tolist() == [3, 3, 3]
+
+
+def test_unknown_ast() -> None:
+    with pytest.raises(RuntimeError, match="unknown ast node: .+"):
+        Rule(object).evaluate_batch({})  # type: ignore
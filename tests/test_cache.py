@@ -0,0 +1,157 @@
+import mmap
+import threading
+import types
+import typing
+from pathlib import Path
+
+import pytest
+
+import filterrules.cache
+from filterrules.cache import RuleCache
+
+
+def test_cache() -> None:
+    cache = RuleCache()
+    compiled = cache.get(b"a > 1", {"a": int}, {})
+    assert compiled({"a": 2}, {}) is True
+    assert cache.get(b"a > 1", {"a": int}, {}) is compiled
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # the key includes the untrusted flag and the lint signature
+    assert cache.get(b"a > 1", {"a": int}, {}, untrusted=False) is not compiled
+    assert cache.get(b"a > 1", {"a": int, "b": str}, {}) is not compiled
+    assert cache.get(b"a > 1", {"a": int}, {"fn": ((), int)}) is not compiled
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert len(cache) == 4
+
+    cache.clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_lru_eviction() -> None:
+    cache = RuleCache(maxsize=2)
+    first = cache.get(b"1", {}, {})
+    cache.get(b"2", {}, {})
+    assert cache.get(b"1", {}, {}) is first
+    cache.get(b"3", {}, {})  # evicts 2, which was used least recently
+    assert len(cache) == 2
+    assert cache.get(b"1", {}, {}) is first
+    assert cache.misses == 3
+    cache.get(b"2", {}, {})
+    assert cache.misses == 4
+
+
+def test_errors() -> None:
+    cache = RuleCache()
+    with pytest.raises(RuntimeError, match="variable not found: 'a'"):
+        cache.get(b"a", {}, {})
+    with pytest.raises(SyntaxError):
+        cache.get(b"(", {}, {})
+    assert len(cache) == 0
+
+
+def test_threads() -> None:
+    cache = RuleCache(maxsize=10)
+
+    def worker() -> None:
+        for i in range(200):
+            assert cache.get(b"a + %d" % (i % 20), {"a": int}, {})({"a": 1}, {}) == (
+                1 + i % 20
+            )
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 10
+    assert cache.hits + cache.misses == 800
+
+
+def test_persistent_cache(tmp_path: Path) -> None:
+    path = tmp_path / "rules.cache"
+    cache = RuleCache()
+    cache.get(b"a > 1", {"a": int}, {})
+    cache.get(b"a + 'x'", {"a": bytes}, {}, untrusted=False)
+    cache.get(b"a in {10.0.0.0/8}", {"a": bytes}, {})
+    cache.get(b"a matches '^x{1,3}$'", {"a": bytes}, {})
+    cache.save(path)
+
+    cache = RuleCache()
+    assert cache.load(path) == 4
+    assert cache.get(b"a > 1", {"a": int}, {})({"a": 2}, {}) is True
+    assert cache.get(b"a + 'x'", {"a": bytes}, {}, untrusted=False)(
+        {"a": b"a"}, {}
+    ) == (b"ax")
+    assert cache.get(b"a in {10.0.0.0/8}", {"a": bytes}, {})({"a": b"10.0.0.1"}, {})
+    assert cache.get(b"a matches '^x{1,3}$'", {"a": bytes}, {})({"a": b"xx"}, {})
+    assert (cache.hits, cache.misses) == (4, 0)
+    # changed rules or signatures aren't found
+    cache.get(b"a > 2", {"a": int}, {})
+    cache.get(b"a + 'x'", {"a": bytes}, {})
+    assert (cache.hits, cache.misses) == (4, 2)
+
+    # rules from the file that weren't used are kept when saving again
+    cache = RuleCache()
+    cache.load(path)
+    cache.get(b"b", {"b": int}, {})
+    cache.save(path)
+    assert RuleCache().load(path) == 5
+
+
+def test_persistent_cache_invalidation(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "rules.cache"
+    assert RuleCache().load(path) == 0  # missing
+
+    cache = RuleCache()
+    cache.get(b"1 + 2", {}, {})
+    cache.save(path)
+    assert RuleCache(optimize=True).load(path) == 0
+    assert RuleCache(pure_functions=("fn",)).load(path) == 0
+    monkeypatch.setattr(filterrules.cache, "__version__", "0.0.0")
+    assert RuleCache().load(path) == 0
+    monkeypatch.undo()
+    assert RuleCache().load(path) == 1
+
+    path.write_bytes(path.read_bytes()[:40])
+    assert RuleCache().load(path) == 0
+    path.write_bytes(b"")
+    assert RuleCache().load(path) == 0
+
+
+def test_persistent_cache_closes_files(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = tmp_path / "rules.cache"
+    cache = RuleCache()
+    cache.get(b"1 + 2", {}, {})
+    cache.save(path)
+    valid = path.read_bytes()
+
+    opened: list[mmap.mmap] = []
+
+    def record(*args: typing.Any, **kwargs: typing.Any) -> mmap.mmap:
+        opened.append(mmap.mmap(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(
+        filterrules.cache,
+        "mmap",
+        types.SimpleNamespace(mmap=record, ACCESS_READ=mmap.ACCESS_READ),
+    )
+    assert RuleCache(optimize=True).load(path) == 0
+    path.write_bytes(b"FRCACHE0" + path.read_bytes()[8:])
+    assert RuleCache().load(path) == 0
+    assert len(opened) == 2 and all(data.closed for data in opened)
+
+    # replaced and cleared files are closed too
+    path.write_bytes(valid)
+    cache = RuleCache()
+    assert cache.load(path) == 1
+    assert cache.load(path) == 1
+    assert opened[2].closed and not opened[3].closed
+    cache.clear()
+    assert opened[3].closed
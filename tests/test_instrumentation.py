@@ -0,0 +1,95 @@
+import json
+
+from filterrules import Rule, Ruleset
+from filterrules.instrumentation import Profile
+from filterrules.parser import parse
+
+
+def test_rule() -> None:
+    rule = Rule(parse(b"(a > 1 && f(b)) || -a == 3"))
+    functions = {"f": lambda value: value}
+    profile = Profile()
+    fn = rule.compile_instrumented(profile)
+    for a, b in ((0, 1), (2, 0), (2, 1), (-3, 0)):
+        variables = {"a": a, "b": b}
+        assert fn(variables, functions) == rule.evaluate(variables, functions)
+
+    nodes = {node["path"]: node for node in profile.to_dict()["nodes"]}
+    assert list(nodes) == [
+        "0",
+        "0.0",
+        "0.0.0",
+        "0.0.0.0",
+        "0.0.1",
+        "0.0.1.0",
+        "0.1",
+        "0.1.0",
+        "0.1.0.0",
+    ]
+    assert nodes["0"]["node"] == "or"
+    assert (nodes["0"]["count"], nodes["0"]["truthy"]) == (4, 2)
+    # the && short circuits when a > 1 is false, the || when it is true
+    assert nodes["0.0.0"]["node"] == "greater-than"
+    assert nodes["0.0.0"]["count"] == 4
+    assert nodes["0.0.0"]["short_circuits"] == 2
+    assert nodes["0.0"]["short_circuits"] == 1
+    assert "short_circuits" not in nodes["0.0.1"]
+    assert (nodes["0.0.1"]["node"], nodes["0.0.1"]["count"]) == ("f()", 2)
+    assert nodes["0.1"]["count"] == 3
+    assert nodes["0.1.0.0"]["node"] == "a"
+    assert all(node["time_ns"] >= 0 for node in nodes.values())
+    assert nodes["0"]["time_ns"] >= nodes["0.0"]["time_ns"]
+
+    assert profile.to_dict()["rules"] == [
+        {"rule": None, "count": 4, "matches": 2, "time_ns": nodes["0"]["time_ns"]}
+    ]
+    json.dumps(profile.to_dict())
+
+    profile.reset()
+    assert all(node["count"] == 0 for node in profile.to_dict()["nodes"])
+
+
+def test_common_subexpressions() -> None:
+    # repeated pure calls are evaluated and recorded once
+    rule = Rule(parse(b"f(a) > 1 || f(a) < -1"))
+    calls = []
+
+    def f(value: int) -> int:
+        calls.append(value)
+        return value
+
+    functions = {"f": f}
+    profile = Profile()
+    fn = rule.compile_instrumented(profile, pure_functions=("f",))
+    assert fn({"a": 0}, functions) is False
+    assert len(calls) == 1
+    counts = {node["path"]: node["count"] for node in profile.to_dict()["nodes"]}
+    assert counts["0.0.0"] + counts["0.1.0"] == 1
+
+
+def test_ruleset() -> None:
+    ruleset = Ruleset(
+        ((1, parse(b"a > 1")), ("two", parse(b"a > 2 && b")), (3, parse(b"1")))
+    )
+    profile = Profile()
+    fn = ruleset.compile_instrumented(profile)
+    for a in range(5):
+        variables = {"a": a, "b": True}
+        assert fn(variables, {}) == ruleset.evaluate(variables, {})
+
+    rules = {rule["rule"]: rule for rule in profile.to_dict()["rules"]}
+    # constant rules have no nodes to record
+    assert list(rules) == [1, "two"]
+    assert (rules[1]["count"], rules[1]["matches"]) == (5, 3)
+    assert (rules["two"]["count"], rules["two"]["matches"]) == (5, 2)
+    nodes = [node for node in profile.to_dict()["nodes"] if node["rule"] == "two"]
+    assert nodes[1]["path"] == "0.0"
+    assert nodes[1]["short_circuits"] == 3
+
+
+def test_uninstrumented() -> None:
+    profile = Profile()
+    rule = Rule(parse(b"a > 1"))
+    rule.compile_instrumented(profile)
+    assert "__record" not in rule.compile().__globals__
+    assert "__record" in rule.compile_instrumented(profile).__globals__
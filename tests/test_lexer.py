@@ -41,6 +41,28 @@ from filterrules.lexer import Token, lex
         (b"'\\x0a'", ((Token.STRING, b"\n"),)),
         (b"'the st'", ((Token.STRING, b"the st"),)),
         (b"the best", ((Token.NAME, b"thebest"),)),
+        (
+            b"a b in [1]",
+            (
+                (Token.NAME, b"ab"),
+                (Token.KEYWORD, b"in"),
+                (Token.SEPARATOR, b"["),
+                (Token.NAME, b"1"),
+                (Token.SEPARATOR, b"]"),
+            ),
+        ),
+        (b"in", ((Token.NAME, b"in"),)),
+        (
+            b"{10.0.0.0/8}",
+            (
+                (Token.SEPARATOR, b"{"),
+                (Token.NAME, b"10.0.0.0"),
+                (Token.OPERATOR, b"/"),
+                (Token.NAME, b"8"),
+                (Token.SEPARATOR, b"}"),
+            ),
+        ),
+        (b"pin inside", ((Token.NAME, b"pininside"),)),
     ),
 )
 def test_lexer(input: bytes, expected: tuple[tuple[Token, bytes], ...]) -> None:
@@ -1,6 +1,12 @@
 import pytest
 
-from filterrules.lint import lint
+from filterrules.lint import (
+    DEFAULT_FUNCTION_COST,
+    analyze,
+    estimate_cost,
+    lint,
+    required_variables,
+)
 from filterrules.parser import parse
 
 
@@ -43,6 +49,15 @@ from filterrules.parser import parse
             b"1 && 'test'",
             "cannot use and operator on different types: 'int' and 'bytes'",
         ),
+        (b"1 && 1 && 1", None),
+        (
+            b"1 && 1 && 'test'",
+            "cannot use and operator on different types: 'int' and 'bytes'",
+        ),
+        (
+            b"1 || 'test' || 1",
+            "cannot use or operator on different types: 'int' and 'bytes'",
+        ),
         (b"!1", None),
         (b"~1", None),
         (b"~'test'", "cannot use bnot operator on non-integer: 'bytes'"),
@@ -57,6 +72,38 @@ from filterrules.parser import parse
             "expected ('int',)",
         ),
         (b"fn(1) & 1", None),
+        (b"var in [1, 2.5]", None),
+        (b"var in []", None),
+        (b"'x' in ['y', 'z']", None),
+        (
+            b"var in [1, 'x']",
+            "cannot use in operator on different types: 'int' and 'bytes'",
+        ),
+        (
+            b"(var in [1]) + 1",
+            "cannot use add operator on different types: 'bool' and 'int'",
+        ),
+        (b"'10.0.0.1' in {10.0.0.0/8}", None),
+        (b"'x' + 'y' in {}", None),
+        (
+            b"var in {10.0.0.0/8}",
+            "cannot use in operator with networks on non-string: 'int'",
+        ),
+        (b"'x' matches '^x{1,3}$'", None),
+        (b"'x' contains 'y' && 'x' + 'y' starts_with 'x'", None),
+        (
+            b"var ends_with 'x'",
+            "cannot use ends-with operator on different types: 'int' and 'bytes'",
+        ),
+        (
+            b"var matches 'x'",
+            "cannot use matches operator on different types: 'int' and 'bytes'",
+        ),
+        (
+            b"'x' matches 'x*'",
+            "unbounded repeats (*, + and {n,}) are disabled in untrusted mode, "
+            "use {n,m} instead",
+        ),
     ),
 )
 def test_lint(input: bytes, expected: str | None) -> None:
@@ -80,3 +127,51 @@ def test_trusted_lint(input: bytes, expected: str | None) -> None:
 
 def test_invalid_ast_lint() -> None:
     assert lint(object(), {}, {}).startswith("unknown ast node: ")  # type: ignore
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (b"1 + 2", set()),
+        (b"a + a * b", {"a", "b"}),
+        (b"a && (b || !c)", {"a", "b", "c"}),
+        (b"fn(a, -b) == fn()", {"a", "b"}),
+        (b"a in [1]", {"a"}),
+        (b"a in {::1}", {"a"}),
+    ),
+)
+def test_required_variables(input: bytes, expected: set[str]) -> None:
+    assert required_variables(parse(input)) == expected
+
+
+def test_analyze() -> None:
+    expr = parse(b"(a + 1 > b) && geoip(ip) == 'US' && fn(ip)")
+    analysis = analyze(
+        expr,
+        {"a": int, "b": int, "ip": bytes},
+        {"geoip": ((bytes,), bytes), "fn": ((bytes,), bool)},
+        function_costs={"geoip": 100},
+    )
+    assert analysis.error is None
+    assert analysis.type is bool
+    assert analysis.variables == {"a", "b", "ip"}
+    assert analysis.functions == {"geoip", "fn"}
+    assert analysis.nodes == 13
+    assert analysis.depth == 5  # all > block > + > a
+    # 4 variables, 4 operators and the two calls
+    assert analysis.cost == 8 + 100 + DEFAULT_FUNCTION_COST
+
+
+def test_analyze_error() -> None:
+    analysis = analyze(parse(b"a + 'x'"), {"a": int}, {})
+    assert analysis.error == (
+        "cannot use add operator on different types: 'int' and 'bytes'"
+    )
+    assert analysis.type is None
+    assert analysis.variables == {"a"}
+
+
+def test_estimate_cost() -> None:
+    expr = parse(b"(a + 1 > b) && geoip(ip) == 'US' && fn(ip)")
+    assert estimate_cost(expr, {"geoip": 100}) == 8 + 100 + DEFAULT_FUNCTION_COST
+    assert estimate_cost(parse(b"1")) == 0
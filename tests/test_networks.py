@@ -0,0 +1,54 @@
+import ipaddress
+
+import pytest
+
+from filterrules.networks import NetworkSet, address_key
+
+
+def test_network_set() -> None:
+    networks = NetworkSet(["10.0.0.0/8", "192.168.1.0/24", "1.1.1.1", "2001:db8::/32"])
+    for address, expected in (
+        (b"10.0.0.0", True),
+        (b"10.255.255.255", True),
+        (b"11.0.0.0", False),
+        (b"192.168.1.77", True),
+        (b"192.168.2.1", False),
+        (b"1.1.1.1", True),
+        (b"1.1.1.2", False),
+        (b"2001:db8::1", True),
+        (b"2001:db9::", False),
+        ("10.1.2.3", True),
+        (ipaddress.ip_address("2001:db8:ffff::"), True),
+        # ipv4 addresses are never part of ipv6 networks and the other way
+        (b"::a00:1", False),
+        (b"::ffff:10.0.0.1", False),
+        (b"10.0.0", False),
+        (b"not an ip", False),
+        (b"\xff", False),
+        (167772161, False),
+        (None, False),
+    ):
+        assert (address in networks) is expected, address
+
+
+def test_network_set_normalization() -> None:
+    networks = NetworkSet(["10.1.2.3/8", "10.2.0.0/16", "10.0.0.0/8", "::/0", "::1"])
+    # host bits are cleared and networks covered by others are left out
+    assert networks.networks == ("::/0", "10.0.0.0/8")
+    assert networks == NetworkSet(["10.0.0.0/8", "::/0"])
+    assert len(networks.levels) == 2
+
+    everything = NetworkSet(["0.0.0.0/0", "::/0"])
+    assert b"255.255.255.255" in everything
+    assert b"ffff::" in everything
+    assert b"garbage" not in everything
+    assert b"1.2.3.4" not in NetworkSet([])
+
+    with pytest.raises(ValueError):
+        NetworkSet(["10.0.0.0/33"])
+
+
+def test_address_key() -> None:
+    assert address_key(b"0.0.0.1") == 1
+    assert address_key("::1") == (1 << 128) | 1
+    assert address_key(b"1.2.3.4\x00") == -1
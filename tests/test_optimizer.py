@@ -0,0 +1,232 @@
+import pytest
+
+from filterrules import ast
+from filterrules.optimizer import optimize
+from filterrules.parser import parse
+from filterrules.rule import Rule
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (b"(60 * 60 * 24)", ast.Constant(86400)),
+        (b"1 << 16", ast.Constant(65536)),
+        (b"-1", ast.Constant(-1)),
+        (b"'a' + 'b'", ast.Constant(b"ab")),
+        (b"1 < 2", ast.Constant(True)),
+        (
+            b"x + (1 + 2)",
+            ast.BinaryOperation("add", ast.Variable("x"), ast.Constant(3)),
+        ),
+        (b"fn(1 + 1)", ast.FunctionCall("fn", (ast.Constant(2),))),
+        (b"(((x)))", ast.Variable("x")),
+        (
+            b"!!x",
+            ast.UnaryOperation("not", ast.UnaryOperation("not", ast.Variable("x"))),
+        ),
+        (
+            b"!!(x == 1)",
+            ast.BinaryOperation("equals", ast.Variable("x"), ast.Constant(1)),
+        ),
+        (b"!!!x", ast.UnaryOperation("not", ast.Variable("x"))),
+        (b"x && 1", ast.All((ast.Variable("x"), ast.Constant(1)))),
+        (b"1 && x", ast.Variable("x")),
+        (b"0 && x", ast.Constant(0)),
+        (b"x && 0 && y", ast.All((ast.Variable("x"), ast.Constant(0)))),
+        (b"x == 1 || 0 || y", ast.Any((parse(b"x == 1"), ast.Variable("y")))),
+        (b"x || 1 || y", ast.Any((ast.Variable("x"), ast.Constant(1)))),
+        (
+            b"(x && y) && (z && 1 + 1)",
+            ast.All(
+                (
+                    ast.Variable("x"),
+                    ast.Variable("y"),
+                    ast.Variable("z"),
+                    ast.Constant(2),
+                )
+            ),
+        ),
+        # errors that only happen at runtime are left for runtime
+        (b"1 / 0", ast.BinaryOperation("divide", ast.Constant(1), ast.Constant(0))),
+        (b"1 << -1", ast.BinaryOperation("lshift", ast.Constant(1), ast.Constant(-1))),
+        # repeated strings are not allocated at compile time
+        (
+            b"'x' * 3",
+            ast.BinaryOperation("multiply", ast.Constant(b"x"), ast.Constant(3)),
+        ),
+    ),
+)
+def test_optimizer(input: bytes, expected: ast.ExpressionLike) -> None:
+    assert optimize(parse(input)) == expected
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (b"!!x", ast.Variable("x")),
+        (b"x && 1", ast.Variable("x")),
+        (b"x || 0", ast.Variable("x")),
+        (b"1 && 2", ast.Constant(True)),
+        (b"!(!!x && 1)", ast.UnaryOperation("not", ast.Variable("x"))),
+    ),
+)
+def test_boolean_optimizer(input: bytes, expected: ast.ExpressionLike) -> None:
+    assert optimize(parse(input), untrusted=False, boolean=True) == expected
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        # a string followed by a non-string raises in untrusted mode, so
+        # constants are only skipped if they can't hide that
+        (b"x && 1", b"x && 1"),
+        (b"x || 0 || y", b"x || 0 || y"),
+        (b"'x' && 1.5", b"'x' && 1.5"),
+        (b"1 && 'x' && 2 && y", b"'x' && 2 && y"),
+        (b"x == 1 && 1 && 2 && y", b"x == 1 && y"),
+        (b"!!x && y", b"!!x && y"),
+    ),
+)
+def test_untrusted_pruning(input: bytes, expected: bytes) -> None:
+    assert optimize(parse(input), boolean=True) == parse(expected)
+    rule = Rule(parse(input))
+    optimized = Rule(optimize(rule.expr, boolean=True))
+    for x in (b"", b"x", 1):
+        variables = {"x": x, "y": 1}
+        try:
+            expected_result = bool(rule.evaluate(variables, {}))
+        except RuntimeError:
+            with pytest.raises(RuntimeError, match="non-string right-value"):
+                optimized.evaluate(variables, {})
+        else:
+            assert bool(optimized.evaluate(variables, {})) is expected_result
+
+
+def test_untrusted_fold() -> None:
+    with pytest.raises(RuntimeError, match="lshift operation with too big values"):
+        optimize(parse(b"x && 1 << 99999999999999"))
+
+    with pytest.raises(
+        RuntimeError, match=r"pow operation \(\*\*\) is disabled in untrusted mode"
+    ):
+        optimize(parse(b"2 ** 10"))
+
+    assert optimize(parse(b"2 ** 10"), untrusted=False) == ast.Constant(1024)
+
+
+@pytest.mark.parametrize("code", (b"a > 2 ** 20000", b"a > 1 << 20000"))
+def test_fold_huge_integer(code: bytes) -> None:
+    # the result has too many digits for a literal
+    rule = Rule(parse(code), untrusted=False)
+    assert optimize(rule.expr, untrusted=False) == rule.expr
+    assert rule.compile(optimize=True)({"a": 1}, {}) is False
+
+
+@pytest.mark.parametrize(
+    "input",
+    (
+        b"x * (60 * 60 * 24)",
+        b"!!x",
+        b"x && 1",
+        b"x || 0 || fn(x)",
+        b"-(1 + 2) * x",
+        b"1e999 + x",
+    ),
+)
+def test_compile_optimized(input: bytes) -> None:
+    rule = Rule(parse(input))
+    compiled = rule.compile(optimize=True)
+    for x in (0, 2):
+        assert compiled({"x": x}, {"fn": abs}) == rule.evaluate({"x": x}, {"fn": abs})
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (b"geo(ip) == 'US' && asn == 1", b"asn == 1 && geo(ip) == 'US'"),
+        (b"geo(ip) == 'US' || a > b - c || d", b"d || a > b - c || geo(ip) == 'US'"),
+        # impure functions and operators that can raise aren't moved
+        (
+            b"fn(ip) && a / b > 1 && geo(ip) && a",
+            b"fn(ip) && a / b > 1 && a && geo(ip)",
+        ),
+        (b"a + b > 1 && c", b"a + b > 1 && c"),
+        (b"(geo(ip) || a) && b", b"b && (a || geo(ip))"),
+    ),
+)
+def test_reorder(input: bytes, expected: bytes) -> None:
+    expr = optimize(parse(input), boolean=True, reorder=True, pure_functions=("geo",))
+    assert expr == optimize(parse(expected), boolean=True)
+    # only in boolean context, where the returned value doesn't matter
+    assert optimize(parse(input), reorder=True) == optimize(parse(input))
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (b"a == 1 || a == 2 || 3 == a", b"a in [1, 2, 3]"),
+        (b"a == 1 || a == 2", b"a == 1 || a == 2"),
+        (
+            b"a == 'x' || a == 'y' || a in ['z'] || b || a == 1 || a in [2, 3]",
+            b"a in ['x', 'y', 'z'] || b || a in [1, 2, 3]",
+        ),
+        # other operands are never moved, strings and non-strings aren't mixed
+        (
+            b"a == 1 || b == 1 || a == 2 || a == 3",
+            b"a == 1 || b == 1 || a == 2 || a == 3",
+        ),
+        (
+            b"a == 1 || a == 'x' || a == 2 || a == 3",
+            b"a == 1 || a == 'x' || a == 2 || a == 3",
+        ),
+        (b"c && (a == 1 || a == 2 || a == 3)", b"c && a in [1, 2, 3]"),
+        (b"a == 1 && a == 2 && a == 3", b"a == 1 && a == 2 && a == 3"),
+    ),
+)
+def test_membership(input: bytes, expected: bytes) -> None:
+    assert optimize(parse(input)) == parse(expected)
+    assert optimize(parse(b"1 + 1 in [1, 2]")) == ast.Constant(True)
+
+
+def test_reorder_costs() -> None:
+    input = parse(b"slow(a) && fast(a)")
+    cases: tuple[tuple[dict[str, float], dict[bytes, float], bytes], ...] = (
+        ({}, {}, b"slow(a) && fast(a)"),
+        ({"slow": 100}, {}, b"fast(a) && slow(a)"),
+        # fast(a) almost always passes, so slow(a) short circuits more often
+        ({"slow": 20}, {b"fast(a)": 0.95}, b"slow(a) && fast(a)"),
+        ({}, {b"slow(a)": 1.0}, b"fast(a) && slow(a)"),
+    )
+    for function_costs, selectivity, expected in cases:
+        expr = optimize(
+            input,
+            boolean=True,
+            reorder=True,
+            pure_functions=("slow", "fast"),
+            function_costs=function_costs,
+            selectivity={parse(key): value for key, value in selectivity.items()},
+        )
+        assert expr == parse(expected)
+
+
+@pytest.mark.parametrize("untrusted", (True, False))
+@pytest.mark.parametrize("code", (b"b == 1 && a >> c > 0", b"b == 1 && a ** c > 0"))
+def test_reorder_raising_operators(code: bytes, untrusted: bool) -> None:
+    # shifts by negative counts and 0 ** -1 raise, so they stay behind a guard
+    # even though the guard almost always passes
+    expr = parse(code)
+    reordered = optimize(
+        expr,
+        untrusted,
+        boolean=True,
+        reorder=True,
+        selectivity={parse(b"b == 1"): 0.99},
+    )
+    assert reordered == expr
+    variables = {"a": 0, "b": 0, "c": -1}
+    assert Rule(reordered, untrusted=False).evaluate(variables, {}) is False
+
+
+def test_unknown_ast() -> None:
+    with pytest.raises(RuntimeError, match="unknown ast node: .+"):
+        optimize(object())  # type: ignore
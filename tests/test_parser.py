@@ -1,6 +1,7 @@
 import pytest
 
 from filterrules import ast
+from filterrules.networks import NetworkSet
 from filterrules.parser import parse
 
 
@@ -19,28 +20,33 @@ from filterrules.parser import parse
             ),
         ),
         (b"1 << 32", ast.BinaryOperation("lshift", ast.Constant(1), ast.Constant(32))),
-        (
-            b"true && true",
-            ast.BinaryOperation("and", ast.Variable("true"), ast.Variable("true")),
-        ),
+        (b"true && true", ast.All((ast.Variable("true"), ast.Variable("true")))),
+        (b"true || true", ast.Any((ast.Variable("true"), ast.Variable("true")))),
         (b"!true", ast.UnaryOperation("not", ast.Variable("true"))),
         (b"~true", ast.UnaryOperation("bnot", ast.Variable("true"))),
         (b"+true", ast.UnaryOperation("plus", ast.Variable("true"))),
         (b"'string'", ast.Constant(b"string")),
         (
             b"1 && !2",
-            ast.BinaryOperation(
-                "and", ast.Constant(1), ast.UnaryOperation("not", ast.Constant(2))
-            ),
+            ast.All((ast.Constant(1), ast.UnaryOperation("not", ast.Constant(2)))),
         ),
         (
             b"1 && !2 && 3",
-            ast.BinaryOperation(
-                "and",
-                ast.BinaryOperation(
-                    "and", ast.Constant(1), ast.UnaryOperation("not", ast.Constant(2))
-                ),
-                ast.Constant(3),
+            ast.All(
+                (
+                    ast.Constant(1),
+                    ast.UnaryOperation("not", ast.Constant(2)),
+                    ast.Constant(3),
+                )
+            ),
+        ),
+        (
+            b"1 && (2 && 3)",
+            ast.All(
+                (
+                    ast.Constant(1),
+                    ast.Block(ast.All((ast.Constant(2), ast.Constant(3)))),
+                )
             ),
         ),
         (b"a(b)", ast.FunctionCall("a", (ast.Variable("b"),))),
@@ -61,6 +67,139 @@ def test_parser(input: bytes, expected: ast.ExpressionLike) -> None:
     assert tuple(parse(input)) == expected
 
 
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (
+            b"a in [1, -2, 'x', 1.5]",
+            ast.Membership(ast.Variable("a"), frozenset((1, -2, b"x", 1.5))),
+        ),
+        (b"a in []", ast.Membership(ast.Variable("a"), frozenset())),
+        (
+            b"a + 1 in [2] && b",
+            ast.All(
+                (
+                    ast.Membership(
+                        ast.BinaryOperation("add", ast.Variable("a"), ast.Constant(1)),
+                        frozenset((2,)),
+                    ),
+                    ast.Variable("b"),
+                )
+            ),
+        ),
+        (
+            b"a == b in [1]",
+            ast.Membership(
+                ast.BinaryOperation("equals", ast.Variable("a"), ast.Variable("b")),
+                frozenset((1,)),
+            ),
+        ),
+        (
+            b"in == 1",
+            ast.BinaryOperation("equals", ast.Variable("in"), ast.Constant(1)),
+        ),
+    ),
+)
+def test_membership(input: bytes, expected: ast.ExpressionLike) -> None:
+    assert parse(input) == expected
+
+
+@pytest.mark.parametrize(
+    ("input", "message"),
+    (
+        (b"a in 1", r"expected \[ after in, not b'1' \(Token.NAME\)"),
+        (b"a in [b]", "only constants are allowed in a list"),
+        (b"a in [1 'b']", r"unexpected b'b' \(Token.STRING\), expected , or \]"),
+        (b"a in [1", "unexpected end of code"),
+    ),
+)
+def test_invalid_membership(input: bytes, message: str) -> None:
+    with pytest.raises(SyntaxError, match=message):
+        parse(input)
+
+
+def test_networks() -> None:
+    assert parse(b"ip in {10.0.0.0/8, 2001:db8::/32, '1.1.1.1', 10.1.0.0/16}") == (
+        ast.NetworkMembership(
+            ast.Variable("ip"), NetworkSet(["10.0.0.0/8", "2001:db8::/32", "1.1.1.1"])
+        )
+    )
+    assert parse(b"a || ip in {} && b") == ast.Any(
+        (
+            ast.Variable("a"),
+            ast.All(
+                (
+                    ast.NetworkMembership(ast.Variable("ip"), NetworkSet([])),
+                    ast.Variable("b"),
+                )
+            ),
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    ("input", "message"),
+    (
+        (b"ip in {10.0.0.0/33}", r"invalid network: b'10.0.0.0/33'"),
+        (b"ip in {a}", r"invalid network: b'a'"),
+        (b"ip in {(1)}", r"expected network, not b'\(' \(Token.SEPARATOR\)"),
+        (b"ip in {1.1.1.1/}", r"expected prefix length, not b'}'"),
+        (b"ip in {1.1.1.1 2.2.2.2}", "invalid network: b'1.1.1.12.2.2.2'"),
+        (b"ip in {1.1.1.1 + 1}", r"unexpected b'\+' \(Token.OPERATOR\)"),
+    ),
+)
+def test_invalid_networks(input: bytes, message: str) -> None:
+    with pytest.raises(SyntaxError, match=message):
+        parse(input)
+
+
+def test_matches() -> None:
+    assert parse(b"a + 'x' matches '^a' == b") == ast.BinaryOperation(
+        "equals",
+        ast.Matches(
+            ast.BinaryOperation("add", ast.Variable("a"), ast.Constant(b"x")), b"^a"
+        ),
+        ast.Variable("b"),
+    )
+    assert parse(b"matches matches 'x'") == ast.Matches(ast.Variable("matches"), b"x")
+    with pytest.raises(SyntaxError, match=r"expected STRING after matches, not b'x'"):
+        parse(b"a matches x")
+    with pytest.raises(SyntaxError, match="invalid pattern: missing \\)"):
+        parse(b"a matches '('")
+
+
+def test_string_operators() -> None:
+    code = b"ua contains 'bot' || path starts_with '/a' && ext ends_with 'x'"
+    assert parse(code) == (
+        ast.Any(
+            (
+                ast.StringTest("contains", ast.Variable("ua"), b"bot"),
+                ast.All(
+                    (
+                        ast.StringTest("starts-with", ast.Variable("path"), b"/a"),
+                        ast.StringTest("ends-with", ast.Variable("ext"), b"x"),
+                    )
+                ),
+            )
+        )
+    )
+    assert parse(b"a + 'x' contains 'y' == b") == ast.BinaryOperation(
+        "equals",
+        ast.StringTest(
+            "contains",
+            ast.BinaryOperation("add", ast.Variable("a"), ast.Constant(b"x")),
+            b"y",
+        ),
+        ast.Variable("b"),
+    )
+    # the keywords are still names where an operand is expected
+    assert parse(b"contains(a, 'x')") == ast.FunctionCall(
+        "contains", (ast.Variable("a"), ast.Constant(b"x"))
+    )
+    with pytest.raises(SyntaxError, match=r"expected STRING after ends_with, not b'1'"):
+        parse(b"a ends_with 1")
+
+
 def test_invalid_separator() -> None:
     with pytest.raises(
         SyntaxError, match=r"expected closing SEPARATOR, expected b'\)', not b'\]'"
@@ -93,6 +232,125 @@ def test_invalid_code() -> None:
         parse(b"test'abcdef'")
 
 
+def test_unexpected_end() -> None:
+    with pytest.raises(SyntaxError, match="unexpected end of code"):
+        parse(b"1 +")
+
+    with pytest.raises(SyntaxError, match="unexpected end of code"):
+        parse(b"fn(1,")
+
+
+def test_trailing_code() -> None:
+    with pytest.raises(SyntaxError, match=r"unexpected b'\)' \(Token.SEPARATOR\)"):
+        parse(b"1)")
+
+
 def test_recursion() -> None:
     with pytest.raises(SyntaxError, match="too deeply nested code"):
-        parse(b"+".join(b"1" for _ in range(10000)))
+        parse(b"(" * 10000 + b"1" + b")" * 10000)
+
+    with pytest.raises(SyntaxError, match="too deeply nested code"):
+        parse(b"a(" * 10000 + b"1" + b")" * 10000)
+
+    # operators nest the tree without nesting the parser
+    for code in (
+        b"+".join(b"1" for _ in range(10000)),
+        b"-" * 10000 + b"1",
+        b"a" + b" in [1]" * 10000,
+        b"(" * 60 + b"-" * 60 + b"1" + b")" * 60,
+        b"b || b && (" * 40 + b"a" + b")" * 40,
+    ):
+        with pytest.raises(SyntaxError, match="too deeply nested code"):
+            parse(code)
+
+
+def test_long_and_chain() -> None:
+    # a chain of && is a single node however long it is
+    node = parse(b" && ".join(b"a" for _ in range(1000)))
+    assert isinstance(node, ast.All)
+    assert len(node.values) == 1000
+
+
+def test_long_chain() -> None:
+    node = parse(b"+".join(b"a" for _ in range(101)))
+
+    # operator chains are parsed without recursion and associate to the left
+    for _ in range(100):
+        assert isinstance(node, ast.BinaryOperation)
+        assert node.operator == "add"
+        assert node.right == ast.Variable("a")
+        node = node.left
+    assert node == ast.Variable("a")
+    node = parse(b"-" * 100 + b"1")
+    for _ in range(100):
+        assert isinstance(node, ast.UnaryOperation)
+        node = node.value
+    assert node == ast.Constant(1)
+
+    # && and || chains are flattened into a single node of any length
+    node = parse(b"||".join(b"a" for _ in range(20_000)))
+    assert node == ast.Any(tuple(ast.Variable("a") for _ in range(20_000)))
+
+
+@pytest.mark.parametrize(
+    ("input", "expected"),
+    (
+        (
+            b"1 + 2 * 3",
+            ast.BinaryOperation(
+                "add",
+                ast.Constant(1),
+                ast.BinaryOperation("multiply", ast.Constant(2), ast.Constant(3)),
+            ),
+        ),
+        (
+            b"a || b && c || d",
+            ast.Any(
+                (
+                    ast.Variable("a"),
+                    ast.All((ast.Variable("b"), ast.Variable("c"))),
+                    ast.Variable("d"),
+                )
+            ),
+        ),
+        (
+            b"a == 1 && b",
+            ast.All(
+                (
+                    ast.BinaryOperation("equals", ast.Variable("a"), ast.Constant(1)),
+                    ast.Variable("b"),
+                )
+            ),
+        ),
+        (
+            b"a & 1 == 1",
+            ast.BinaryOperation(
+                "equals",
+                ast.BinaryOperation("band", ast.Variable("a"), ast.Constant(1)),
+                ast.Constant(1),
+            ),
+        ),
+        (
+            b"2 ** 3 ** 2",
+            ast.BinaryOperation(
+                "pow",
+                ast.Constant(2),
+                ast.BinaryOperation("pow", ast.Constant(3), ast.Constant(2)),
+            ),
+        ),
+        (
+            b"-a * b",
+            ast.BinaryOperation(
+                "multiply",
+                ast.UnaryOperation("minus", ast.Variable("a")),
+                ast.Variable("b"),
+            ),
+        ),
+        (
+            b"!fn(a)",
+            ast.UnaryOperation("not", ast.FunctionCall("fn", (ast.Variable("a"),))),
+        ),
+    ),
+)
+def test_precedence(input: bytes, expected: ast.ExpressionLike) -> None:
+    assert parse(input) == expected
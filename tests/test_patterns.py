@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from filterrules.patterns import compile_pattern
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    (
+        b"^/api/v[0-9]{1,3}/",
+        b"(?i)curl|wget",
+        b"[a-z]{1,64}\\.(com|net|org)",
+        b"(a|b){1,100}",
+        b"(?:ab|cd){1,5}",
+        "unicode",
+    ),
+)
+def test_untrusted_patterns(pattern: bytes | str) -> None:
+    assert compile_pattern(pattern, True) is compile_pattern(pattern, True)
+
+
+@pytest.mark.parametrize(
+    ("pattern", "message"),
+    (
+        (b"a*b", "unbounded repeats"),
+        (b"a+", "unbounded repeats"),
+        (b"a{2,}", "unbounded repeats"),
+        (b"(a{1,3})*", "unbounded repeats"),
+        (b"(a)\\1", "backreferences, lookarounds and conditionals"),
+        (b"(?<=a)b", "backreferences, lookarounds and conditionals"),
+        (b"(a)?(?(1)b|c)", "backreferences, lookarounds and conditionals"),
+        (b"a{0,256}", "pattern backtracks too much"),
+        (b"(ab|cd){1,20}", "pattern backtracks too much"),
+        (b"(ab|cd){500,501}", "pattern backtracks too much"),
+        (b"a{0,100}b{0,100}", "pattern backtracks too much"),
+        (b"(", "invalid pattern: missing \\), unterminated subpattern"),
+    ),
+)
+def test_invalid_untrusted_patterns(pattern: bytes, message: str) -> None:
+    with pytest.raises(RuntimeError, match=message):
+        compile_pattern(pattern, True)
+    if not message.startswith("invalid pattern"):
+        compile_pattern(pattern, False)
+
+
+def test_linear_time() -> None:
+    # the worst case for an allowed pattern must be fast for the longest
+    # string untrusted mode allows
+    text = b"a" * 65535
+    start = time.perf_counter()
+    for pattern in (b"a{0,255}b", b"[a-z]{1,16}[a-z]{1,16}!", b"(a|b){1,255}c"):
+        assert compile_pattern(pattern, True).search(text) is None
+    assert time.perf_counter() - start < 5
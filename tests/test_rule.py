@@ -1,8 +1,13 @@
+import typing
+
 import pytest
 
+from filterrules import ast
 from filterrules.parser import parse
 from filterrules.rule import Rule
 
+from .helpers import CountingDict
+
 
 def test_simple_rule() -> None:
     rule = Rule(parse(b"true"))
@@ -94,6 +99,216 @@ def test_or() -> None:
     assert compiled({}, {"a": lambda: False, "b": lambda: 1337}) == 1337
 
 
+def test_long_chain() -> None:
+    rule = Rule(parse(b" && ".join(b"a()" for _ in range(10_000))))
+    compiled = rule.compile()
+
+    calls = 0
+
+    def a() -> bool:
+        nonlocal calls
+        calls += 1
+        return calls % 5000 != 0
+
+    assert rule.evaluate({}, {"a": a}) is False
+    assert calls == 5000
+    assert compiled({}, {"a": a}) is False
+    assert calls == 10000
+
+    rule = Rule(parse(b" || ".join(b"a" for _ in range(10_000))))
+    compiled = rule.compile()
+    assert rule.evaluate({"a": 0}, {}) == 0
+    assert compiled({"a": 0}, {}) == 0
+
+
+def test_binary_and_or() -> None:
+    # hand-built trees using the binary form are still supported
+    expr = ast.BinaryOperation(
+        "or",
+        ast.BinaryOperation("and", ast.Variable("a"), ast.Variable("b")),
+        ast.Variable("c"),
+    )
+    rule = Rule(expr)
+    compiled = rule.compile()
+    assert rule.evaluate({"a": 1, "b": 0, "c": 3}, {}) == 3
+    assert compiled({"a": 1, "b": 0, "c": 3}, {}) == 3
+
+
+def test_common_subexpressions() -> None:
+    rule = Rule(parse(b"fn(x) > 1 && fn(x) < 10 && x + x + fn(x + 1)"))
+    calls = 0
+
+    def fn(x: int) -> int:
+        nonlocal calls
+        calls += 1
+        return x
+
+    variables = CountingDict({"x": 5})
+    assert rule.compile()(variables, {"fn": fn}) == 16
+    assert calls == 3
+    assert variables.lookups == {"x": 1}
+
+    variables = CountingDict({"x": 5})
+    compiled = rule.compile(pure_functions=("fn",))
+    assert compiled(variables, {"fn": fn}) == 16
+    assert calls == 5
+    assert variables.lookups == {"x": 1}
+
+    # hoisted values are still only computed when they are reached
+    variables = CountingDict({"x": 0})
+    assert compiled(variables, {"fn": fn}) is False
+    assert calls == 6
+
+
+def test_bound_arguments() -> None:
+    rule = Rule(parse(b"fn(x) > 1 && fn(x) < y"))
+    calls = 0
+
+    def fn(x: int) -> int:
+        nonlocal calls
+        calls += 1
+        return x
+
+    compiled = rule.compile(variables=("x", "y"), functions={"fn": fn})
+    assert compiled(5, 10) is True
+    assert compiled(5, 2) is False
+    assert compiled(0, 10) is False
+    assert calls == 5
+
+    compiled = rule.compile(pure_functions=("fn",), variables=("y", "x", "z"))
+    assert compiled(10, 5, None, {"fn": fn}) is True
+    assert calls == 6
+
+    compiled = rule.compile(functions={"fn": fn})
+    assert compiled({"x": 5, "y": 10}) is True
+
+    with pytest.raises(RuntimeError, match="variable not found: 'y'"):
+        rule.compile(variables=("x",))
+    with pytest.raises(RuntimeError, match="function not found: 'fn'"):
+        rule.compile(functions={})
+
+
+def test_membership() -> None:
+    rule = Rule(parse(b"a in [1, -2, 3.5] || b in ['x', 'y'] || a + 1 in []"))
+    compiled = rule.compile()
+    bound = rule.compile(variables=("a", "b"), functions={})
+    for a, b, expected in (
+        (1, b"", True),
+        (-2, b"", True),
+        (3.5, b"", True),
+        (2, b"x", True),
+        (2, b"z", False),
+    ):
+        variables = {"a": a, "b": b}
+        assert rule.evaluate(variables, {}) is expected
+        assert compiled(variables, {}) is expected
+        assert bound(a, b) is expected
+
+    # same as comparing with every constant using ==
+    rule = Rule(parse(b"a in [1, 'x']"))
+    with pytest.raises(RuntimeError, match="cannot use non-string right-value"):
+        rule.evaluate({"a": b"x"}, {})
+    assert Rule(rule.expr, untrusted=False).evaluate({"a": b"x"}, {}) is True
+    assert Rule(parse(b"a in ['x']")).evaluate({"a": 1}, {}) is False
+
+
+def test_membership_scaling() -> None:
+    # the items are only checked for non-strings the first time the set is used
+    iterations = 0
+
+    class CountingSet(frozenset[ast.AllowedTypes]):
+        def __iter__(self) -> typing.Iterator[ast.AllowedTypes]:
+            nonlocal iterations
+            iterations += 1
+            return super().__iter__()
+
+    values = CountingSet(f"{index}".encode() for index in range(10_000))
+    rule = Rule(ast.Membership(ast.Variable("a"), values))
+    for _ in range(100):
+        assert rule.evaluate({"a": b"9999"}, {}) is True
+        assert rule.evaluate({"a": b"x"}, {}) is False
+    assert iterations == 1
+
+
+def test_networks() -> None:
+    rule = Rule(parse(b"ip in {10.0.0.0/8, 192.168.0.0/16, 2001:db8::/32} || x"))
+    compiled = rule.compile()
+    bound = rule.compile(variables=("ip", "x"), functions={})
+    for ip, expected in (
+        (b"10.1.2.3", True),
+        (b"192.168.255.1", True),
+        (b"192.169.0.1", False),
+        (b"2001:db8::42", True),
+        (b"::1", False),
+        (b"", False),
+    ):
+        variables = {"ip": ip, "x": False}
+        assert rule.evaluate(variables, {}) is expected
+        assert compiled(variables, {}) is expected
+        assert bound(ip, False) is expected
+
+    rule = Rule(parse(b"ip in {}"))
+    assert rule.evaluate({"ip": b"1.1.1.1"}, {}) is False
+    assert rule.compile()({"ip": b"1.1.1.1"}, {}) is False
+
+
+def test_matches() -> None:
+    rule = Rule(parse(b"path matches '^/api/v[0-9]{1,3}/' || ua matches '(?i)curl'"))
+    compiled = rule.compile()
+    for path, ua, expected in (
+        (b"/api/v2/users", b"", True),
+        (b"/api/vx/users", b"", False),
+        (b"/", b"Mozilla curl", True),
+        (b"/", b"wget", False),
+    ):
+        variables = {"path": path, "ua": ua}
+        assert rule.evaluate(variables, {}) is expected
+        assert compiled(variables, {}) is expected
+
+    # the pattern is compiled once and its search method bound to the function
+    assert compiled.__globals__["__p0"].__self__.pattern == b"^/api/v[0-9]{1,3}/"
+    shared = Rule(parse(b"a matches 'x' || b matches 'x'")).compile()
+    assert "__p0" in shared.__globals__ and "__p1" not in shared.__globals__
+
+    # unsafe patterns are only allowed in trusted mode
+    rule = Rule(parse(b"a matches '(x+)+y'"))
+    with pytest.raises(RuntimeError, match="unbounded repeats"):
+        rule.evaluate({"a": b"xx"}, {})
+    with pytest.raises(RuntimeError, match="unbounded repeats"):
+        rule.compile()
+    rule = Rule(rule.expr, untrusted=False)
+    assert rule.evaluate({"a": b"xxy"}, {}) is True
+    assert rule.compile()({"a": b"xx"}, {}) is False
+
+
+def test_string_operators() -> None:
+    code = b"ua contains 'bot' || path starts_with '/a' && path ends_with '/'"
+    rule = Rule(parse(code))
+    compiled = rule.compile()
+    for ua, path, expected in (
+        (b"Googlebot/2.1", b"", True),
+        (b"curl", b"/admin/", True),
+        (b"curl", b"/admin", False),
+        (b"curl", b"/x/", False),
+    ):
+        variables = {"ua": ua, "path": path}
+        assert rule.evaluate(variables, {}) is expected
+        assert compiled(variables, {}) is expected
+
+    rule = Rule(parse(b"ua contains 'x'"))
+    with pytest.raises(TypeError):
+        rule.evaluate({"ua": "x"}, {})
+    with pytest.raises(TypeError):
+        rule.compile()({"ua": "x"}, {})
+
+
+def test_negative_constant() -> None:
+    expr = ast.BinaryOperation("pow", ast.Constant(-2), ast.Constant(2))
+    rule = Rule(expr, untrusted=False)
+    assert rule.evaluate({}, {}) == 4
+    assert rule.compile()({}, {}) == 4
+
+
 def test_unknown_ast() -> None:
     with pytest.raises(RuntimeError, match="unknown ast node: .+"):
         rule = Rule(object)  # type: ignore
@@ -107,11 +322,17 @@ def test_unknown_ast() -> None:
 @pytest.mark.parametrize(
     ("input", "expected"),
     (
-        (b"1 + 2 * 3", 9),
+        (b"1 + 2 * 3", 7),
+        (b"1 + 2 * 3 + 4", 11),
         (b"10 * 2 + 3", 23),
         (b"(10 * 2) + 3", 23),
         (b"10 * 5 - 3", 47),
         (b"10 * (2 + 3)", 50),
+        (b"10 - 2 - 3", 5),
+        (b"1 << 2 + 1", 8),
+        (b"1 + 1 == 2", True),
+        (b"!0 == 1", True),
+        (b"0 || 2 && 3", 3),
     ),
 )
 def test_operator_precedence(input: bytes, expected: int) -> None:
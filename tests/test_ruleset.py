@@ -0,0 +1,130 @@
+import typing
+
+import pytest
+
+from filterrules.parser import parse
+from filterrules.ruleset import RuleId, Ruleset
+
+from .helpers import CountingDict
+
+RULES = (
+    ("country", b"country == 'US' && bot_score > 90"),
+    ("asn", b"asn == 1234 || asn == 5678"),
+    ("both", b"country == 'US' && asn == 1234"),
+    ("score", b"bot_score > 90"),
+    ("function", b"fn(asn) == 1234 && bot_score > 90"),
+)
+
+
+@pytest.mark.parametrize("optimize", (False, True))
+@pytest.mark.parametrize(
+    ("variables", "expected"),
+    (
+        (
+            {"country": b"US", "bot_score": 99, "asn": 1234},
+            ["country", "asn", "both", "score", "function"],
+        ),
+        ({"country": b"US", "bot_score": 10, "asn": 5678}, ["asn"]),
+        ({"country": b"DE", "bot_score": 91, "asn": 1}, ["score"]),
+    ),
+)
+def test_ruleset(
+    variables: dict[str, typing.Any], expected: list[str], optimize: bool
+) -> None:
+    ruleset = Ruleset(tuple((name, parse(code)) for name, code in RULES))
+    functions = {"fn": lambda x: x}
+
+    assert ruleset.evaluate(variables, functions) == expected
+    assert ruleset.compile(optimize)(variables, functions) == expected
+    assert ruleset.compile_first(optimize)(variables, functions) == (
+        expected[0] if expected else None
+    )
+
+
+def test_shared_subexpressions() -> None:
+    ruleset = Ruleset(tuple((name, parse(code)) for name, code in RULES))
+    compiled = ruleset.compile()
+
+    variables = CountingDict({"country": b"US", "bot_score": 99, "asn": 1234})
+    calls = 0
+
+    def fn(x: int) -> int:
+        nonlocal calls
+        calls += 1
+        return x
+
+    compiled(variables, {"fn": fn})
+    assert variables.lookups == {"country": 1, "bot_score": 1, "asn": 1}
+    # functions are not assumed to be pure
+    assert calls == 1
+
+
+def test_pure_functions() -> None:
+    ruleset = Ruleset(
+        (("a", parse(b"geoip(ip) == 'US'")), ("b", parse(b"geoip(ip) == 'DE'")))
+    )
+    calls = 0
+
+    def geoip(ip: bytes) -> bytes:
+        nonlocal calls
+        calls += 1
+        return b"DE"
+
+    assert ruleset.compile()({"ip": b"1.1.1.1"}, {"geoip": geoip}) == ["b"]
+    assert calls == 2
+    compiled = ruleset.compile(pure_functions=("geoip",))
+    assert compiled({"ip": b"1.1.1.1"}, {"geoip": geoip}) == ["b"]
+    assert calls == 3
+
+
+def test_short_circuit() -> None:
+    ruleset = Ruleset((("a", parse(b"x && fn()")), ("b", parse(b"y || fn()"))))
+    compiled = ruleset.compile()
+    assert compiled({"x": 1, "y": 0}, {"fn": lambda: 1}) == ["a", "b"]
+    assert compiled({"x": 0, "y": 1}, {"fn": lambda: 1 / 0}) == ["b"]
+
+
+def test_untrusted() -> None:
+    ruleset = Ruleset((("a", parse(b"1 << x")),))
+    with pytest.raises(RuntimeError, match="lshift operation with too big values"):
+        ruleset.compile()({"x": 1000}, {})
+
+    ruleset = Ruleset((("a", parse(b"2 ** x")),))
+    with pytest.raises(
+        RuntimeError, match=r"pow operation \(\*\*\) is disabled in untrusted mode"
+    ):
+        ruleset.compile()
+
+    ruleset = Ruleset((("a", parse(b"2 ** x")),), untrusted=False)
+    assert ruleset.compile()({"x": 2}, {}) == ["a"]
+
+
+def test_many_rules() -> None:
+    ruleset = Ruleset(
+        tuple((i, parse(b"asn == %d && country == 'US'" % i)) for i in range(10_000))
+    )
+    compiled = ruleset.compile()
+    variables = CountingDict({"asn": 1234, "country": b"US"})
+    assert compiled(variables, {}) == [1234]
+    assert variables.lookups == {"asn": 1, "country": 1}
+
+
+def test_string_scans() -> None:
+    # enough contains tests of ua for an automaton, path has too few
+    rules: list[tuple[RuleId, str]] = [
+        (index, f"ua contains 'bot{index}'") for index in range(40)
+    ]
+    rules += [("path", "path contains '/a' || ua contains 'bot1' && path"), ("x", "0")]
+    ruleset = Ruleset(tuple((name, parse(code.encode())) for name, code in rules))
+    compiled = ruleset.compile()
+    assert "__scan0" in compiled.__globals__ and "__scan1" not in compiled.__globals__
+
+    for ua, path in ((b"bot3 bot33", b""), (b"", b"/a"), (b"bot1", b"/"), (b"", b"")):
+        variables = CountingDict({"ua": ua, "path": path})
+        assert compiled(variables, {}) == ruleset.evaluate(dict(variables), {})
+        assert variables.lookups["ua"] == 1
+
+    assert compiled({"ua": b"bot3 bot33", "path": b""}, {}) == [3, 33]
+    assert ruleset.compile_first()({"ua": b"bot27", "path": b"/b"}, {}) == 2
+    with pytest.raises(TypeError, match="cannot search for bytes in str"):
+        compiled({"ua": "bot1", "path": b""}, {})
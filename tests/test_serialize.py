@@ -0,0 +1,110 @@
+import pytest
+
+from filterrules import ast
+from filterrules.parser import parse
+from filterrules.serialize import _MAGIC, dump, load
+
+
+@pytest.mark.parametrize(
+    "code",
+    (
+        b"bot_score > 90",
+        b"(ip == 'a' || asn == 1234 || asn == 5678) && country != 'US'",
+        b"fn(path, 'x\\x00') + 3 * -x > 1.5",
+        b"~a << 2 ** -b % 3 / c - !d ^ e | f & g >> h",
+        b"fn() || 123456789012345678901234567890 + [a]",
+        b"a in [1, -2, 'x', 1.5] && fn(b) in []",
+        b"ip in {10.0.0.0/8, 1.1.1.1, 2001:db8::/32, ::/0} || ip in {}",
+        b"a matches '^x{1,3}' && fn() matches ''",
+        b"a contains 'x' || fn() starts_with '' || a ends_with 'y'",
+    ),
+)
+def test_roundtrip(code: bytes) -> None:
+    expr = parse(code)
+    assert load(dump(expr)) == expr
+
+
+def test_roundtrip_constants() -> None:
+    values: tuple[ast.AllowedTypes, ...] = (
+        0,
+        -1,
+        127,
+        128,
+        -(2**70),
+        1.5,
+        -0.25,
+        True,
+        False,
+        b"",
+        "ሴ",
+    )
+    for value in values:
+        expr = ast.Constant(value)
+        loaded = load(dump(expr))
+        assert loaded == expr
+        assert isinstance(loaded, ast.Constant)
+        assert type(loaded.value) is type(value)
+
+
+def test_interned_names() -> None:
+    once = dump(parse(b"some_long_variable_name"))
+    twice = dump(parse(b"some_long_variable_name + some_long_variable_name"))
+    assert len(twice) - len(once) < 5
+
+
+def test_unknown_ast() -> None:
+    with pytest.raises(RuntimeError, match="unknown ast node: .+"):
+        dump(object)  # type: ignore
+
+
+def test_invalid_input() -> None:
+    data = dump(parse(b"(a + 'x') == fn(b, 1.5) && c || -1234567"))
+    for index in range(len(data)):
+        with pytest.raises(ValueError):
+            load(data[:index])
+    with pytest.raises(ValueError, match="unexpected data after ast dump"):
+        load(data + b"\x00")
+    # && and || chains have at least two operands
+    for count in (b"\x00", b"\x01\x08\x00\x00"):
+        with pytest.raises(ValueError, match="invalid ast dump"):
+            load(_MAGIC + b"\x00\x0a" + count)
+        with pytest.raises(ValueError, match="invalid ast dump"):
+            load(_MAGIC + b"\x00\x0b" + count)
+
+    header = dump(ast.Constant(0))[:-2]
+    for body, message in (
+        (b"\xff", "unknown ast node tag: 255"),
+        (b"\x09\xff\x00\x00", "unknown operator in ast dump: 255"),
+        (b"\x07\x05", "unknown name in ast dump: 5"),
+        (b"\x0a\xff\xff\xff\x0f\x00", "unexpected end of ast dump"),
+        (b"\x00" + b"\xff" * 4096, "integer in ast dump is too big"),
+        (b"\x0e\x00\x00\x01\x08\x00\x00", "membership test of non-constants"),
+        (b"\x0f\x00\x00\x01\x03abc\x08", "invalid network in ast dump"),
+        (b"\x0f\x00\x00\x01\x04abcd\x21", "invalid network in ast dump"),
+        (b"\x10\x00\x00\x00\x01", "matches with a non-string pattern"),
+        (b"\x11\x03", "unknown operator in ast dump: 3"),
+        (b"\x11\x00\x00\x00\x00\x00\x01", "contains with a non-string needle"),
+    ):
+        with pytest.raises(ValueError, match=message):
+            load(header + body)
+
+
+def test_max_depth() -> None:
+    expr: ast.ExpressionLike = ast.Constant(1)
+    for _ in range(99):
+        expr = ast.Block(expr)
+    data = dump(expr)
+    assert load(data, max_depth=100) == expr
+    with pytest.raises(ValueError, match="ast dump is nested too deep"):
+        load(data, max_depth=99)
+
+    # the default allows anything the parser accepts and nothing deeper
+    code = b"-" * 100 + b"a"
+    assert load(dump(parse(code))) == parse(code)
+    with pytest.raises(ValueError, match="ast dump is nested too deep"):
+        load(dump(ast.UnaryOperation("minus", parse(code))))
+
+    # deeply nested malicious input doesn't raise RecursionError
+    header = dump(ast.Constant(0))[:-2]
+    with pytest.raises(ValueError, match="ast dump is nested too deep"):
+        load(header + b"\x08" * 100_000 + b"\x00\x00")
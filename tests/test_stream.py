@@ -0,0 +1,61 @@
+import typing
+
+import pytest
+
+from filterrules.parser import parse
+from filterrules.rule import Rule
+from filterrules.ruleset import Ruleset
+
+
+def double(value: int) -> int:  # module level so it can be pickled
+    return value * 2
+
+
+RECORDS: list[dict[str, typing.Any]] = [
+    {"a": i, "b": b"x" if i % 3 else b"y"} for i in range(2500)
+]
+
+
+@pytest.mark.parametrize("processes", (None, 2))
+def test_rule_filter(processes: int | None) -> None:
+    rule = Rule(parse(b"double(a) % 7 == 0 && b == 'x'"))
+    matches = list(
+        rule.filter(RECORDS, {"double": double}, processes=processes, chunksize=100)
+    )
+    assert matches == [
+        record for record in RECORDS if record["a"] * 2 % 7 == 0 and record["b"] == b"x"
+    ]
+
+
+@pytest.mark.parametrize("processes", (None, 2))
+def test_ruleset_filter(processes: int | None) -> None:
+    ruleset = Ruleset(
+        (("seven", parse(b"a % 7 == 0")), ("y", parse(b"b == 'y' && a < 10")))
+    )
+    matches = list(ruleset.filter(RECORDS, {}, processes=processes, chunksize=64))
+    expected: list[tuple[dict[str, typing.Any], list[str]]] = []
+    for record in RECORDS:
+        ids = []
+        if record["a"] % 7 == 0:
+            ids.append("seven")
+        if record["b"] == b"y" and record["a"] < 10:
+            ids.append("y")
+        if ids:
+            expected.append((record, ids))
+    assert matches == expected
+
+
+def test_filter_is_lazy() -> None:
+    def records() -> typing.Iterator[dict[str, typing.Any]]:
+        yield {"a": 1}
+        yield {"a": 2}
+        raise AssertionError("consumed too many records")
+
+    matches = Rule(parse(b"a > 1")).filter(records(), {})
+    assert next(matches) == {"a": 2}
+
+
+def test_filter_errors() -> None:
+    rule = Rule(parse(b"fn(a)"))
+    with pytest.raises(KeyError):
+        list(rule.filter(RECORDS, {}, processes=2))
@@ -0,0 +1,33 @@
+import pytest
+
+from filterrules.strings import Automaton
+
+
+def test_automaton() -> None:
+    automaton = Automaton([b"he", b"she", b"his", b"hers", b"", b"rs"])
+    assert automaton.search(b"ushers") == {0, 1, 3, 4, 5}
+    assert automaton.search(b"ahisx") == {2, 4}
+    assert automaton.search(b"") == {4}
+
+    # needles found through failure links of failure links
+    automaton = Automaton(["abcd", "bcx", "cx", "x"])
+    assert automaton.search("abcx") == {1, 2, 3}
+    assert automaton.search("abcabcd") == {0}
+    assert Automaton([]).search(b"abc") == set()
+
+
+def test_same_as_in() -> None:
+    needles = [f"{a}{b}" for a in "abc" for b in "abc"] + ["aaa", "cab", "abca"]
+    automaton = Automaton(needles)
+    for text in ("", "abcabca", "ccc", "aaab", "bcbc", "xyz"):
+        expected = {index for index, needle in enumerate(needles) if needle in text}
+        assert automaton.search(text) == expected, text
+
+
+def test_types() -> None:
+    with pytest.raises(TypeError, match="needles must be all bytes or all str"):
+        Automaton([b"x", "x"])
+    with pytest.raises(TypeError, match="cannot search for bytes in str"):
+        Automaton([b"x"]).search("x")
+    with pytest.raises(TypeError, match="cannot search for str in int"):
+        Automaton(["x"]).search(1)
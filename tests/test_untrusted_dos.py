@@ -2,6 +2,7 @@ import time
 
 import pytest
 
+from filterrules.lexer import lex
 from filterrules.parser import parse
 from filterrules.rule import Rule
 
@@ -49,6 +50,21 @@ def test_untrusted_lshift() -> None:
     assert diff < 1
 
 
+@pytest.mark.parametrize(
+    "input",
+    (
+        b"(1 << (1 << 2)) << 3",
+        b"1 << 2 << 3 << 4",
+        b"(a + b) + (b + (a + b))",
+        b"1 << (2 + 3) + (4 << 2)",
+    ),
+)
+def test_untrusted_nested_guards(input: bytes) -> None:
+    rule = Rule(parse(input))
+    variables = {"a": 1, "b": 2}
+    assert rule.compile()(variables, {}) == rule.evaluate(variables, {})
+
+
 def test_untrusted_string_memory() -> None:
     start = time.monotonic()
 
@@ -73,3 +89,23 @@ def test_untrusted_string_memory() -> None:
 
     diff = time.monotonic() - start
     assert diff < 1
+
+
+def test_untrusted_long_code() -> None:
+    start = time.monotonic()
+
+    # lexing must be linear, a quadratic lexer takes minutes for this
+    code = b"a == 'b' || " * 20_000 + b"c"
+    assert sum(1 for _ in lex(code)) == 120_001
+
+    diff = time.monotonic() - start
+    assert diff < 1
+
+
+def test_untrusted_lshift_chain() -> None:
+    # the guard doesn't nest parentheses, so chains as high as the parser
+    # allows still compile
+    rule = Rule(parse(b"<<".join(b"a" for _ in range(101))))
+    assert rule.compile()({"a": 0}, {}) == 0
+    with pytest.raises(RuntimeError, match="lshift operation with too big values"):
+        rule.compile()({"a": 1 << 7}, {})
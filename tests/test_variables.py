@@ -0,0 +1,68 @@
+import typing
+
+import pytest
+
+from filterrules import LazyVariables, Rule, Ruleset, vm
+from filterrules.parser import parse
+
+
+class Resolvers:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    def resolvers(self) -> dict[str, typing.Callable[[LazyVariables], typing.Any]]:
+        def resolve(key: str, value: typing.Any) -> typing.Any:
+            def resolver(variables: LazyVariables) -> typing.Any:
+                self.calls.append(key)
+                return value(variables) if callable(value) else value
+
+            return resolver
+
+        return {
+            "country": resolve("country", b"US"),
+            "score": resolve("score", 95),
+            "doubled": resolve("doubled", lambda variables: variables["score"] * 2),
+        }
+
+
+def test_evaluate() -> None:
+    rule = Rule(parse(b"score > 90 && country == 'US' && doubled > score"))
+    evaluators: list[typing.Callable[[LazyVariables, typing.Any], typing.Any]] = [
+        rule.evaluate,
+        rule.compile(),
+        rule.compile(optimize=True),
+        vm.compile(rule.expr).evaluate,
+    ]
+    for evaluate in evaluators:
+        resolvers = Resolvers()
+        assert evaluate(LazyVariables({}, resolvers.resolvers()), {}) is True
+        assert sorted(resolvers.calls) == ["country", "doubled", "score"]
+
+
+def test_only_reached_variables_are_resolved() -> None:
+    rule = Rule(parse(b"asn == 1 && country == 'US'"))
+    for evaluate in (rule.evaluate, rule.compile()):
+        resolvers = Resolvers()
+        variables = LazyVariables({"asn": 2}, resolvers.resolvers())
+        assert evaluate(variables, {}) is False
+        assert resolvers.calls == []
+
+
+def test_shared_between_rules() -> None:
+    ruleset = Ruleset(
+        (("a", parse(b"score > 90")), ("b", parse(b"score < 99 && country == 'DE'")))
+    )
+    resolvers = Resolvers()
+    variables = LazyVariables({}, resolvers.resolvers())
+    assert ruleset.evaluate(variables, {}) == ["a"]
+    assert ruleset.compile()(variables, {}) == ["a"]
+    assert resolvers.calls == ["score", "country"]
+
+
+def test_missing() -> None:
+    variables = LazyVariables({"a": 1})
+    assert variables["a"] == 1
+    with pytest.raises(KeyError):
+        Rule(parse(b"b")).evaluate(variables, {})
+    with pytest.raises(KeyError):
+        Rule(parse(b"b")).compile()(variables, {})
@@ -0,0 +1,101 @@
+import itertools
+import typing
+
+import pytest
+
+from filterrules import ast, vm
+from filterrules.parser import parse
+from filterrules.rule import Rule
+
+CODES = (
+    b"a > 1 && b == 'x' || c + 1",
+    b"a && b && c",
+    b"a || b || c",
+    b"-a + ~b * 3 % 2 - !c",
+    b"fn(a, b) + fn()",
+    b"'x' + a",
+    b"a << b >> 1 | c & 2 ^ 3",
+    b"b && 'x' || 1",
+    b"(a && b) == c",
+    b"a / b - c",
+    b"a in [1, 'x'] || b in [0, 2] && c in ['']",
+    b"a matches 'x' || 'yx' matches 'x{1,2}$'",
+    b"a contains 'x' || b starts_with '' && c ends_with 'x'",
+)
+VALUES = (0, 1, 2, -3, b"", b"x", True)
+
+
+def _run(fn: typing.Callable[..., typing.Any], *args: typing.Any) -> typing.Any:
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e), str(e)
+
+
+@pytest.mark.parametrize("code", CODES)
+@pytest.mark.parametrize("untrusted", (True, False))
+def test_same_as_evaluate(code: bytes, untrusted: bool) -> None:
+    expr = parse(code)
+    rule = Rule(expr, untrusted)
+    program = vm.compile(expr, untrusted)
+    functions = {"fn": lambda *args: len(args)}
+    for a, b, c in itertools.product(VALUES, repeat=3):
+        variables = {"a": a, "b": b, "c": c}
+        assert _run(program.evaluate, variables, functions) == _run(
+            rule.evaluate, variables, functions
+        )
+
+
+def test_networks() -> None:
+    expr = parse(b"a in {10.0.0.0/8, ::1} || b in {}")
+    program = vm.compile(expr)
+    for a, expected in ((b"10.0.0.1", True), (b"::1", True), (b"11.0.0.1", False)):
+        assert program.evaluate({"a": a, "b": a}, {}) is expected
+
+
+def test_binary_and_or() -> None:
+    expr = ast.BinaryOperation(
+        "or",
+        ast.BinaryOperation("and", ast.Variable("a"), ast.Variable("b")),
+        ast.Variable("c"),
+    )
+    program = vm.compile(expr)
+    assert program.evaluate({"a": 1, "b": 0, "c": 3}, {}) == 3
+    assert program.evaluate({"a": 1, "b": 2, "c": 3}, {}) == 2
+
+
+def test_short_circuit() -> None:
+    program = vm.compile(parse(b"a || fn()"))
+    assert program.evaluate({"a": 1}, {}) == 1
+    with pytest.raises(KeyError):
+        program.evaluate({"a": 0}, {})
+
+
+def test_untrusted() -> None:
+    program = vm.compile(parse(b"a ** 2"))
+    with pytest.raises(RuntimeError, match=r"pow operation \(\*\*\) is disabled"):
+        program.evaluate({"a": 2}, {})
+    assert vm.compile(parse(b"a ** 2"), untrusted=False).evaluate({"a": 2}, {}) == 4
+
+    program = vm.compile(parse(b"a + a"))
+    with pytest.raises(RuntimeError, match="string longer than allowed"):
+        program.evaluate({"a": b"x" * 40000}, {})
+    program = vm.compile(parse(b"1 << a"))
+    with pytest.raises(RuntimeError, match="lshift operation with too big values"):
+        program.evaluate({"a": 1000}, {})
+    program = vm.compile(parse(b"a * 3"))
+    with pytest.raises(RuntimeError, match="cannot use non-string right-value"):
+        program.evaluate({"a": b"x"}, {})
+
+
+def test_max_steps() -> None:
+    expr = parse(b"a + b > 1 || fn(c)")
+    assert vm.compile(expr).steps == 9
+    assert vm.compile(expr, max_steps=9).steps == 9
+    with pytest.raises(RuntimeError, match="more than the allowed 8"):
+        vm.compile(expr, max_steps=8)
+
+
+def test_unknown_ast() -> None:
+    with pytest.raises(RuntimeError, match="unknown ast node: .+"):
+        vm.compile(object)  # type: ignore